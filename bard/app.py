@@ -2,7 +2,7 @@ import os
 from flask import Flask, request, g
 
 from .constants import ACL_GROUPS
-from .models import init_db
+from .models import database, init_db
 from .providers import providers
 from .util.config import Configuration
 
@@ -65,6 +65,15 @@ def before_request():
     if g.acl not in ACL_GROUPS:
         g.acl = "guest"
 
+    # Each request greenlet uses its own connection, see `connection_scope`
+    database.connect(reuse_if_open=True)
+
+
+def teardown_request(exc):
+    if not database.is_closed():
+        database.close()
+
 
 app.before_first_request(before_first_request)
 app.before_request(before_request)
+app.teardown_request(teardown_request)
@@ -1,18 +1,123 @@
 import os
+import time
+import logging
+import functools
+from contextlib import contextmanager
 
 try:
     import urlparse
 except ImportError:
     from urllib import parse as urlparse
-from peewee import Model, Proxy
+import gevent
+from gevent.lock import RLock
+from gevent.local import local
+from peewee import SENTINEL, Model, OperationalError, Proxy, chunked, _ConnectionState
 from playhouse.sqlite_ext import SqliteExtDatabase, JSONField
 
 
-__all__ = ["JSONField", "BaseModel", "database", "REGISTERED_MODELS", "init_db"]
+__all__ = [
+    "JSONField",
+    "BaseModel",
+    "database",
+    "REGISTERED_MODELS",
+    "init_db",
+    "CooperativeSqliteDatabase",
+    "connection_scope",
+    "with_connection",
+]
 
 
+log = logging.getLogger(__name__)
+
 REGISTERED_MODELS = []
 
+# Pragmas applied to every SQLite connection, which may be overridden through
+#  query parameters on the database URL, e.g. `sqlite://bard.db?mmap_size=0`.
+#  WAL lets readers (web views) proceed while the scheduler is writing, and
+#  only needs a `normal` sync to stay consistent.
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "cache_size": -16000,
+    "mmap_size": 1024 * 1024 * 256,
+    "foreign_keys": 1,
+}
+
+# How long (in milliseconds) a statement is retried while the database is locked
+SQLITE_BUSY_TIMEOUT = 5000
+
+# Bounds for the delay between retries of a statement on a locked database
+SQLITE_BUSY_RETRY_MIN = 0.001
+SQLITE_BUSY_RETRY_MAX = 0.1
+
+
+class _GreenletConnectionState(_ConnectionState, local):
+    pass
+
+
+class CooperativeSqliteDatabase(SqliteExtDatabase):
+    """
+    A SQLite database which waits on locks cooperatively. SQLite's own busy
+    handler sleeps within C, blocking the gevent hub (and with it every other
+    greenlet), so connections are opened without one. Instead, transactions and
+    writes within this process are serialized by a gevent lock, and statements
+    which find the database locked (e.g. by another process) are retried with
+    `gevent.sleep` for up to `busy_timeout` milliseconds.
+
+    Connections are greenlet local (whether or not gevent's monkey patching is
+    applied). Reads outside of a transaction don't take the lock, with WAL they
+    never wait on a writer.
+    """
+
+    def __init__(self, database, busy_timeout=SQLITE_BUSY_TIMEOUT, **kwargs):
+        self.busy_timeout = busy_timeout
+        self._write_lock = RLock()
+        super(CooperativeSqliteDatabase, self).__init__(database, timeout=0, **kwargs)
+        self._state = _GreenletConnectionState()
+
+    def begin(self, lock_type="IMMEDIATE"):
+        # Transactions take the write lock up front, rather than upgrading a read
+        #  lock on their first write, which fails outright if another connection
+        #  wrote in the meantime. It's held until the transaction is popped.
+        if self.transaction_depth() == 0:
+            self._write_lock.acquire()
+
+        try:
+            super(CooperativeSqliteDatabase, self).begin(lock_type)
+        except Exception:
+            if self.transaction_depth() == 0:
+                self._write_lock.release()
+            raise
+
+    def pop_transaction(self):
+        transaction = super(CooperativeSqliteDatabase, self).pop_transaction()
+        if self.transaction_depth() == 0:
+            self._write_lock.release()
+        return transaction
+
+    def execute_sql(self, sql, params=None, commit=SENTINEL):
+        execute = super(CooperativeSqliteDatabase, self).execute_sql
+        if self.in_transaction():
+            return execute(sql, params, commit)
+
+        is_read = sql[:6].lower() == "select"
+        deadline = time.time() + self.busy_timeout / 1000.0
+        delay = SQLITE_BUSY_RETRY_MIN
+        while True:
+            try:
+                if is_read:
+                    return execute(sql, params, commit)
+
+                with self._write_lock:
+                    return execute(sql, params, commit)
+            except OperationalError as e:
+                if "locked" not in str(e) or time.time() >= deadline:
+                    raise
+
+            gevent.sleep(delay)
+            delay = min(delay * 2, SQLITE_BUSY_RETRY_MAX)
+
+
 # Create a database proxy we can setup post-init
 database = Proxy()
 
@@ -29,10 +134,71 @@ class BaseModel(Model):
     @classmethod
     def with_id(cls, oid, *fields):
         try:
-            return cls.select(*fields).get(oid)
+            return cls.select(*fields).where(cls._meta.primary_key == oid).get()
         except cls.DoesNotExist:
             return None
 
+    @classmethod
+    def upsert_many(cls, rows, conflict_target, preserve, batch_size=100):
+        """
+        Inserts the given rows (dicts), updating the `preserve` columns of any
+        existing rows they conflict with on `conflict_target` instead.
+        """
+        for batch in chunked(rows, batch_size):
+            cls.insert_many(batch).on_conflict(
+                conflict_target=conflict_target, preserve=preserve
+            ).execute()
+
+
+@contextmanager
+def connection_scope():
+    """
+    Opens a connection for the duration of the block, unless one is already open.
+    Connections are greenlet local, so every request and task greenlet uses (and
+    closes) its own connection, see `CooperativeSqliteDatabase`.
+    """
+    opened = database.connect(reuse_if_open=True)
+    try:
+        yield
+    finally:
+        if opened:
+            database.close()
+
+
+def with_connection(func):
+    """
+    Decorates a function to run within a `connection_scope`, e.g. the entry
+    point of a greenlet.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with connection_scope():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _sqlite_options(query):
+    """
+    Returns the pragmas and busy timeout for the query string of a sqlite URL.
+    """
+    pragmas = dict(SQLITE_PRAGMAS)
+    busy_timeout = SQLITE_BUSY_TIMEOUT
+
+    for key, value in urlparse.parse_qsl(query):
+        if value.lstrip("-").isdigit():
+            value = int(value)
+
+        if key == "busy_timeout":
+            busy_timeout = int(value)
+        elif key in SQLITE_PRAGMAS:
+            pragmas[key] = value
+        else:
+            raise Exception("Unsupported database option `{}`".format(key))
+
+    return list(pragmas.items()), busy_timeout
+
 
 def init_db(config):
     for file_name in os.listdir(os.path.dirname(os.path.abspath(__file__))):
@@ -46,9 +212,13 @@ def init_db(config):
     obj = urlparse.urlparse(config["database"])
 
     if obj.scheme == "sqlite":
+        pragmas, busy_timeout = _sqlite_options(obj.query)
         database.initialize(
-            SqliteExtDatabase(
-                obj.netloc, pragmas=[("foreign_keys", 1)], check_same_thread=False
+            CooperativeSqliteDatabase(
+                obj.netloc,
+                pragmas=pragmas,
+                busy_timeout=busy_timeout,
+                check_same_thread=False,
             )
         )
     else:
@@ -58,5 +228,19 @@ def init_db(config):
             )
         )
 
-    for model in REGISTERED_MODELS:
-        model.create_table(True)
+    from bard.models.migrations import run_migrations, set_schema_version
+
+    with connection_scope():
+        # Tables created from the current models are already at the latest
+        #  version, existing tables are migrated before any missing tables and
+        #  indexes are created.
+        if not database.get_tables():
+            database.create_tables(REGISTERED_MODELS)
+            set_schema_version()
+            return
+
+        for name in run_migrations():
+            log.info("Applied database migration %s", name)
+
+        for model in REGISTERED_MODELS:
+            model.create_table(True)
@@ -1,22 +1,30 @@
+import logging
 from collections import namedtuple
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from peewee import ForeignKeyField, IntegerField, CharField, DateTimeField
 
-from bard.models import BaseModel, database
+from bard.models import BaseModel
 from bard.models.season import Season
+from bard.models.writer import writer
 from bard.providers import providers
 
+log = logging.getLogger(__name__)
+
 
 EpisodeMetadata = namedtuple(
     "EpisodeMetadata", ("number", "name", "desc", "airdate", "imdb_id")
 )
 
+# Bounds for the exponential backoff between torrent searches that came up empty
+SEARCH_BACKOFF_MIN = timedelta(minutes=15)
+SEARCH_BACKOFF_MAX = timedelta(hours=24)
+
 
 @BaseModel.register
 class Episode(BaseModel):
     class Meta:
-        indexes = ((("season", "number"), True),)
+        indexes = ((("season", "number"), True), (("state", "airdate"), False))
 
     class State:
         NONE = 0
@@ -40,12 +48,33 @@ class Episode(BaseModel):
     # Quality Preference
     quality = CharField(default="", null=True)
 
+    # Torrent search history, used to back off searching for missing episodes
+    last_search = DateTimeField(null=True)
+    search_failures = IntegerField(default=0)
+
     @property
     def aired(self):
         if self.airdate:
             return self.airdate < datetime.utcnow()
         return False
 
+    @property
+    def search_backoff_until(self):
+        """
+        The time before which this episode should not be searched for again, or
+        None if it may be searched right away.
+        """
+        if not self.search_failures or not self.last_search:
+            return None
+
+        backoff = SEARCH_BACKOFF_MIN * (2 ** min(self.search_failures - 1, 16))
+        return self.last_search + min(backoff, SEARCH_BACKOFF_MAX)
+
+    @property
+    def in_search_backoff(self):
+        until = self.search_backoff_until
+        return until is not None and until > datetime.utcnow()
+
     @property
     def series(self):
         return self.season.series if self.season else None
@@ -72,27 +101,82 @@ class Episode(BaseModel):
         self.airdate = metadata.airdate
         self.imdb_id = metadata.imdb_id
 
-    def fetch(self, torrent_metadata):
+    def record_search(self, found):
+        self.last_search = datetime.utcnow()
+        self.search_failures = 0 if found else self.search_failures + 1
+        writer.write(self.save, only=[Episode.last_search, Episode.search_failures])
+
+    def reset_search_backoff(self):
+        self.search_failures = 0
+        writer.write(self.save, only=[Episode.search_failures])
+
+    def fetch(self, torrent_metadata, raw=None):
+        """
+        Fetches the given torrent for this episode, returning the Torrent or None
+        if this episode already has a torrent with the same infohash.
+        """
         from bard.models.torrent import Torrent
 
-        raw = providers.download.get_torrent_contents(torrent_metadata)
+        if raw is None:
+            raw = providers.download.get_torrent_contents(torrent_metadata)
+
+        # The same payload is often listed by multiple trackers, and season packs
+        #  are shared between episodes. Payloads we've already handed to the fetch
+        #  provider are reused rather than downloaded again.
+        existing = Torrent.with_infohash(Torrent.payload_fields(raw).get("infohash"))
+        if existing is not None and existing.state in (
+            Torrent.State.DOWNLOADING,
+            Torrent.State.SEEDING,
+        ):
+            if existing.episode_id == self.id:
+                log.info(
+                    "Skipping torrent %s for episode %s, infohash %s already fetched",
+                    torrent_metadata.title,
+                    self.to_string(),
+                    existing.infohash,
+                )
+                return None
+
+            return writer.write(
+                self._create_fetched_torrent,
+                torrent_metadata,
+                raw,
+                fetch_provider_id=existing.fetch_provider_id,
+                state=existing.state,
+            )
+
+        torrent = writer.write(Torrent.from_metadata, self, torrent_metadata, raw)
+        self.fetch_torrent(torrent)
+        return torrent
+
+    def _create_fetched_torrent(self, torrent_metadata, raw, **kwargs):
+        from bard.models.torrent import Torrent
 
-        # If our upstream fetch provider has an error when downloading this could
-        #  leave unused torrent records sitting around the database despite the
-        #  episode remaining in WANTED. We atomic to ensure the row creation within
-        #  `from_metadata` is reverted if the upstream fetch provider has an error.
-        # TODO: `Torrent.from_metadata` should just return a unsaved Torrent object
-        #  so we can avoid this and related sheneigans inside of
-        #  views/episode.py:episode_fetch_direct
-        with database.atomic():
-            torrent = Torrent.from_metadata(self, torrent_metadata, raw)
-            self.fetch_torrent(torrent)
+        torrent = Torrent.from_metadata(self, torrent_metadata, raw, **kwargs)
+        self._mark_fetched()
+        return torrent
 
     def fetch_torrent(self, torrent):
-        torrent.fetch_provider_id = providers.fetch.download(torrent)
+        """
+        Hands a saved torrent to the fetch provider. The provider is called outside
+        of any transaction (it blocks on HTTP), so the torrent is deleted again if
+        it fails rather than rolled back.
+        """
+        try:
+            fetch_provider_id = providers.fetch.download(torrent)
+        except Exception:
+            writer.write(torrent.delete_instance)
+            raise
+
+        writer.write(self._set_torrent_fetched, torrent, fetch_provider_id)
+
+    def _set_torrent_fetched(self, torrent, fetch_provider_id):
+        torrent.fetch_provider_id = fetch_provider_id
         torrent.state = torrent.State.DOWNLOADING
         torrent.save()
+        self._mark_fetched()
 
+    def _mark_fetched(self):
         # Only mark as FETCHED if we don't have local media assets
         if self.state != self.State.DOWNLOADED:
             self.state = self.State.FETCHED
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from peewee import (
+    CharField,
+    DateTimeField,
+    ForeignKeyField,
+    IntegerField,
+    TextField,
+)
+
+from bard.models import BaseModel, JSONField
+from bard.models.torrent import Torrent
+
+
+@BaseModel.register
+class ProcessJob(BaseModel):
+    """
+    A queued post-processing run for a torrent, see `bard.tasks.processing`.
+    """
+
+    class State:
+        PENDING = 0
+        RUNNING = 1
+        DONE = 2
+        FAILED = 3
+
+        ALL = {PENDING, RUNNING, DONE, FAILED}
+
+    torrent = ForeignKeyField(Torrent, backref="process_jobs", on_delete="CASCADE")
+    state = IntegerField(default=State.PENDING, choices=State.ALL, index=True)
+
+    # The files within the torrent, as reported by the fetch provider
+    files = JSONField(default=list)
+
+    attempts = IntegerField(default=0)
+    error = TextField(null=True)
+
+    next_attempt = DateTimeField(default=datetime.utcnow)
+    started = DateTimeField(null=True)
+    finished = DateTimeField(null=True)
+
+    # The worker running the job, which refreshes the heartbeat while it's alive
+    owner = CharField(null=True)
+    heartbeat = DateTimeField(null=True)
+
+    @property
+    def state_readable(self):
+        for k in dir(self.State):
+            if getattr(self.State, k) == self.state:
+                return k.title()
+        return None
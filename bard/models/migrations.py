@@ -0,0 +1,212 @@
+import logging
+
+from peewee import (
+    BigIntegerField,
+    CharField,
+    DateTimeField,
+    ForeignKeyField,
+    IntegerField,
+    ModelIndex,
+)
+from playhouse.migrate import SqliteMigrator, migrate
+
+from bard.models import JSONField, database
+
+log = logging.getLogger(__name__)
+
+# Schema migrations in the order they're applied. The number of migrations which
+#  were applied to a database is stored in its `user_version` pragma, so this
+#  list may only ever be appended to.
+MIGRATIONS = []
+
+# Torrent payloads loaded into memory at once by `migrate_torrent_payloads`
+PAYLOAD_MIGRATION_BATCH = 100
+
+
+def migration(func):
+    MIGRATIONS.append(func)
+    return func
+
+
+def get_schema_version():
+    return database.pragma("user_version")
+
+
+def set_schema_version(version=None):
+    """
+    Sets the schema version of the database, by default to the latest version
+    (e.g. after all tables were created from the current models).
+    """
+    if version is None:
+        version = len(MIGRATIONS)
+    database.pragma("user_version", version)
+
+
+def run_migrations():
+    """
+    Applies all migrations which haven't been applied to the database yet, each
+    within its own transaction. Returns the names of the applied migrations.
+    """
+    version = get_schema_version()
+    pending = MIGRATIONS[version:]
+    if not pending:
+        return []
+
+    # Altering columns in SQLite rebuilds the table, which would cascade deletes
+    #  to any referencing rows if foreign keys were being enforced. The pragma
+    #  can't be changed within a transaction, so it's disabled up front.
+    foreign_keys = database.pragma("foreign_keys")
+    database.pragma("foreign_keys", 0)
+
+    applied = []
+    try:
+        for number, func in enumerate(pending, version + 1):
+            log.info("Applying migration %s (%s)", number, func.__name__)
+            with database.atomic():
+                func()
+                set_schema_version(number)
+            applied.append(func.__name__)
+    finally:
+        database.pragma("foreign_keys", foreign_keys)
+
+    return applied
+
+
+def _columns(table):
+    return {column.name for column in database.get_columns(table)}
+
+
+def _add_columns(table, columns):
+    """
+    Adds any of the given columns which don't exist yet. Columns must be new
+    field instances, as the migrator binds the fields it's given to the column
+    name. Tables which don't exist yet are created from the models instead.
+    """
+    if not database.table_exists(table):
+        return
+
+    existing = _columns(table)
+    migrator = SqliteMigrator(database)
+    for name, field in columns.items():
+        if name not in existing:
+            migrate(migrator.add_column(table, name, field))
+
+
+def _create_index(model, *fields):
+    # Index names are generated the same way as for the indexes declared on the
+    #  models, so tables created from the current models already have them.
+    if database.table_exists(model._meta.table_name):
+        database.execute(ModelIndex(model, fields, safe=True))
+
+
+@migration
+def add_episode_search_history():
+    """
+    Adds the time of the last torrent search and the number of consecutive
+    searches which found nothing to episodes, which the search backoff is based
+    on. Existing episodes start out without any backoff.
+    """
+    from bard.models.episode import Episode
+
+    _add_columns(
+        Episode._meta.table_name,
+        {
+            "last_search": DateTimeField(null=True),
+            "search_failures": IntegerField(default=0),
+        },
+    )
+
+
+@migration
+def migrate_torrent_payloads():
+    """
+    Moves raw torrent payloads out of the torrent table into the content-addressed
+    `TorrentPayload` table. Returns the number of torrents which were migrated.
+    """
+    from bard.models.payload import TorrentPayload
+    from bard.models.torrent import Torrent
+
+    if "raw" not in _columns(Torrent._meta.table_name):
+        return 0
+
+    TorrentPayload.create_table(True)
+    _add_columns(
+        Torrent._meta.table_name,
+        {
+            "payload_id": ForeignKeyField(
+                TorrentPayload,
+                null=True,
+                on_delete="SET NULL",
+                field=TorrentPayload.key,
+            ),
+            "infohash": CharField(null=True, index=True),
+            "total_size": BigIntegerField(null=True),
+            "files": JSONField(null=True),
+        },
+    )
+
+    # Payloads are read in batches by id rather than through one cursor over
+    #  the whole table, as updating rows a SQLite cursor is still reading is
+    #  undefined.
+    sql = (
+        "SELECT id, raw FROM {} WHERE payload_id IS NULL AND id > ? "
+        "ORDER BY id LIMIT ?".format(Torrent._meta.table_name)
+    )
+
+    count = 0
+    last_id = 0
+    while True:
+        rows = database.execute_sql(sql, (last_id, PAYLOAD_MIGRATION_BATCH)).fetchall()
+        if not rows:
+            break
+
+        for torrent_id, raw in rows:
+            raw = bytes(raw or b"")
+            fields = Torrent.payload_fields(raw)
+            fields["payload"] = TorrentPayload.store(raw, fields.get("infohash"))
+            Torrent.update(**fields).where(Torrent.id == torrent_id).execute()
+            count += 1
+        last_id = rows[-1][0]
+
+    migrator = SqliteMigrator(database)
+    migrate(migrator.drop_column(Torrent._meta.table_name, "raw"))
+
+    log.info("Moved %s torrent payloads into the payload table", count)
+    return count
+
+
+@migration
+def add_hot_path_indexes():
+    """
+    Indexes for the queries run by the scheduler and dashboard: wanted episodes
+    by airdate, active torrents by state, the torrents already fetched for an
+    episode and processed torrents without media.
+    """
+    from bard.models.episode import Episode
+    from bard.models.media import Media
+    from bard.models.torrent import Torrent
+
+    _create_index(Episode, Episode.state, Episode.airdate)
+    _create_index(Torrent, Torrent.state)
+    _create_index(
+        Torrent,
+        Torrent.episode,
+        Torrent.download_provider,
+        Torrent.download_provider_id,
+    )
+    _create_index(Torrent, Torrent.processed, Torrent.episode)
+    _create_index(Media, Media.episode)
+
+
+@migration
+def add_process_job_heartbeat():
+    """
+    Adds the worker running a process job and the last time it reported being
+    alive, which stale jobs are reclaimed by.
+    """
+    from bard.models.job import ProcessJob
+
+    _add_columns(
+        ProcessJob._meta.table_name,
+        {"owner": CharField(null=True), "heartbeat": DateTimeField(null=True)},
+    )
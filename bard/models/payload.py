@@ -0,0 +1,64 @@
+import hashlib
+
+from peewee import BlobField, CharField
+
+from bard.models import BaseModel
+
+
+@BaseModel.register
+class TorrentPayload(BaseModel):
+    """
+    Raw torrent payloads (.torrent files or magnet URIs), kept out of the torrent
+    table so that querying torrents doesn't load every payload. Payloads are
+    content-addressed by their infohash, so each payload is only stored once.
+    """
+
+    key = CharField(primary_key=True)
+    raw = BlobField()
+
+    @staticmethod
+    def key_for(raw, infohash=None):
+        # Payloads we couldn't parse an infohash from are keyed by their contents
+        return infohash or "sha1:" + hashlib.sha1(raw).hexdigest()
+
+    @classmethod
+    def store(cls, raw, infohash=None):
+        """
+        Stores the given payload if we don't already have it, returning its key.
+        """
+        key = cls.key_for(raw, infohash)
+
+        query = cls.insert(key=key, raw=raw)
+        if raw.startswith(b"magnet:"):
+            query = query.on_conflict_ignore()
+        else:
+            # A .torrent carries more than a magnet for the same infohash
+            query = query.on_conflict(conflict_target=[cls.key], update={cls.raw: raw})
+        query.execute()
+        return key
+
+    @classmethod
+    def prune(cls):
+        """
+        Releases the payloads of completed torrents, which have been removed from
+        the fetch provider and are never handed to it again, then deletes payloads
+        which are no longer referenced by any torrent. Returns the number of
+        deleted payloads.
+        """
+        from bard.models.torrent import Torrent
+
+        Torrent.update(payload=None).where(
+            (Torrent.state == Torrent.State.COMPLETED) & Torrent.payload.is_null(False)
+        ).execute()
+
+        return (
+            cls.delete()
+            .where(
+                cls.key.not_in(
+                    Torrent.select(Torrent.payload).where(
+                        Torrent.payload.is_null(False)
+                    )
+                )
+            )
+            .execute()
+        )
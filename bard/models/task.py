@@ -12,7 +12,7 @@ class Task(BaseModel):
 
     @property
     def last_run_seconds(self):
-        return (datetime.utcnow() - self.last_run).seconds
+        return int((datetime.utcnow() - self.last_run).total_seconds())
 
     @classmethod
     def get_next_run(cls, name, cadence):
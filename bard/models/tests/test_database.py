@@ -0,0 +1,78 @@
+import sqlite3
+
+import gevent
+import pytest
+from peewee import OperationalError
+
+from bard.models import CooperativeSqliteDatabase, connection_scope, database
+from bard.models.writer import GroupCommitWriter
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = CooperativeSqliteDatabase(
+        str(tmp_path / "bard.db"), pragmas=[("journal_mode", "wal")], busy_timeout=200
+    )
+    database.initialize(db)
+    db.execute_sql("CREATE TABLE item (value INTEGER)")
+    yield db
+    db.close()
+
+
+def _count(db):
+    return db.execute_sql("SELECT count(*) FROM item").fetchone()[0]
+
+
+def test_writers_wait_cooperatively(db):
+    ticks = []
+
+    def ticker():
+        for _ in range(10):
+            ticks.append(_count(db))
+            gevent.sleep(0.01)
+
+    def slow_writer():
+        with connection_scope(), db.atomic():
+            db.execute_sql("INSERT INTO item VALUES (1)")
+            gevent.sleep(0.05)
+
+    def writer():
+        with connection_scope():
+            db.execute_sql("INSERT INTO item VALUES (2)")
+
+    gevent.joinall(
+        [gevent.spawn(slow_writer), gevent.spawn(writer), gevent.spawn(ticker)],
+        raise_error=True,
+    )
+
+    # Readers kept running (and didn't see the open transaction) while the
+    #  second writer waited for the first
+    assert ticks[0] == 0
+    assert len(ticks) == 10
+    assert _count(db) == 2
+
+
+def test_locked_by_another_process(db, tmp_path):
+    other = sqlite3.connect(str(tmp_path / "bard.db"), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    gevent.spawn_later(0.05, other.execute, "COMMIT")
+    db.execute_sql("INSERT INTO item VALUES (1)")
+    assert _count(db) == 1
+
+    other.execute("BEGIN IMMEDIATE")
+    with pytest.raises(OperationalError):
+        db.execute_sql("INSERT INTO item VALUES (2)")
+    other.execute("ROLLBACK")
+
+
+def test_writes_within_a_transaction_run_inline(db):
+    writer = GroupCommitWriter()
+
+    with gevent.Timeout(1), db.atomic():
+        db.execute_sql("INSERT INTO item VALUES (1)")
+        writer.write(db.execute_sql, "INSERT INTO item VALUES (2)")
+        assert _count(db) == 2
+
+    writer.write(db.execute_sql, "INSERT INTO item VALUES (3)")
+    assert _count(db) == 3
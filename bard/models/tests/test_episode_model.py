@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import pytest
+
+from bard.models import database, init_db
+from bard.models.episode import SEARCH_BACKOFF_MAX, SEARCH_BACKOFF_MIN, Episode
+from bard.models.season import Season
+from bard.models.series import Series
+
+
+@pytest.fixture
+def episode(tmp_path, monkeypatch):
+    # Database URLs are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    init_db({"database": "sqlite://bard.db"})
+    database.connect(reuse_if_open=True)
+
+    series = Series.create(name="Show", provider_ids={})
+    season = Season.create(series=series, number="1", episode_count=1)
+    yield Episode.create(season=season, state=Episode.State.WANTED, number="1")
+    database.close()
+
+
+def test_search_backoff_doubles_per_failure():
+    last_search = datetime(2020, 1, 1)
+    episode = Episode(last_search=last_search)
+
+    assert episode.search_backoff_until is None
+
+    for failures, backoff in [(1, 1), (2, 2), (3, 4), (5, 16)]:
+        episode.search_failures = failures
+        assert (
+            episode.search_backoff_until == last_search + SEARCH_BACKOFF_MIN * backoff
+        )
+
+    # Backoff is capped, however many searches failed
+    for failures in (12, 17, 1000):
+        episode.search_failures = failures
+        assert episode.search_backoff_until == last_search + SEARCH_BACKOFF_MAX
+
+    # Episodes which were never searched for aren't in backoff
+    episode.last_search = None
+    assert episode.search_backoff_until is None
+
+
+def test_in_search_backoff():
+    episode = Episode(search_failures=1, last_search=datetime.utcnow())
+    assert episode.in_search_backoff
+
+    episode.last_search = datetime.utcnow() - SEARCH_BACKOFF_MIN
+    assert not episode.in_search_backoff
+
+    episode.search_failures = 0
+    episode.last_search = datetime.utcnow()
+    assert not episode.in_search_backoff
+
+
+def test_record_search(episode):
+    before = datetime.utcnow()
+    episode.record_search(found=False)
+    episode.record_search(found=False)
+
+    stored = Episode.get_by_id(episode.id)
+    assert stored.search_failures == 2
+    assert stored.last_search >= before
+    assert stored.in_search_backoff
+
+    episode.record_search(found=True)
+    stored = Episode.get_by_id(episode.id)
+    assert stored.search_failures == 0
+    assert not stored.in_search_backoff
+
+
+def test_record_search_only_writes_search_history(episode):
+    stale = Episode.get_by_id(episode.id)
+    Episode.update(state=Episode.State.FETCHED).execute()
+
+    stale.record_search(found=False)
+    stored = Episode.get_by_id(episode.id)
+    assert stored.state == Episode.State.FETCHED
+    assert stored.search_failures == 1
+
+    stale.reset_search_backoff()
+    stored = Episode.get_by_id(episode.id)
+    assert stored.search_failures == 0
+    assert stored.last_search == stale.last_search
+
+
+def test_upsert_many_updates_only_preserved_columns(episode):
+    Episode.update(state=Episode.State.FETCHED, search_failures=2).execute()
+
+    rows = [
+        {"season": episode.season_id, "number": number, "name": name, "state": 1}
+        for number, name in [("1", "Pilot"), ("2", "Second"), ("3", "Third")]
+    ]
+    Episode.upsert_many(
+        rows, [Episode.season, Episode.number], [Episode.name], batch_size=2
+    )
+
+    assert Episode.select().count() == 3
+
+    # Existing rows keep their id and every column which isn't preserved
+    existing = Episode.get_by_id(episode.id)
+    assert existing.name == "Pilot"
+    assert existing.state == Episode.State.FETCHED
+    assert existing.search_failures == 2
+
+    created = Episode.get(Episode.number == "3")
+    assert created.name == "Third"
+    assert created.state == Episode.State.WANTED
@@ -0,0 +1,199 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+from peewee import JOIN
+
+from bard.models import database, init_db, migrations
+from bard.models.episode import Episode
+from bard.models.job import ProcessJob
+from bard.models.media import Media
+from bard.models.migrations import MIGRATIONS, get_schema_version
+from bard.models.season import Season
+from bard.models.series import Series
+from bard.models.torrent import Torrent
+
+# The episode and torrent tables before any migrations
+LEGACY_SCHEMA = """
+CREATE TABLE series (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL);
+CREATE TABLE season (
+    id INTEGER PRIMARY KEY,
+    series_id INTEGER NOT NULL REFERENCES series (id) ON DELETE CASCADE,
+    number VARCHAR(255) NOT NULL,
+    episode_count INTEGER NOT NULL
+);
+CREATE TABLE episode (
+    id INTEGER PRIMARY KEY,
+    season_id INTEGER NOT NULL REFERENCES season (id) ON DELETE CASCADE,
+    state INTEGER NOT NULL,
+    number VARCHAR(255) NOT NULL,
+    name VARCHAR(255),
+    desc VARCHAR(255),
+    airdate DATETIME,
+    imdb_id VARCHAR(255),
+    quality VARCHAR(255)
+);
+CREATE TABLE torrent (
+    id INTEGER PRIMARY KEY,
+    download_provider VARCHAR(255),
+    download_provider_id VARCHAR(255),
+    fetch_provider_id VARCHAR(255),
+    episode_id INTEGER NOT NULL REFERENCES episode (id) ON DELETE CASCADE,
+    state INTEGER NOT NULL,
+    processed INTEGER NOT NULL,
+    title VARCHAR(255) NOT NULL,
+    size VARCHAR(255) NOT NULL,
+    seeders INTEGER NOT NULL,
+    leechers INTEGER NOT NULL,
+    raw BLOB NOT NULL,
+    done_date DATETIME
+);
+CREATE TABLE processjob (
+    id INTEGER PRIMARY KEY,
+    torrent_id INTEGER NOT NULL REFERENCES torrent (id) ON DELETE CASCADE,
+    state INTEGER NOT NULL,
+    files TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    next_attempt DATETIME NOT NULL,
+    started DATETIME,
+    finished DATETIME
+);
+INSERT INTO series VALUES (1, 'Show');
+INSERT INTO season VALUES (1, 1, '1', 1);
+INSERT INTO episode VALUES (1, 1, 1, '1', NULL, NULL, NULL, NULL, '');
+INSERT INTO torrent VALUES (
+    1, 'p', '1', NULL, 1, 0, 0, 'Show.S01E01', '1', 1, 1,
+    CAST('magnet:?xt=urn:btih:0123456789abcdef0123456789abcdef01234567' AS BLOB),
+    NULL
+);
+INSERT INTO processjob VALUES (1, 1, 2, '[]', 1, NULL, '2020-01-01', NULL, NULL);
+"""
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # Database URLs are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+
+    def setup(schema=None):
+        if schema:
+            conn = sqlite3.connect("bard.db")
+            conn.executescript(schema)
+            conn.close()
+
+        init_db({"database": "sqlite://bard.db"})
+        database.connect(reuse_if_open=True)
+
+    yield setup
+    database.close()
+
+
+def _query_plan(query):
+    sql, params = query.sql()
+    return [
+        row[-1] for row in database.execute_sql("EXPLAIN QUERY PLAN " + sql, params)
+    ]
+
+
+def test_new_database_is_at_latest_version(db):
+    db()
+    assert get_schema_version() == len(MIGRATIONS)
+
+
+def test_migrate_legacy_database(db):
+    db(LEGACY_SCHEMA)
+    assert get_schema_version() == len(MIGRATIONS)
+
+    # Rebuilding tables must not cascade deletes into the rows referencing them
+    episode = Episode.get_by_id(1)
+    assert episode.search_failures == 0
+    assert episode.torrents.count() == 1
+
+    torrent = Torrent.get_by_id(1)
+    assert torrent.infohash == "0123456789abcdef0123456789abcdef01234567"
+    assert torrent.raw.startswith(b"magnet:")
+    assert torrent.process_jobs.count() == 1
+
+    job = ProcessJob.get_by_id(1)
+    assert job.owner is None
+    assert job.heartbeat is None
+
+    indexes = {i.name for i in database.get_indexes("torrent")}
+    assert "torrent_state" in indexes
+    assert database.pragma("foreign_keys") == 1
+
+
+def test_migrate_episode_search_history(db):
+    db(LEGACY_SCHEMA)
+
+    columns = {column.name for column in database.get_columns("episode")}
+    assert {"last_search", "search_failures"} <= columns
+
+    episode = Episode.get_by_id(1)
+    assert episode.last_search is None
+    assert episode.search_failures == 0
+    assert episode.search_backoff_until is None
+
+    Episode.update(search_failures=Episode.search_failures + 1).execute()
+    assert Episode.get_by_id(1).search_failures == 1
+
+
+def test_migrate_torrent_payloads_in_batches(db, monkeypatch):
+    monkeypatch.setattr(migrations, "PAYLOAD_MIGRATION_BATCH", 2)
+
+    torrents = "".join(
+        "INSERT INTO torrent VALUES ({0}, 'p', '{0}', NULL, 1, 0, 0, 'Show.S01E01', "
+        "'1', 1, 1, CAST('magnet:?xt=urn:btih:{0:040x}' AS BLOB), NULL);".format(i)
+        for i in range(2, 6)
+    )
+    db(LEGACY_SCHEMA + torrents)
+
+    assert Torrent.select().count() == 5
+    assert Torrent.select().where(Torrent.payload >> None).count() == 0
+    for torrent in Torrent.select():
+        assert torrent.infohash == torrent.raw.decode()[-40:]
+
+
+def test_hot_path_query_plans(db):
+    db()
+
+    wanted = Episode.select().where(
+        (Episode.state == Episode.State.WANTED)
+        & ((~(Episode.airdate >> None)) & (Episode.airdate < datetime.utcnow()))
+    )
+    assert "USING INDEX episode_state_airdate" in _query_plan(wanted)[0]
+
+    active = (
+        Torrent.select()
+        .where(
+            (Torrent.state == Torrent.State.DOWNLOADING)
+            | (Torrent.state == Torrent.State.SEEDING)
+        )
+        .order_by(Torrent.state.asc())
+    )
+    assert "USING INDEX torrent_state" in _query_plan(active)[0]
+
+    fetched = Torrent.select(
+        Torrent.episode, Torrent.download_provider, Torrent.download_provider_id
+    ).where(Torrent.episode << [1, 2, 3])
+    assert (
+        "USING COVERING INDEX "
+        "torrent_episode_id_download_provider_download_provider_id"
+    ) in _query_plan(fetched)[0]
+
+    missing_media = (
+        Series.select(Series)
+        .join(Season)
+        .join(Episode)
+        .switch(Episode)
+        .join(Media, JOIN.LEFT_OUTER)
+        .switch(Episode)
+        .join(Torrent)
+        .where((Torrent.processed >> True) & (Media.id >> None))
+        .group_by(Series)
+    )
+    plan = " ".join(_query_plan(missing_media))
+    assert "USING COVERING INDEX torrent_processed_episode_id" in plan
+    assert "USING COVERING INDEX media_episode_id" in plan
+    assert "SCAN" not in plan
@@ -0,0 +1,52 @@
+import pytest
+
+from bard.models import database, init_db
+from bard.models.episode import Episode
+from bard.models.payload import TorrentPayload
+from bard.models.season import Season
+from bard.models.series import Series
+from bard.models.torrent import Torrent
+
+
+def _magnet(number):
+    return "magnet:?xt=urn:btih:{:040x}".format(number).encode()
+
+
+@pytest.fixture
+def episode(tmp_path, monkeypatch):
+    # Database URLs are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    init_db({"database": "sqlite://bard.db"})
+    database.connect(reuse_if_open=True)
+
+    series = Series.create(name="Show", provider_ids={})
+    season = Season.create(series=series, number="1", episode_count=1)
+    yield Episode.create(season=season, state=Episode.State.WANTED, number="1")
+    database.close()
+
+
+def _torrent(episode, raw, state):
+    return Torrent.create_with_payload(
+        raw,
+        episode=episode,
+        state=state,
+        title="Show.S01E01",
+        size="1",
+        seeders=1,
+        leechers=1,
+    )
+
+
+def test_prune_releases_completed_payloads(episode):
+    completed = _torrent(episode, _magnet(1), Torrent.State.COMPLETED)
+    seeding = _torrent(episode, _magnet(2), Torrent.State.SEEDING)
+
+    # Payloads shared with torrents still in the fetch provider are kept
+    shared = _torrent(episode, _magnet(2), Torrent.State.COMPLETED)
+
+    assert TorrentPayload.prune() == 1
+    assert TorrentPayload.select().count() == 1
+
+    assert Torrent.get_by_id(completed.id).raw is None
+    assert Torrent.get_by_id(shared.id).raw is None
+    assert Torrent.get_by_id(seeding.id).raw == _magnet(2)
@@ -0,0 +1,104 @@
+import gevent
+import pytest
+from peewee import OperationalError
+
+from bard.models import CooperativeSqliteDatabase, database
+from bard.models.writer import GroupCommitWriter
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = CooperativeSqliteDatabase(str(tmp_path / "bard.db"))
+    database.initialize(db)
+    db.execute_sql("CREATE TABLE item (value INTEGER)")
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    writer = GroupCommitWriter()
+    writer.groups = []
+
+    commit = writer._commit
+
+    def _commit(group):
+        writer.groups.append(len(group))
+        return commit(group)
+
+    monkeypatch.setattr(writer, "_commit", _commit)
+    return writer
+
+
+def _insert(db, value):
+    db.execute_sql("INSERT INTO item VALUES (?)", (value,))
+    return value
+
+
+def _values(db):
+    return sorted(row[0] for row in db.execute_sql("SELECT value FROM item"))
+
+
+def test_single_write_is_committed_right_away(db, writer):
+    with gevent.Timeout(1):
+        assert writer.write(_insert, db, 1) == 1
+        assert writer.write(_insert, db, 2) == 2
+
+    assert writer.groups == [1, 1]
+    assert _values(db) == [1, 2]
+
+
+def test_concurrent_writes_share_a_commit(db, writer):
+    greenlets = [gevent.spawn(writer.write, _insert, db, i) for i in range(10)]
+    gevent.joinall(greenlets, raise_error=True)
+
+    assert [i.value for i in greenlets] == list(range(10))
+    assert writer.groups == [10]
+    assert _values(db) == list(range(10))
+
+
+def test_max_batch(db, writer):
+    writer.max_batch = 4
+
+    greenlets = [gevent.spawn(writer.write, _insert, db, i) for i in range(10)]
+    gevent.joinall(greenlets, raise_error=True)
+
+    assert writer.groups == [4, 4, 2]
+    assert _values(db) == list(range(10))
+
+
+def test_failed_write_only_fails_its_submitter(db, writer):
+    def _fail(value):
+        _insert(db, value)
+        raise ValueError(value)
+
+    results = [
+        writer.submit(_insert, db, 1),
+        writer.submit(_fail, 2),
+        writer.submit(_insert, db, 3),
+    ]
+    gevent.joinall([gevent.spawn(i.get) for i in results])
+
+    assert writer.groups == [3]
+    assert results[0].get() == 1
+    assert results[2].get() == 3
+    with pytest.raises(ValueError):
+        results[1].get()
+
+    # The failed write was rolled back to its savepoint
+    assert _values(db) == [1, 3]
+
+
+def test_failed_commit_fails_every_submitter(db, writer, monkeypatch):
+    def commit():
+        raise OperationalError("disk I/O error")
+
+    monkeypatch.setattr(db, "commit", commit)
+
+    results = [writer.submit(_insert, db, i) for i in range(3)]
+    for result in results:
+        with pytest.raises(OperationalError):
+            result.get(timeout=1)
+
+    monkeypatch.undo()
+    assert _values(db) == []
@@ -1,17 +1,20 @@
 from collections import namedtuple
 
 from peewee import (
+    BigIntegerField,
     CharField,
     ForeignKeyField,
     IntegerField,
     BooleanField,
-    BlobField,
     DateTimeField,
 )
 
 from bard.providers import providers
-from bard.models import BaseModel
+from bard.models import BaseModel, JSONField
 from bard.models.episode import Episode
+from bard.models.payload import TorrentPayload
+from bard.util.release import parse_release
+from bard.util.torrentinfo import parse_torrent
 
 
 TorrentMetadata = namedtuple(
@@ -22,6 +25,12 @@ TorrentMetadata = namedtuple(
 
 @BaseModel.register
 class Torrent(BaseModel):
+    class Meta:
+        indexes = (
+            (("episode", "download_provider", "download_provider_id"), False),
+            (("processed", "episode"), False),
+        )
+
     class State:
         NONE = 0
         DOWNLOADING = 1
@@ -35,7 +44,7 @@ class Torrent(BaseModel):
 
     fetch_provider_id = CharField(null=True)
     episode = ForeignKeyField(Episode, backref="torrents", on_delete="CASCADE")
-    state = IntegerField(default=State.NONE, choices=State.ALL)
+    state = IntegerField(default=State.NONE, choices=State.ALL, index=True)
 
     # Whether this torrent was post-processed, does not indicate success
     processed = BooleanField(default=False)
@@ -45,14 +54,24 @@ class Torrent(BaseModel):
     size = CharField()
     seeders = IntegerField()
     leechers = IntegerField()
-    raw = BlobField()
+
+    # The raw payload is only needed when handing the torrent to the fetch
+    #  provider, so it's stored separately and loaded lazily (see `raw`).
+    payload = ForeignKeyField(TorrentPayload, null=True, on_delete="SET NULL")
+
+    # Parsed from the raw payload when the torrent is created, the file list is
+    #  None for magnets (which don't carry one).
+    infohash = CharField(null=True, index=True)
+    total_size = BigIntegerField(null=True)
+    files = JSONField(null=True)
 
     # Date this torrent finished downloading (used for cleanup)
     done_date = DateTimeField(null=True)
 
     @classmethod
-    def from_metadata(cls, episode, metadata, raw):
-        return cls.create(
+    def from_metadata(cls, episode, metadata, raw, **kwargs):
+        return cls.create_with_payload(
+            raw,
             download_provider=metadata.provider,
             download_provider_id=metadata.provider_id,
             episode=episode,
@@ -60,9 +79,52 @@ class Torrent(BaseModel):
             size=metadata.size,
             seeders=metadata.seeders,
             leechers=metadata.leechers,
-            raw=raw,
+            **kwargs
+        )
+
+    @classmethod
+    def create_with_payload(cls, raw, **kwargs):
+        fields = cls.payload_fields(raw)
+        fields["payload"] = TorrentPayload.store(raw, fields.get("infohash"))
+        fields.update(kwargs)
+        return cls.create(**fields)
+
+    @staticmethod
+    def payload_fields(raw):
+        """
+        Returns the fields parsed from a raw torrent payload.
+        """
+        info = parse_torrent(raw)
+        if info is None:
+            return {}
+
+        return {"infohash": info.infohash, "total_size": info.size, "files": info.files}
+
+    @classmethod
+    def with_infohash(cls, infohash):
+        """
+        Returns a previously fetched torrent with the given infohash, if any.
+        """
+        if not infohash:
+            return None
+
+        return (
+            cls.select()
+            .where((cls.infohash == infohash) & (cls.fetch_provider_id.is_null(False)))
+            .order_by(cls.id.desc())
+            .first()
         )
 
+    @property
+    def raw(self):
+        if self.payload_id is None:
+            return None
+        return self.payload.raw
+
+    @property
+    def release(self):
+        return parse_release(self.title)
+
     @property
     def state_readable(self):
         for k in dir(self.State):
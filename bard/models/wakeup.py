@@ -0,0 +1,14 @@
+from peewee import ForeignKeyField
+
+from bard.models import BaseModel
+from bard.models.episode import Episode
+
+
+@BaseModel.register
+class EpisodeWakeup(BaseModel):
+    """
+    A request for the scheduler to rebuild the queued targeted search for an
+    episode, see `bard.tasks.episode.request_episode_wakeups`.
+    """
+
+    episode = ForeignKeyField(Episode, primary_key=True, on_delete="CASCADE")
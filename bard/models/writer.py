@@ -0,0 +1,108 @@
+import time
+import logging
+
+import gevent
+from gevent.event import AsyncResult
+from gevent.queue import Queue, Empty
+
+from bard.models import database, connection_scope
+
+log = logging.getLogger(__name__)
+
+
+class GroupCommitWriter(object):
+    """
+    Serializes background writes through a single writer greenlet, which commits
+    them in groups. A group is made up of the writes queued up while the previous
+    group was being committed (up to `max_batch` of them), so a single write is
+    committed right away while concurrent writers share a commit. If `max_delay`
+    is set, the writer also waits up to that many seconds for a group to fill.
+    Each write runs within its own savepoint, so a failing write doesn't roll
+    back the rest of its group.
+    """
+
+    def __init__(self, max_batch=500, max_delay=0):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = Queue()
+        self._greenlet = None
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues a call to `func` with the given arguments, returning an AsyncResult
+        which is set to its return value (or exception) once its group was
+        committed.
+        """
+        result = AsyncResult()
+
+        # Writes submitted by a write (e.g. through a signal) are already within
+        #  the group being committed, and writes submitted from within a
+        #  transaction already hold the write lock, waiting on either would
+        #  deadlock.
+        if gevent.getcurrent() is self._greenlet or database.in_transaction():
+            try:
+                result.set(func(*args, **kwargs))
+            except Exception as e:
+                result.set_exception(e)
+            return result
+
+        self._queue.put((result, func, args, kwargs))
+        if self._greenlet is None or self._greenlet.dead:
+            self._greenlet = gevent.spawn(self._run)
+        return result
+
+    def write(self, func, *args, **kwargs):
+        """
+        Submits a write and waits for it to be committed, returning its value.
+        """
+        return self.submit(func, *args, **kwargs).get()
+
+    def _next_group(self):
+        group = [self._queue.get()]
+        while len(group) < self.max_batch and not self._queue.empty():
+            group.append(self._queue.get_nowait())
+
+        deadline = time.time() + self.max_delay
+        while len(group) < self.max_batch:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+
+            try:
+                group.append(self._queue.get(timeout=timeout))
+            except Empty:
+                break
+        return group
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            try:
+                with connection_scope():
+                    self._commit(group)
+            except Exception as e:
+                log.exception("Failed to commit a group of %s writes: ", len(group))
+                for result, _, _, _ in group:
+                    if not result.ready():
+                        result.set_exception(e)
+
+    def _commit(self, group):
+        outcomes = []
+        with database.atomic():
+            for result, func, args, kwargs in group:
+                try:
+                    with database.atomic():
+                        outcomes.append((result, func(*args, **kwargs), None))
+                except Exception as e:
+                    outcomes.append((result, None, e))
+
+        # Results are only set once the group was committed
+        for result, value, error in outcomes:
+            if error is not None:
+                result.set_exception(error)
+            else:
+                result.set(value)
+
+
+# Shared by every write made outside of a transaction, e.g. by tasks and views
+writer = GroupCommitWriter()
@@ -1,6 +1,10 @@
 import sys
 import logging
 
+from gevent.lock import BoundedSemaphore
+
+from bard.util.cache import TTLCache
+
 log = logging.getLogger(__name__)
 
 
@@ -27,15 +31,35 @@ class DownloadAggregator(object):
     def __init__(self, config):
         self._config = config
         self._providers = {}
+        self._limits = {}
+        self._concurrency = {}
 
         for source in config.get("sources", []):
             if source["name"] in self._providers:
                 raise Exception("Duplicate provider {}".format(source["name"]))
 
+            # Limits how many requests we will make to a provider at once
+            self._concurrency[source["name"]] = source.get("concurrency", 2)
+            self._limits[source["name"]] = BoundedSemaphore(
+                self._concurrency[source["name"]]
+            )
+
             self._providers[source["name"]] = get_provider_from_config(
                 "download", source
             )
 
+        # Search results are only cached briefly as seeders and new uploads change
+        #  frequently, torrent payloads never change so we keep them for longer.
+        cache_config = config.get("cache", {})
+        self._search_cache = TTLCache(
+            ttl=cache_config.get("search_ttl", 60 * 5),
+            max_entries=cache_config.get("search_max_entries", 1024),
+        )
+        self._contents_cache = TTLCache(
+            ttl=cache_config.get("contents_ttl", 60 * 60),
+            max_size=cache_config.get("contents_max_bytes", 64 * 1024 * 1024),
+        )
+
     def _get(self, provider_name):
         if provider_name not in self._providers:
             raise Exception(
@@ -50,18 +74,106 @@ class DownloadAggregator(object):
     def default(self):
         return self._config["default"]
 
-    def search(self, episode):
-        provider = self._get(
-            episode.series.download_provider or self._config["default"]
+    @property
+    def concurrency(self):
+        """
+        The total number of requests that may be in flight across all providers.
+        """
+        return sum(self._concurrency.values()) or 1
+
+    def _provider_name_for_series(self, series):
+        return series.download_provider or self._config["default"]
+
+    def _search_cache_key(self, episode):
+        return (
+            self._provider_name_for_series(episode.series),
+            episode.series.search_name,
+            episode.season.number,
+            episode.number,
         )
-        return provider.search(episode)
+
+    def search(self, episode, refresh=False):
+        """
+        Searches for torrents of the given episode, returning cached results from
+        a recent search unless `refresh` is passed.
+        """
+        key = self._search_cache_key(episode)
+        if not refresh:
+            results = self._search_cache.get(key)
+            if results is not None:
+                return list(results)
+
+        provider = self._get(key[0])
+        with self._limits[key[0]]:
+            results = provider.search(episode)
+        self._search_cache.set(key, list(results))
+        return results
+
+    def can_search_season(self, series):
+        provider = self._get(self._provider_name_for_series(series))
+        return hasattr(provider, "search_season")
+
+    def search_season(self, season, episodes, refresh=False):
+        """
+        Performs a single search for all of the given episodes within a season,
+        returning a mapping of each episode to its candidate torrents. Season packs
+        are candidates for every episode they contain. Returns None if the download
+        provider does not support batched searches. Like `search`, results of a
+        recent search are reused unless `refresh` is passed.
+        """
+        provider_name = self._provider_name_for_series(season.series)
+        provider = self._get(provider_name)
+        if not hasattr(provider, "search_season"):
+            return None
+
+        key = (provider_name, season.series.search_name, season.number)
+        season_results = None if refresh else self._search_cache.get(key)
+        if season_results is None:
+            with self._limits[provider_name]:
+                season_results = provider.search_season(season.series, season.number)
+            self._search_cache.set(key, season_results)
+
+        results = {episode: [] for episode in episodes}
+        for episode_numbers, metadata in season_results:
+            for episode in episodes:
+                if episode_numbers is None or episode.number in episode_numbers:
+                    results[episode].append(metadata)
+        return results
+
+    def recent(self):
+        """
+        Fetches the recent releases listing from every provider which exposes
+        one, returning a mapping of provider name to the listed TorrentMetadata.
+        Providers whose listing fails are logged and left out.
+        """
+        results = {}
+        for name, provider in self._providers.items():
+            if not hasattr(provider, "recent"):
+                continue
+
+            try:
+                with self._limits[name]:
+                    results[name] = provider.recent()
+            except Exception:
+                log.exception("Failed to fetch recent releases from %s: ", name)
+        return results
 
     def get_torrent(self, torrent_id, provider):
         return self._get(provider).get_torrent(torrent_id)
 
-    def get_torrent_contents(self, metadata):
+    def get_torrent_contents(self, metadata, refresh=False):
+        key = (metadata.provider, metadata.provider_id)
+        if not refresh:
+            contents = self._contents_cache.get(key)
+            if contents is not None:
+                return contents
+
         provider = self._get(metadata.provider)
-        return provider.get_torrent_contents(metadata.provider_id)
+        with self._limits[metadata.provider]:
+            contents = provider.get_torrent_contents(metadata.provider_id)
+        if contents is not None:
+            self._contents_cache.set(key, contents)
+        return contents
 
 
 class Providers(object):
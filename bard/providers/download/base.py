@@ -14,6 +14,12 @@ class BaseDownloadProvider(object):
             )
         )
 
+    # Providers may optionally implement:
+    #  - `search_season(series, season_number)`, returning a list of
+    #     (episode_numbers, TorrentMetadata) tuples for a whole season.
+    #  - `recent()`, returning a list of TorrentMetadata for the most recent
+    #     releases on the provider.
+
 
 class HTTPSessionProviderMixin(object):
     @property
@@ -24,7 +24,7 @@ class HorribleSubsDownloadProvider(object):
             leechers=0,
         )
 
-    def _rls_links_for_episode(self, show_id, episode_id):
+    def _rls_links(self, show_id):
         r = self._session.get(
             API_URL, params={"method": "getshows", "type": "show", "showid": show_id}
         )
@@ -34,30 +34,54 @@ class HorribleSubsDownloadProvider(object):
         infos = q(".rls-info-container")
 
         for info in infos:
-            if info.attrib["id"] != episode_id:
-                continue
-
             links = info.cssselect(".rls-link")
             for link in links:
+                yield info.attrib["id"], link
+
+    def _rls_links_for_episode(self, show_id, episode_id):
+        for link_episode_id, link in self._rls_links(show_id):
+            if link_episode_id == episode_id:
                 yield link
 
-    def search(self, episode):
-        show_name = episode.series.search_name.replace(" ", "-")
-        if episode.season.number != "1":
-            show_name += "-s{}".format(episode.season.number)
+    def _find_show_id(self, series, season_number):
+        show_name = series.search_name.replace(" ", "-")
+        if season_number != "1":
+            show_name += "-s{}".format(season_number)
 
         r = self._session.get(BASE_URL + "shows/{}/".format(show_name))
         if r.status_code == 404:
-            return []
+            return None
         r.raise_for_status()
 
         matches = SHOW_ID_RE.findall(r.content.decode("utf-8"))
         if not matches:
+            return None
+        return matches[0]
+
+    def search(self, episode):
+        show_id = self._find_show_id(episode.series, episode.season.number)
+        if not show_id:
             return []
 
         results = []
-        for link in self._rls_links_for_episode(matches[0], episode.number.zfill(2)):
-            results.append(self._metadata_for_rls_link(matches[0], link))
+        for link in self._rls_links_for_episode(show_id, episode.number.zfill(2)):
+            results.append(self._metadata_for_rls_link(show_id, link))
+
+        return results
+
+    def search_season(self, series, season_number):
+        show_id = self._find_show_id(series, season_number)
+        if not show_id:
+            return []
+
+        results = []
+        for episode_id, link in self._rls_links(show_id):
+            if not episode_id.isdigit():
+                continue
+
+            results.append(
+                ((str(int(episode_id)),), self._metadata_for_rls_link(show_id, link))
+            )
 
         return results
 
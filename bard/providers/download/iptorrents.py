@@ -9,6 +9,7 @@ except ImportError:
 from pyquery import PyQuery
 from .base import BaseDownloadProvider, HTTPSessionProviderMixin
 from bard.models.torrent import TorrentMetadata
+from bard.util.release import parse_release
 
 
 ID_RE = re.compile(r"\?id=(\d+)")
@@ -46,10 +47,37 @@ class IPTorrentsDownloadProvider(BaseDownloadProvider, HTTPSessionProviderMixin)
             episode.season.number.zfill(2),
             episode.number.zfill(2),
         )
+        return self._search(query, exclude=exclude)
 
+    def recent(self):
+        # The torrent listing without a query is the latest uploads, optionally
+        #  restricted to a set of configured categories.
+        params = ";".join(str(i) for i in getattr(self, "recent_categories", []))
+        return self._get_results(params)
+
+    def search_season(self, series, season_number, exclude=None):
+        query = "{} S{}".format(
+            series.search_name.replace("'", ""), season_number.zfill(2)
+        )
+
+        results = []
+        for torrent in self._search(query, exclude=exclude):
+            release = parse_release(torrent.title)
+            if release.season != str(int(season_number)):
+                continue
+
+            results.append((release.episodes, torrent))
+        return results
+
+    def _search(self, query, exclude=None):
+        return self._get_results(
+            urlencode({"q": query}) + ";o=seeders", exclude=exclude
+        )
+
+    def _get_results(self, params, exclude=None):
         r = self.session.get(
             self.URLS["BASE"] + self.URLS["SEARCH"],
-            params=urlencode({"q": query}) + ";o=seeders",
+            params=params,
             headers={"User-Agent": self.ua},
             cookies=self.cookies,
         )
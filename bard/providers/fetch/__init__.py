@@ -1,10 +1,24 @@
 from collections import namedtuple
-from .transmission import TransmissionFetchProvider
+from .transmission import TransmissionFetchProvider, epoch_to_datetime
 
 
 PROVIDERS = {"transmission": TransmissionFetchProvider}
 
-TorrentFetchInfo = namedtuple(
-    "TorrentFetchInfo",
-    ("id", "state", "seconds_seeding", "done_date", "peers", "percent_done", "files"),
-)
+
+class TorrentFetchInfo(
+    namedtuple(
+        "TorrentFetchInfo",
+        ("id", "state", "seconds_seeding", "done_timestamp", "percent_done"),
+    )
+):
+    __slots__ = ()
+
+    @property
+    def done_date(self):
+        """
+        The UTC datetime this torrent finished downloading, converted from the
+        UNIX epoch `done_timestamp` on access. None if it hasn't finished.
+        """
+        if not self.done_timestamp:
+            return None
+        return epoch_to_datetime(self.done_timestamp)
@@ -0,0 +1,265 @@
+import json
+from datetime import datetime
+
+import pytest
+import requests
+
+from bard.providers.fetch import transmission
+from bard.providers.fetch.transmission import (
+    CSRF_HEADER,
+    TransmissionClient,
+    TransmissionFetchProvider,
+)
+
+
+class FakeResponse(object):
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(body or {}).encode()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(response=self)
+
+
+def _success(arguments=None):
+    return lambda request: FakeResponse(
+        body={"result": "success", "tag": request["tag"], "arguments": arguments}
+    )
+
+
+class FakeSession(object):
+    """
+    Replays the given responses for each request in turn. Responses may be
+    exceptions to raise, or functions called with the decoded request.
+    """
+
+    def __init__(self, *responses):
+        self.headers = {}
+        self.responses = list(responses)
+        self.requests = []
+
+    def post(self, url, data, timeout):
+        request = json.loads(data)
+        self.requests.append((request, dict(self.headers), timeout))
+
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        elif callable(response):
+            return response(request)
+        return response
+
+
+class FakeDaemon(FakeSession):
+    """
+    Answers `session-get` and `torrent-get` requests for the given torrents like
+    a Transmission daemon speaking the given RPC version.
+    """
+
+    def __init__(self, torrents, rpc_version=17):
+        super(FakeDaemon, self).__init__()
+        self.torrents = torrents
+        self.rpc_version = rpc_version
+
+    def post(self, url, data, timeout):
+        request = json.loads(data)
+        self.requests.append((request, dict(self.headers), timeout))
+
+        arguments = request["arguments"]
+        if request["method"] == "session-get":
+            return _success({"rpc-version": self.rpc_version})(request)
+
+        assert request["method"] == "torrent-get"
+        torrents = self.torrents
+        if arguments["ids"] == "recently-active":
+            torrents = [i for i in torrents if i.get("recent")]
+        else:
+            torrents = [i for i in torrents if i["hashString"] in arguments["ids"]]
+
+        fields = arguments["fields"]
+        if arguments.get("format") == "table":
+            assert self.rpc_version >= 16
+            rows = [fields] + [[i[field] for field in fields] for i in torrents]
+            return _success({"torrents": rows if torrents else []})(request)
+
+        objects = [{field: i[field] for field in fields} for i in torrents]
+        return _success({"torrents": objects})(request)
+
+    def torrent_gets(self):
+        return [
+            request["arguments"]
+            for request, _, _ in self.requests
+            if request["method"] == "torrent-get"
+        ]
+
+
+class FakeTorrent(object):
+    def __init__(self, fetch_provider_id):
+        self.fetch_provider_id = fetch_provider_id
+
+
+def _torrent(infohash, done_date=0, percent_done=1.0, finished=False, **kwargs):
+    return dict(
+        {
+            "hashString": infohash,
+            "doneDate": done_date,
+            "isFinished": finished,
+            "percentDone": percent_done,
+            "secondsSeeding": 60,
+            "files": [{"name": "{}/{}.mkv".format(infohash, infohash)}],
+        },
+        **kwargs
+    )
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(transmission.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def _client(session, **kwargs):
+    client = TransmissionClient("http://localhost:9091", **kwargs)
+    client.session = session
+    return client
+
+
+def _provider(session):
+    provider = TransmissionFetchProvider({"url": "http://localhost:9091"})
+    provider.client.session = session
+    return provider
+
+
+def test_csrf_session_id_is_refreshed(sleeps):
+    session = FakeSession(
+        FakeResponse(409, headers={CSRF_HEADER: "abc"}), _success({"a": 1})
+    )
+    client = _client(session)
+
+    assert client("session-get") == {"a": 1}
+    assert [headers.get(CSRF_HEADER) for _, headers, _ in session.requests] == [
+        None,
+        "abc",
+    ]
+    assert sleeps == []
+
+
+def test_csrf_session_id_is_only_refreshed_once_per_attempt(sleeps):
+    session = FakeSession(
+        FakeResponse(409, headers={CSRF_HEADER: "abc"}),
+        FakeResponse(409, headers={CSRF_HEADER: "def"}),
+    )
+
+    with pytest.raises(requests.HTTPError):
+        _client(session)("session-get")
+    assert len(session.requests) == 2
+
+
+def test_retries_are_limited(sleeps):
+    session = FakeSession(*[requests.ConnectionError("refused")] * 4)
+
+    with pytest.raises(requests.ConnectionError):
+        _client(session, retries=3, backoff=0.5)("session-get")
+    assert len(session.requests) == 4
+    assert sleeps == [0.5, 1, 2]
+
+
+def test_timeouts_and_server_errors_are_retried(sleeps):
+    session = FakeSession(
+        requests.Timeout("read timed out"), FakeResponse(502), _success({"a": 1})
+    )
+    client = _client(session, timeout=(1, 2))
+
+    assert client("session-get") == {"a": 1}
+    assert [timeout for _, _, timeout in session.requests] == [(1, 2)] * 3
+    assert len(sleeps) == 2
+
+
+def test_client_errors_are_not_retried(sleeps):
+    session = FakeSession(FakeResponse(401))
+
+    with pytest.raises(requests.HTTPError):
+        _client(session)("session-get")
+    assert len(session.requests) == 1
+    assert sleeps == []
+
+
+def test_torrent_info_is_polled_without_files():
+    daemon = FakeDaemon(
+        [_torrent("a", done_date=1500000000), _torrent("b", percent_done=0.5)]
+    )
+    provider = _provider(daemon)
+
+    info = {
+        i.id: i for i in provider.get_torrent_info([FakeTorrent("a"), FakeTorrent("b")])
+    }
+    assert "files" not in daemon.torrent_gets()[0]["fields"]
+
+    # Done dates are only converted once they're read
+    assert info["a"].done_timestamp == 1500000000
+    assert info["a"].done_date.replace(tzinfo=None) == datetime(2017, 7, 14, 2, 40)
+    assert info["b"].done_date is None
+
+    # File lists are only requested when asked for
+    assert provider.get_torrent_files([FakeTorrent("a")]) == {"a": ["a/a.mkv"]}
+    assert daemon.torrent_gets()[-1]["fields"] == provider.FILE_FIELDS
+
+
+def _infos(provider, torrents, **kwargs):
+    return sorted(provider.get_torrent_info(torrents, **kwargs))
+
+
+def test_table_format_matches_object_format():
+    torrents = [
+        _torrent("a", done_date=1500000000),
+        _torrent("b", percent_done=0.25),
+        _torrent("c", finished=True),
+    ]
+    table = FakeDaemon(torrents, rpc_version=17)
+    objects = FakeDaemon(torrents, rpc_version=15)
+
+    tracked = [FakeTorrent(i["hashString"]) for i in torrents]
+    assert _infos(_provider(table), tracked) == _infos(_provider(objects), tracked)
+    files = _provider(table).get_torrent_files(tracked)
+    assert files == _provider(objects).get_torrent_files(tracked)
+
+    # Daemons before RPC version 16 don't understand the table format
+    assert all(i.get("format") == "table" for i in table.torrent_gets())
+    assert all("format" not in i for i in objects.torrent_gets())
+
+
+def test_table_format_without_torrents():
+    provider = _provider(FakeDaemon([]))
+    assert _infos(provider, [FakeTorrent("a")]) == []
+    assert _infos(provider, [FakeTorrent("a")], recently_active=True) == []
+
+
+def test_recently_active_skips_untracked_torrents():
+    daemon = FakeDaemon(
+        [_torrent("a", recent=True), _torrent("b"), _torrent("c", recent=True)]
+    )
+
+    infos = _infos(_provider(daemon), [FakeTorrent("a")], recently_active=True)
+    assert [i.id for i in infos] == ["a"]
+    assert daemon.torrent_gets()[0]["ids"] == "recently-active"
+
+
+def test_large_polls_are_chunked(monkeypatch):
+    monkeypatch.setattr(TransmissionFetchProvider, "TORRENT_GET_CHUNK_SIZE", 2)
+    torrents = [_torrent(str(i)) for i in range(5)]
+    daemon = FakeDaemon(torrents)
+
+    infos = _infos(_provider(daemon), [FakeTorrent(i["hashString"]) for i in torrents])
+    assert [i.id for i in infos] == ["0", "1", "2", "3", "4"]
+    assert [i["ids"] for i in daemon.torrent_gets()] == [
+        ["0", "1"],
+        ["2", "3"],
+        ["4"],
+    ]
+
+    # Each chunk is a separate RPC, with a tag of its own
+    tags = [request["tag"] for request, _, _ in daemon.requests]
+    assert len(set(tags)) == len(tags)
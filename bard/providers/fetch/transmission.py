@@ -1,9 +1,17 @@
 import json
+import time
+import logging
 import requests
 import calendar
 import datetime
+import itertools
 import base64
 
+from gevent.pool import Pool
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
 
 class UTC(datetime.tzinfo):
     def utcoffset(self, dt):
@@ -20,23 +28,6 @@ CSRF_ERROR_CODE = 409
 UNAUTHORIZED_ERROR_CODE = 401
 CSRF_HEADER = "X-Transmission-Session-Id"
 
-# UNIX epochs to be turned into UTC datetimes
-TIMESTAMP_KEYS = frozenset(
-    [
-        "activityDate",
-        "addedDate",
-        "dateCreated",
-        "doneDate",
-        "startDate",
-        "lastAnnounceStartTime",
-        "lastAnnounceTime",
-        "lastScrapeStartTime",
-        "lastScrapeTime",
-        "nextAnnounceTime",
-        "nextScrapeTime",
-    ]
-)
-
 
 def epoch_to_datetime(value):
     return datetime.datetime.fromtimestamp(value, UTC())
@@ -50,20 +41,6 @@ def datetime_to_epoch(value):
         return calendar.timegm(value.utctimetuple())
 
 
-class TransmissionJSONDecoder(json.JSONDecoder):
-    def __init__(self, **kwargs):
-        return super(TransmissionJSONDecoder, self).__init__(
-            object_hook=self.object_hook, **kwargs
-        )
-
-    def object_hook(self, obj):
-        for key, value in obj.items():
-            if key in TIMESTAMP_KEYS:
-                value = epoch_to_datetime(value)
-            obj[key] = value
-        return obj
-
-
 class TransmissionJSONEncoder(json.JSONEncoder):
     def default(self, value):
         # datetime is a subclass of date, so this'll catch both
@@ -74,43 +51,103 @@ class TransmissionJSONEncoder(json.JSONEncoder):
 
 
 class TransmissionClient(object):
-    def __init__(self, url, path="/transmission/rpc", username=None, password=None):
+    def __init__(
+        self,
+        url,
+        path="/transmission/rpc",
+        username=None,
+        password=None,
+        timeout=(5, 30),
+        retries=3,
+        backoff=0.5,
+        concurrency=4,
+    ):
         """
         Initialize the Transmission client.
         The default host, port and path are all set to Transmission's
         default.
         """
         self.url = url + path
-        self.headers = {}
-        self.tag = 0
-
-        self.auth = None
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self._tags = itertools.count()
+
+        # A single session keeps connections (and our CSRF session id) alive
+        #  between requests, instead of reconnecting for each RPC.
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.mount(
+            self.url, HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        )
         if username or password:
-            self.auth = (username, password)
+            self.session.auth = (username, password)
 
     def __call__(self, method, **kwargs):
         """
         Send request to Transmission's RPC interface.
         """
-        response = self._make_request(method, **kwargs)
-        return self._deserialize_response(response)
+        tag = next(self._tags)
+        response = self._make_request(method, tag, **kwargs)
+        return self._deserialize_response(response, tag)
 
-    def _make_request(self, method, **kwargs):
+    def batch(self, calls):
+        """
+        Sends several independent requests concurrently over the session's
+        connection pool, returning their results in order. Each call is a tuple
+        of (method, kwargs).
+        """
+        pool = Pool(self.concurrency)
+        return pool.map(lambda call: self(call[0], **call[1]), calls)
+
+    def _make_request(self, method, tag, **kwargs):
         body = json.dumps(
-            self._format_request_body(method, **kwargs), cls=TransmissionJSONEncoder
+            self._format_request_body(method, tag, **kwargs),
+            cls=TransmissionJSONEncoder,
         )
-        r = requests.post(
-            self.url, data=body, headers=self.headers, auth=self.auth, verify=False
-        )
-
-        if r.status_code == CSRF_ERROR_CODE:
-            self.headers[CSRF_HEADER] = r.headers[CSRF_HEADER]
-            return self._make_request(method, **kwargs)
-
-        r.raise_for_status()
-        return r
 
-    def _format_request_body(self, method, **kwargs):
+        attempt = 0
+        refreshed_session_id = False
+        while True:
+            try:
+                r = self.session.post(self.url, data=body, timeout=self.timeout)
+
+                # Transmission rejects requests without its current session id,
+                #  handing us the id to retry with.
+                if r.status_code == CSRF_ERROR_CODE and not refreshed_session_id:
+                    self.session.headers[CSRF_HEADER] = r.headers[CSRF_HEADER]
+                    refreshed_session_id = True
+                    continue
+
+                r.raise_for_status()
+                return r
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.HTTPError,
+            ) as e:
+                # Only connection problems and server errors are worth retrying
+                if isinstance(e, requests.HTTPError) and e.response.status_code < 500:
+                    raise
+                if attempt >= self.retries:
+                    raise
+
+                delay = self.backoff * (2**attempt)
+                log.warning(
+                    "Transmission request %s failed (%s), retrying in %ss",
+                    method,
+                    e,
+                    delay,
+                )
+
+            time.sleep(delay)
+            attempt += 1
+
+            # Transmission may have restarted, handing out a new session id
+            refreshed_session_id = False
+
+    def _format_request_body(self, method, tag, **kwargs):
         """
         Create a request object to be serialized and sent to Transmission.
         """
@@ -119,24 +156,22 @@ class TransmissionClient(object):
         # underscores with them here.
         for k, v in kwargs.items():
             fixed[k.replace("_", "-")] = v
-        return {"method": method, "tag": self.tag, "arguments": fixed}
+        return {"method": method, "tag": tag, "arguments": fixed}
 
-    def _deserialize_response(self, response):
+    def _deserialize_response(self, response, tag):
         """
         Return the response generated by the request object, raising
         BadRequest if there were any problems.
         """
-        doc = json.loads(response.text, cls=TransmissionJSONDecoder)
+        # Responses are decoded as plain JSON, timestamps are only converted by
+        #  the fields which are read (e.g. `TorrentFetchInfo.done_date`).
+        doc = json.loads(response.content)
 
         if doc["result"] != "success":
             raise Exception("Request failed: `%s`" % doc["result"])
 
-        if doc["tag"] != self.tag:
-            raise Exception(
-                "Tag mismatch: (got %s expected %s)" % (doc["tag"], self.tag)
-            )
-        else:
-            self.tag += 1
+        if doc["tag"] != tag:
+            raise Exception("Tag mismatch: (got %s expected %s)" % (doc["tag"], tag))
 
         if "arguments" in doc:
             return doc["arguments"] or None
@@ -144,26 +179,24 @@ class TransmissionClient(object):
 
 
 class TransmissionFetchProvider(object):
+    # Requested for every tracked torrent on each poll, so this is limited to the
+    #  cheap scalar fields we need to build a TorrentFetchInfo.
     STATUS_FIELDS = [
         "hashString",
-        "activityDate",
-        "addedDate",
-        "downloadDir",
         "doneDate",
-        "error",
-        "errorString",
-        "eta",
-        "files",
-        "fileStats",
         "isFinished",
-        "isStalled",
-        "peers",
         "percentDone",
-        "pieces",
-        "secondsDownloading",
         "secondsSeeding",
     ]
 
+    # File lists can be large, so they're only requested once a torrent completes
+    FILE_FIELDS = ["hashString", "files"]
+
+    # The table response format was added in RPC version 16 (Transmission 3.00)
+    TABLE_FORMAT_RPC_VERSION = 16
+
+    TORRENT_GET_CHUNK_SIZE = 250
+
     def __init__(self, opts):
         self.start_paused = opts.pop("start_paused", False)
         self.peer_limit = opts.pop("peer_limit", 500)
@@ -172,7 +205,17 @@ class TransmissionFetchProvider(object):
             opts.get("path", "/transmission/rpc"),
             opts.get("username"),
             opts.get("password"),
+            timeout=(opts.get("connect_timeout", 5), opts.get("read_timeout", 30)),
+            retries=opts.get("retries", 3),
+            concurrency=opts.get("concurrency", 4),
         )
+        self._rpc_version = None
+
+    @property
+    def rpc_version(self):
+        if self._rpc_version is None:
+            self._rpc_version = self.client("session-get").get("rpc-version", 0)
+        return self._rpc_version
 
     def download(self, torrent):
         params = {"paused": self.start_paused, "peer_limit": self.peer_limit}
@@ -190,9 +233,15 @@ class TransmissionFetchProvider(object):
             raise Exception("Failed to add torrent to transmission: {}".format(r))
 
     def remove(self, torrent):
-        self.client(
-            "torrent-remove", ids=[torrent.fetch_provider_id], delete_local_data=True
-        )
+        self.remove_many([torrent])
+
+    def remove_many(self, torrents):
+        """
+        Removes the given torrents and their data with a single request.
+        """
+        ids = sorted({i.fetch_provider_id for i in torrents})
+        if ids:
+            self.client("torrent-remove", ids=ids, delete_local_data=True)
 
     @staticmethod
     def _get_state_from_info(info):
@@ -205,22 +254,77 @@ class TransmissionFetchProvider(object):
         else:
             return Torrent.State.SEEDING
 
-    def get_torrent_info(self, torrents):
+    def _torrent_get(self, ids, fields):
+        """
+        Returns a dict of the requested fields for each of the given torrent ids,
+        using the compact table response format if the daemon supports it. Large
+        lists of ids are split up into requests which are sent concurrently.
+        """
+        table = self.rpc_version >= self.TABLE_FORMAT_RPC_VERSION
+
+        params = {"fields": fields}
+        if table:
+            params["format"] = "table"
+
+        if isinstance(ids, list) and len(ids) > self.TORRENT_GET_CHUNK_SIZE:
+            size = self.TORRENT_GET_CHUNK_SIZE
+            responses = self.client.batch(
+                [
+                    ("torrent-get", dict(params, ids=ids[idx : idx + size]))
+                    for idx in range(0, len(ids), size)
+                ]
+            )
+        else:
+            responses = [self.client("torrent-get", ids=ids, **params)]
+
+        results = []
+        for response in responses:
+            results.extend(self._parse_torrents(response["torrents"], table))
+        return results
+
+    @staticmethod
+    def _parse_torrents(data, table):
+        if not table:
+            return data
+
+        # The first row of a table response contains the field names
+        if not data:
+            return []
+        keys = data[0]
+        return [dict(zip(keys, row)) for row in data[1:]]
+
+    def get_torrent_info(self, torrents, recently_active=False):
+        """
+        Yields a TorrentFetchInfo for each of the given torrents. If
+        `recently_active` is set only torrents which Transmission has seen
+        activity on in the last minute are returned.
+        """
         from bard.providers.fetch import TorrentFetchInfo
 
-        data = self.client(
-            "torrent-get",
-            ids=[i.fetch_provider_id for i in torrents],
-            fields=self.STATUS_FIELDS,
-        )["torrents"]
+        ids = [i.fetch_provider_id for i in torrents]
+
+        tracked = None
+        if recently_active:
+            tracked = set(ids)
+            ids = "recently-active"
+
+        for item in self._torrent_get(ids, self.STATUS_FIELDS):
+            if tracked is not None and item["hashString"] not in tracked:
+                continue
 
-        for item in data:
             yield TorrentFetchInfo(
                 id=item["hashString"],
                 state=self._get_state_from_info(item),
                 seconds_seeding=item["secondsSeeding"],
-                done_date=item["doneDate"],
-                peers=item["peers"],
+                done_timestamp=item["doneDate"],
                 percent_done=item["percentDone"],
-                files=[i["name"] for i in item["files"]],
             )
+
+    def get_torrent_files(self, torrents):
+        """
+        Returns a dict of torrent id to the list of file names in that torrent.
+        """
+        data = self._torrent_get(
+            [i.fetch_provider_id for i in torrents], self.FILE_FIELDS
+        )
+        return {item["hashString"]: [i["name"] for i in item["files"]] for item in data}
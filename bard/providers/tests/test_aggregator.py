@@ -0,0 +1,112 @@
+import gevent
+import pytest
+
+from bard import providers as providers_module
+from bard.providers import DownloadAggregator
+
+
+class FakeSeries(object):
+    def __init__(self, name):
+        self.name = name
+        self.search_name = name
+        self.download_provider = None
+
+
+class FakeSeason(object):
+    def __init__(self, series, number):
+        self.series = series
+        self.number = number
+
+
+class FakeEpisode(object):
+    def __init__(self, season, number):
+        self.season = season
+        self.series = season.series
+        self.number = number
+
+
+class FakeProvider(object):
+    def __init__(self, opts):
+        self.opts = opts
+        self.searches = []
+
+    def search(self, episode):
+        self.searches.append(episode.number)
+        return ["{}-{}".format(episode.number, len(self.searches))]
+
+    def search_season(self, series, season_number):
+        self.searches.append(season_number)
+        return [(None, "pack-{}".format(len(self.searches))), (["2"], "e2")]
+
+
+@pytest.fixture
+def aggregator(monkeypatch):
+    monkeypatch.setattr(
+        providers_module,
+        "get_provider_from_config",
+        lambda provider_type, config: FakeProvider(config),
+    )
+    return DownloadAggregator({"default": "fake", "sources": [{"name": "fake"}]})
+
+
+@pytest.fixture
+def season():
+    return FakeSeason(FakeSeries("Show"), "1")
+
+
+def test_search_is_cached_unless_refreshed(aggregator, season):
+    episode = FakeEpisode(season, "1")
+
+    assert aggregator.search(episode) == ["1-1"]
+    assert aggregator.search(episode) == ["1-1"]
+    assert aggregator.search(episode, refresh=True) == ["1-2"]
+    assert aggregator.search(episode) == ["1-2"]
+
+
+def test_search_season_is_cached_unless_refreshed(aggregator, season):
+    episodes = [FakeEpisode(season, "1"), FakeEpisode(season, "2")]
+    provider = aggregator._get("fake")
+
+    results = aggregator.search_season(season, episodes)
+    assert results[episodes[0]] == ["pack-1"]
+    assert results[episodes[1]] == ["pack-1", "e2"]
+
+    aggregator.search_season(season, episodes)
+    assert provider.searches == ["1"]
+
+    results = aggregator.search_season(season, episodes, refresh=True)
+    assert results[episodes[0]] == ["pack-2"]
+    assert provider.searches == ["1", "1"]
+
+
+def test_provider_concurrency_is_limited(monkeypatch, season):
+    active = []
+    peak = []
+
+    class SlowProvider(FakeProvider):
+        def search(self, episode):
+            active.append(episode)
+            peak.append(len(active))
+            gevent.sleep(0.01)
+            active.remove(episode)
+            return []
+
+    monkeypatch.setattr(
+        providers_module,
+        "get_provider_from_config",
+        lambda provider_type, config: SlowProvider(config),
+    )
+    aggregator = DownloadAggregator(
+        {"default": "slow", "sources": [{"name": "slow", "concurrency": 2}]}
+    )
+    assert aggregator.concurrency == 2
+
+    episodes = [FakeEpisode(season, str(number)) for number in range(6)]
+    with gevent.Timeout(5):
+        gevent.joinall(
+            [gevent.spawn(aggregator.search, episode) for episode in episodes],
+            raise_error=True,
+        )
+
+    assert len(peak) == 6
+    assert max(peak) == 2
@@ -1,55 +1,146 @@
-import sched
 import time
 import logging
 from datetime import datetime
 
+import gevent
+from gevent.pool import Pool, Group
+
+from bard.models import connection_scope
 from bard.models.task import Task
-from bard.tasks.episode import find_episodes
+from bard.models.writer import writer
+from bard.tasks.episode import (
+    find_episodes,
+    find_recent_releases,
+    search_due_episodes,
+)
 from bard.tasks.torrent import update_torrents, prune_torrents
+from bard.tasks.processing import dispatch_process_jobs
 from bard.tasks.library import scan_library, update_missing_items
 from bard.tasks.series import update_all_series
 from bard.tasks.media import prune_missing_media
 
-scheduler = sched.scheduler(time.time, time.sleep)
 log = logging.getLogger(__name__)
 
 
 def _seconds_until(future_dt):
-    return (future_dt - datetime.utcnow()).seconds
-
-
-def register_repeating_task(seconds, func):
-    def wrap():
-        log.info("Running task %s", func.__name__)
-        try:
-            return func()
-        except Exception:
-            log.exception("Error in repeating task %s: ", func.__name__)
-        finally:
-            Task.save_run(func.__name__)
-            scheduler.enter(seconds, 1, wrap, ())
-
-    next_run = Task.get_next_run(func.__name__, seconds)
-    if next_run < datetime.utcnow():
-        log.info(
-            "Last run of task %s was outside of expected window, executing now",
-            func.__name__,
-        )
-        scheduler.enter(0, 1, wrap, ())
-    else:
-        log.info(
-            "Scheduling next run of task %s for %s seconds from now",
-            func.__name__,
-            _seconds_until(next_run),
-        )
-        scheduler.enter(_seconds_until(next_run), 1, wrap, ())
+    return max((future_dt - datetime.utcnow()).total_seconds(), 0)
+
+
+class RepeatingTask(object):
+    """
+    A function which is run on a fixed cadence inside of its own worker slot. Each
+    task owns a single-slot pool, so a run which is still in progress when the
+    next run comes due will never overlap with itself, and a slow task will never
+    delay the execution of any other task.
+    """
+
+    def __init__(self, func, interval, timeout=None):
+        self.func = func
+        self.name = func.__name__
+        self.interval = interval
+        self.timeout = timeout
+        self._pool = Pool(1)
+
+    @property
+    def running(self):
+        return self._pool.full()
+
+    def trigger(self):
+        """
+        Schedules an immediate run of this task, returning False if the task is
+        already running.
+        """
+        if self.running:
+            log.info("Task %s is already running, skipping trigger", self.name)
+            return False
+
+        self._pool.spawn(self._execute)
+        return True
+
+    def _execute(self):
+        log.info("Running task %s", self.name)
+        start = time.time()
+        with connection_scope():
+            try:
+                with gevent.Timeout(self.timeout):
+                    return self.func()
+            except gevent.Timeout:
+                log.error("Task %s timed out after %s seconds", self.name, self.timeout)
+            except Exception:
+                log.exception("Error in repeating task %s: ", self.name)
+            finally:
+                writer.write(Task.save_run, self.name)
+                log.info("Task %s finished in %.2fs", self.name, time.time() - start)
+
+    def run_forever(self):
+        next_run = Task.get_next_run(self.name, self.interval)
+        if next_run < datetime.utcnow():
+            log.info(
+                "Last run of task %s was outside of expected window, executing now",
+                self.name,
+            )
+        else:
+            log.info(
+                "Scheduling next run of task %s for %s seconds from now",
+                self.name,
+                _seconds_until(next_run),
+            )
+            gevent.sleep(_seconds_until(next_run))
+
+        while True:
+            started = time.time()
+
+            # If a triggered run is already in progress, it counts as this run
+            if self.running:
+                self._pool.join()
+            else:
+                self._pool.spawn(self._execute).join()
+
+            # Runs are scheduled from the start of the previous run, so a task
+            #  which overruns its interval is executed again right away.
+            gevent.sleep(max(self.interval - (time.time() - started), 0))
+
+
+class Scheduler(object):
+    def __init__(self):
+        self.tasks = {}
+        self._group = Group()
+
+    def register(self, seconds, func, timeout=None):
+        if func.__name__ in self.tasks:
+            raise Exception("Duplicate task {}".format(func.__name__))
+
+        task = RepeatingTask(func, seconds, timeout=timeout)
+        self.tasks[task.name] = task
+        return task
+
+    def trigger(self, name):
+        return self.tasks[name].trigger()
+
+    def run(self):
+        for task in self.tasks.values():
+            self._group.spawn(task.run_forever)
+        self._group.join()
+
+
+scheduler = Scheduler()
+
+
+def register_repeating_task(seconds, func, timeout=None):
+    return scheduler.register(seconds, func, timeout=timeout)
 
 
 def init_scheduler():
-    register_repeating_task(60, update_torrents)
-    register_repeating_task(60, update_missing_items)
-    register_repeating_task(60 * 30, find_episodes)
-    register_repeating_task(60 * 60 * 2, prune_torrents)
-    register_repeating_task(60 * 60 * 24, prune_missing_media)
-    register_repeating_task(60 * 60 * 24, scan_library)
-    register_repeating_task(60 * 60 * 24, update_all_series)
+    register_repeating_task(60, update_torrents, timeout=60 * 10)
+    register_repeating_task(15, dispatch_process_jobs, timeout=60)
+    register_repeating_task(60, update_missing_items, timeout=60 * 10)
+    register_repeating_task(60, search_due_episodes, timeout=60 * 30)
+    register_repeating_task(60 * 10, find_recent_releases, timeout=60 * 10)
+
+    # Targeted searches are driven by episode airdates through
+    #  `search_due_episodes`, so this is just a fallback for backfilled episodes.
+    register_repeating_task(60 * 60 * 6, find_episodes, timeout=60 * 60)
+    register_repeating_task(60 * 60 * 2, prune_torrents, timeout=60 * 30)
+    register_repeating_task(60 * 60 * 24, prune_missing_media, timeout=60 * 60 * 4)
+    register_repeating_task(60 * 60 * 24, scan_library, timeout=60 * 60 * 6)
+    register_repeating_task(60 * 60 * 24, update_all_series, timeout=60 * 60 * 12)
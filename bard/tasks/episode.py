@@ -1,100 +1,178 @@
+import time
 import logging
-from datetime import datetime, timedelta
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+
+from gevent.pool import Pool
+from peewee import chunked
 
 from bard.app import config
 from bard.providers import providers
-from bard.constants import QUALITIES
+from bard.models import with_connection
+from bard.models.series import Series
+from bard.models.season import Season
 from bard.models.episode import Episode
 from bard.models.torrent import Torrent
+from bard.models.wakeup import EpisodeWakeup
+from bard.models.writer import writer
+from bard.util.release import parse_release, series_name_variants
+from bard.util.scoring import TorrentScorer
+from bard.util.timerqueue import TimerQueue
 
 log = logging.getLogger(__name__)
 
+# How long after an episode airs we wait before the first targeted search
+AIRDATE_SEARCH_DELAY = timedelta(minutes=5)
+
+# The most targeted searches made by one `search_due_episodes` run. On startup
+#  every aired WANTED episode outside of its search backoff is due at once, so
+#  they're worked off over the following runs instead of in a single burst.
+MAX_DUE_SEARCHES = 20
+
+# How long we wait to search again for an episode whose search raised an error
+SEARCH_ERROR_DELAY = timedelta(minutes=15)
+
+# Seasons with at least this many wanted episodes are searched in one batch
+SEASON_SEARCH_MIN_EPISODES = 2
+
+# Compiled from the quality configuration on first use
+_torrent_scorer = None
+
+# Pending targeted searches, keyed by episode id
+episode_wakeups = TimerQueue()
+
+# The airdate each queued wakeup was calculated from
+_wakeup_airdates = {}
 
-def _download_provider_id(download_provider_id):
-    return download_provider_id
+# Episodes are queued as they're marked as WANTED (see `request_episode_wakeups`),
+#  the queue is only reconciled against every WANTED episode on startup and then
+#  periodically to pick up any changes made without a request.
+WAKEUP_SYNC_INTERVAL = timedelta(hours=1)
 
+_last_wakeup_sync = None
 
-def find_torrent_for_episode(episode):
+
+def find_torrent_for_episode(episode, refresh=False, exclude=None):
     log.debug("Searching for episode `%s`", episode)
-    results = providers.download.search(episode)
+    results = providers.download.search(episode, refresh=refresh)
 
-    if not len(results):
+    torrent = None
+    if len(results):
+        torrent = select_optimal_torrent_for_episode(episode, results, exclude=exclude)
+    else:
         log.debug("Failed to find any torrents for episode `%s`", episode)
+
+    episode.record_search(found=torrent is not None)
+    return torrent
+
+
+def find_torrents_for_season(season, episodes, fetched=None, refresh=False):
+    """
+    Searches for multiple episodes of a single season with one batched provider
+    search, returning a mapping of each episode to its selected torrent (or None).
+    Returns None if the download provider does not support batched searches.
+    """
+    log.debug("Searching for %s episodes of season `%s`", len(episodes), season.id)
+    results = providers.download.search_season(season, episodes, refresh=refresh)
+    if results is None:
         return None
 
-    return select_optimal_torrent_for_episode(episode, results)
+    if fetched is None:
+        fetched = get_fetched_torrent_ids(episodes)
 
+    selected = {}
+    for episode, torrents in results.items():
+        torrent = None
+        if torrents:
+            torrent = select_optimal_torrent_for_episode(
+                episode, torrents, exclude=fetched[episode.id]
+            )
 
-def select_optimal_torrent_for_episode(episode, torrents):
-    # Filter out torrents we've already fetched
-    existing_torrent_ids = (
-        Torrent.select(Torrent.download_provider_id)
-        .where(
-            (Torrent.episode == episode)
-            & (Torrent.download_provider == torrents[0].provider)
-        )
-        .objects(_download_provider_id)
-    )
-    torrents = [i for i in torrents if i.provider_id not in existing_torrent_ids]
+        episode.record_search(found=torrent is not None)
+        selected[episode] = torrent
+    return selected
 
-    if not len(torrents):
-        return None
 
-    # Store the torrents by seeders
-    torrents = sorted(torrents, key=lambda i: i.seeders, reverse=True)
-
-    # If we have any preferred keywords use them to sort our torrents now
-    preferred_keywords = config["quality"].get("preferred_keywords")
-    if preferred_keywords is not None:
-        torrents = sorted(
-            torrents,
-            key=lambda i: 0
-            if any(
-                (keyword.lower() in i.title.lower()) for keyword in preferred_keywords
+def fetch_selected_torrents(selected):
+    """
+    Fetches the selected torrent for each episode in the given mapping. Episodes
+    may share a season pack, so each torrent payload is only downloaded once.
+    """
+    payloads = {}
+
+    count = 0
+    for episode, torrent in selected.items():
+        if not torrent:
+            log.info(
+                "Failed to find torrent for episode %s (%s failed searches)",
+                episode.to_string(),
+                episode.search_failures,
             )
-            else 1,
-        )
+            continue
 
-    # If we have no quality preferences set in the config, return the highest
-    #  seeder count result.
-    desired_quality = config["quality"].get("desired")
-    if desired_quality is None:
-        return torrents[0]
+        key = (torrent.provider, torrent.provider_id)
+        if key not in payloads:
+            payloads[key] = providers.download.get_torrent_contents(torrent)
 
-    # If we're still in the time window defined by max_wait_minutes and calculated
-    #  based on the episode airdate, that means we won't accept torrents detected
-    #  as a lower quality.
-    max_wait_minutes = config["quality"].get("max_wait_minutes")
-    if max_wait_minutes:
-        cutoff = episode.airdate + timedelta(minutes=max_wait_minutes)
-        if datetime.utcnow() < cutoff:
-            # Filter to only torrents matching our desired quality
-            torrents = [i for i in torrents if desired_quality in i.title.lower()]
+        if episode.fetch(torrent, raw=payloads[key]):
+            count += 1
+    return count
+
+
+def get_torrent_scorer():
+    global _torrent_scorer
+    if _torrent_scorer is None:
+        _torrent_scorer = TorrentScorer(config["quality"])
+    return _torrent_scorer
 
-            # If we have any torrents at our desired quality, return highest seed
-            #  count
-            if torrents:
-                return torrents[0]
 
-            # Otherwise return nothing and we'll try again later
-            return None
+def get_fetched_torrent_ids(episodes):
+    """
+    Returns the (provider, provider_id) of all torrents previously fetched for
+    each of the given episodes, loaded in a single query.
+    """
+    fetched = defaultdict(set)
+    for batch in chunked([i.id for i in episodes], 500):
+        query = Torrent.select(
+            Torrent.episode, Torrent.download_provider, Torrent.download_provider_id
+        ).where(Torrent.episode << batch)
+        for episode_id, provider, provider_id in query.tuples():
+            fetched[episode_id].add((provider, provider_id))
+    return fetched
 
-    # Grab qualities and order by highest first
-    qualities_to_check = list(reversed(QUALITIES))
 
-    # If we have a desired quality we want to search by that first, and then go
-    #  based on highest to lowest quality.
-    if desired_quality:
-        qualities_to_check.remove(desired_quality)
-        qualities_to_check = [desired_quality] + qualities_to_check
+def select_optimal_torrent_for_episode(episode, torrents, exclude=None):
+    """
+    Selects the optimal torrent for an episode out of the given search results.
+    Bulk callers may pass `exclude` (see `get_fetched_torrent_ids`) to avoid
+    querying the torrents already fetched for each episode.
+    """
+    if exclude is None:
+        exclude = get_fetched_torrent_ids([episode])[episode.id]
 
-    for quality in qualities_to_check:
-        for result in torrents:
-            if quality in result.title.lower():
-                return result
+    return get_torrent_scorer().select(episode, torrents, exclude=exclude)
 
-    # Just return the highest seeder count result
-    return torrents[0]
+
+@with_connection
+def _find_episodes_batch(season, episodes, fetched, stats):
+    # NB: workers only read on their own connection, their writes (search
+    #  history and fetched torrents) are committed through the shared writer, and
+    #  no transaction is held open while calling out to providers.
+    try:
+        if season:
+            selected = find_torrents_for_season(season, episodes, fetched=fetched)
+        else:
+            episode = episodes[0]
+            selected = {
+                episode: find_torrent_for_episode(episode, exclude=fetched[episode.id])
+            }
+    except Exception:
+        log.exception("Failed to search for episodes %s: ", episodes)
+        stats["failed"] += len(episodes)
+        return
+
+    stats["searched"] += len(episodes)
+    stats["fetched"] += fetch_selected_torrents(selected)
 
 
 def find_episodes():
@@ -103,14 +181,301 @@ def find_episodes():
         & ((~(Episode.airdate >> None)) & (Episode.airdate < datetime.utcnow()))
     )
 
-    count = 0
+    # Group episodes by season so seasons with many wanted episodes can be
+    #  searched for in a single batch.
+    seasons = defaultdict(list)
+    skipped = 0
     for episode in episodes:
-        torrent = find_torrent_for_episode(episode)
+        if episode.in_search_backoff:
+            skipped += 1
+            continue
+
+        seasons[episode.season_id].append(episode)
+
+    batches = []
+    for season_episodes in seasons.values():
+        season = season_episodes[0].season
+        batched = len(season_episodes) >= SEASON_SEARCH_MIN_EPISODES
+        if batched and providers.download.can_search_season(season.series):
+            batches.append((season, season_episodes))
+        else:
+            batches.extend((None, [episode]) for episode in season_episodes)
+
+    # Searches are spread over a pool of greenlets, the download aggregator
+    #  enforces the concurrency limit of each individual provider.
+    fetched = get_fetched_torrent_ids(
+        [episode for season_episodes in seasons.values() for episode in season_episodes]
+    )
+
+    stats = Counter()
+    start = time.time()
+    pool = Pool(providers.download.concurrency)
+    for season, batch_episodes in batches:
+        pool.spawn(_find_episodes_batch, season, batch_episodes, fetched, stats)
+    pool.join()
+    duration = time.time() - start
+
+    log.info(
+        "Searched %s episodes in %.2fs (%.2f episodes/sec), fetched %s, %s failed "
+        "searches, skipped %s episodes still in search backoff",
+        stats["searched"],
+        duration,
+        stats["searched"] / duration if duration else 0,
+        stats["fetched"],
+        stats["failed"],
+        skipped,
+    )
+    return stats["fetched"]
+
+
+def _build_wanted_episode_index():
+    """
+    Builds an index of all aired WANTED episodes keyed by their download provider,
+    normalized series name and season number, mapping to the episodes by number.
+    """
+    episodes = (
+        Episode.select(Episode, Season, Series)
+        .join(Season)
+        .join(Series)
+        .where(
+            (Episode.state == Episode.State.WANTED)
+            & ((~(Episode.airdate >> None)) & (Episode.airdate < datetime.utcnow()))
+        )
+    )
+
+    index = defaultdict(dict)
+    for episode in episodes:
+        series = episode.season.series
+        provider = series.download_provider or providers.download.default
+        for name in series_name_variants(series.search_name):
+            key = (provider, name, str(int(episode.season.number)))
+            index[key][episode.number] = episode
+    return index
+
+
+def find_recent_releases():
+    """
+    Matches the recent releases listing of each download provider against all
+    WANTED episodes at once, fetching any matches. Episodes which don't turn up
+    in these listings are still picked up by the regular per-episode searches.
+    """
+    index = _build_wanted_episode_index()
+    if not index:
+        return 0
+
+    count = 0
+    for provider, releases in providers.download.recent().items():
+        candidates = defaultdict(list)
+        for release in releases:
+            info = parse_release(release.title)
+            if not info.name:
+                continue
+
+            season_episodes = index.get((provider, info.name, info.season))
+            if not season_episodes:
+                continue
+
+            # Season packs are candidates for every wanted episode they contain
+            episode_numbers = info.episodes
+            if episode_numbers is None:
+                episode_numbers = season_episodes.keys()
+
+            for number in episode_numbers:
+                if number in season_episodes:
+                    candidates[season_episodes[number]].append(release)
+
+        log.info(
+            "Matched %s recent releases from %s against %s wanted episodes",
+            sum(len(i) for i in candidates.values()),
+            provider,
+            len(candidates),
+        )
+
+        fetched = get_fetched_torrent_ids(list(candidates))
+
+        selected = {}
+        for episode, torrents in candidates.items():
+            torrent = select_optimal_torrent_for_episode(
+                episode, torrents, exclude=fetched[episode.id]
+            )
+            if torrent:
+                episode.record_search(found=True)
+                selected[episode] = torrent
+
+        count += fetch_selected_torrents(selected)
+
+    return count
+
+
+def _as_datetime(value):
+    # Info providers hand us airdates as strings, dates or datetimes, so normalize
+    #  them to the same value the database would give back to us.
+    if isinstance(value, datetime):
+        return value
+    elif isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    elif value:
+        return Episode.airdate.python_value(value)
+    return None
+
+
+def _next_episode_wakeup(episode, airdate, now):
+    first_search = airdate + AIRDATE_SEARCH_DELAY
+    if now < first_search:
+        return first_search
+
+    # Once aired, searches back off exponentially based on previous failures
+    next_search = max(episode.search_backoff_until or now, now)
+
+    # Always search again right as the quality cutoff expires, as we'll begin
+    #  accepting lower quality torrents at that point.
+    max_wait_minutes = config["quality"].get("max_wait_minutes")
+    if max_wait_minutes:
+        cutoff = airdate + timedelta(minutes=max_wait_minutes)
+        if now < cutoff:
+            next_search = min(next_search, cutoff)
+
+    return next_search
+
+
+def _queue_episode_wakeup(episode):
+    episode_wakeups.schedule(
+        episode.id,
+        _next_episode_wakeup(episode, _wakeup_airdates[episode.id], datetime.utcnow()),
+    )
+
+
+def schedule_episode_wakeup(episode):
+    """
+    Queues a targeted search for a WANTED episode based on its airdate. If the
+    episode is already queued its entry is only rebuilt when the airdate changed.
+    """
+    airdate = _as_datetime(episode.airdate)
+    if episode.state != Episode.State.WANTED or not airdate:
+        cancel_episode_wakeup(episode.id)
+        return
+
+    if episode.id in episode_wakeups and _wakeup_airdates.get(episode.id) == airdate:
+        return
+
+    _wakeup_airdates[episode.id] = airdate
+    _queue_episode_wakeup(episode)
+
+
+def cancel_episode_wakeup(episode_id):
+    episode_wakeups.cancel(episode_id)
+    _wakeup_airdates.pop(episode_id, None)
+
+
+def _select_wakeup_episodes():
+    return Episode.select(
+        Episode.id,
+        Episode.state,
+        Episode.airdate,
+        Episode.last_search,
+        Episode.search_failures,
+    ).where((Episode.state == Episode.State.WANTED) & (~(Episode.airdate >> None)))
+
+
+def schedule_episode_wakeups(episode_ids):
+    """
+    Queues targeted searches for the given episodes, e.g. after they were marked
+    as WANTED in bulk.
+    """
+    for batch in chunked(episode_ids, 500):
+        for episode in _select_wakeup_episodes().where(Episode.id << batch):
+            schedule_episode_wakeup(episode)
+
+
+def request_episode_wakeups(episode_ids):
+    """
+    Asks the scheduler to rebuild the queued searches for the given episodes, e.g.
+    after they were requested or skipped. The wakeup queue only lives within the
+    scheduler, so requests made by the webserver are persisted and picked up by
+    the next `search_due_episodes` run.
+    """
+    rows = [{"episode": episode_id} for episode_id in episode_ids]
+    for batch in chunked(rows, 500):
+        writer.write(EpisodeWakeup.insert_many(batch).on_conflict_ignore().execute)
+
+
+def apply_episode_wakeup_requests():
+    """
+    Rebuilds the queued searches for all requested episodes, returning the number
+    of episodes which were requested.
+    """
+    query = EpisodeWakeup.select(EpisodeWakeup.episode).tuples()
+    requested = [episode_id for (episode_id,) in query]
+
+    # Requests are cleared before the episodes are loaded, so any later change
+    #  to an episode comes with a request of its own.
+    for batch in chunked(requested, 500):
+        delete = EpisodeWakeup.delete().where(EpisodeWakeup.episode << batch)
+        writer.write(delete.execute)
+
+    for episode_id in requested:
+        cancel_episode_wakeup(episode_id)
+    schedule_episode_wakeups(requested)
+    return len(requested)
+
+
+def sync_episode_wakeups():
+    """
+    Reconciles the wakeup queue against all WANTED episodes, queueing any new
+    episodes and dropping any which are no longer wanted.
+    """
+    wanted = set()
+    for episode in _select_wakeup_episodes():
+        wanted.add(episode.id)
+        schedule_episode_wakeup(episode)
+
+    for episode_id in set(_wakeup_airdates) - wanted:
+        cancel_episode_wakeup(episode_id)
+
+
+def search_due_episodes():
+    global _last_wakeup_sync
+
+    apply_episode_wakeup_requests()
+
+    now = datetime.utcnow()
+    if _last_wakeup_sync is None or now - _last_wakeup_sync >= WAKEUP_SYNC_INTERVAL:
+        sync_episode_wakeups()
+        _last_wakeup_sync = now
+
+    due = episode_wakeups.pop_due(datetime.utcnow(), limit=MAX_DUE_SEARCHES)
+    if not due:
+        return 0
+
+    log.info("Running targeted search for %s episodes", len(due))
+
+    count = 0
+    for episode in Episode.select().where(
+        (Episode.id << due) & (Episode.state == Episode.State.WANTED)
+    ):
+        # Episodes were popped off the queue, so a failing search has to requeue
+        #  its episode rather than lose it until the next sync.
+        try:
+            torrent = find_torrent_for_episode(episode)
+            if torrent:
+                episode.fetch(torrent)
+        except Exception:
+            log.exception("Failed to search for episode %s: ", episode.to_string())
+            _wakeup_airdates[episode.id] = _as_datetime(episode.airdate)
+            episode_wakeups.schedule(episode.id, datetime.utcnow() + SEARCH_ERROR_DELAY)
+            continue
+
         if not torrent:
-            log.info("Failed to find torrent for episode %s", episode.to_string())
+            _wakeup_airdates[episode.id] = _as_datetime(episode.airdate)
+            _queue_episode_wakeup(episode)
+            log.info(
+                "Failed to find torrent for episode %s, next search at %s",
+                episode.to_string(),
+                episode_wakeups.deadline(episode.id),
+            )
             continue
 
         count += 1
-        episode.fetch(torrent)
+        cancel_episode_wakeup(episode.id)
 
     return count
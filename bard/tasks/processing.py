@@ -0,0 +1,224 @@
+import os
+import socket
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import gevent
+from gevent.lock import BoundedSemaphore
+from gevent.pool import Pool
+from peewee import fn
+
+from bard.app import config
+from bard.models import with_connection
+from bard.models.job import ProcessJob
+from bard.models.writer import writer
+
+log = logging.getLogger(__name__)
+
+# Jobs which fail with an OSError (e.g. a full disk, or a missing mount) are
+#  retried with an exponential backoff until they've been attempted this often.
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = timedelta(minutes=2)
+
+# Running jobs refresh their heartbeat this often. Jobs whose heartbeat is older
+#  than the timeout (e.g. as the process running them was killed) are assumed to
+#  be dead and are queued again.
+HEARTBEAT_INTERVAL = timedelta(minutes=1)
+HEARTBEAT_TIMEOUT = timedelta(minutes=5)
+
+# Identifies the jobs claimed by this process
+WORKER_ID = "{}:{}".format(socket.gethostname(), os.getpid())
+
+# Created on first use from the `processing` configuration
+_workers = None
+
+# Semaphores limiting concurrent processing I/O, keyed by filesystem device
+_filesystem_limits = {}
+
+
+def _get_workers():
+    global _workers
+    if _workers is None:
+        _workers = Pool(config.get("processing.workers", 2))
+    return _workers
+
+
+def _filesystem_device(path):
+    # Paths which don't exist yet (e.g. destinations) are on their parents device
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return os.stat(path).st_dev
+
+
+@contextmanager
+def filesystem_limits(*paths):
+    """
+    Limits concurrent I/O to the filesystems the given paths are on (e.g. the
+    source and destination of a copy), so that processing doesn't saturate a
+    disk which media is streamed from.
+    """
+    devices = sorted({_filesystem_device(path) for path in paths})
+
+    # Limits are always acquired in device order, so that jobs copying between
+    #  the same filesystems in opposite directions can't deadlock.
+    acquired = []
+    try:
+        for device in devices:
+            limit = _filesystem_limits.get(device)
+            if limit is None:
+                limit = _filesystem_limits[device] = BoundedSemaphore(
+                    config.get("processing.io_concurrency", 1)
+                )
+            limit.acquire()
+            acquired.append(limit)
+        yield
+    finally:
+        for limit in reversed(acquired):
+            limit.release()
+
+
+def run_blocking(func, *args):
+    """
+    Runs a blocking file operation (e.g. copying or extracting media) in gevent's
+    threadpool, so it doesn't stall every other greenlet while it runs.
+    """
+    return gevent.get_hub().threadpool.apply(func, args)
+
+
+def enqueue_process_job(torrent, files):
+    """
+    Queues processing for a torrent. Jobs are only ever started by the scheduler
+    (see `dispatch_process_jobs`), so that the processing limits hold for every
+    job, however many webservers queue them.
+    """
+    from bard.scheduler import scheduler
+
+    job = writer.write(ProcessJob.create, torrent=torrent, files=list(files))
+
+    # Within the scheduler's process jobs are dispatched right away, rather than
+    #  on the next scheduled dispatch.
+    if dispatch_process_jobs.__name__ in scheduler.tasks:
+        scheduler.trigger(dispatch_process_jobs.__name__)
+    return job
+
+
+@with_connection
+def dispatch_process_jobs():
+    """
+    Starts any pending process jobs which are due, up to the number of free
+    workers. Returns the number of jobs which were started.
+    """
+    now = datetime.utcnow()
+
+    # Jobs claimed before heartbeats were recorded fall back to their start time
+    stale = ProcessJob.update(state=ProcessJob.State.PENDING, owner=None).where(
+        (ProcessJob.state == ProcessJob.State.RUNNING)
+        & (
+            fn.COALESCE(ProcessJob.heartbeat, ProcessJob.started)
+            < now - HEARTBEAT_TIMEOUT
+        )
+    )
+    stale_count = writer.write(stale.execute)
+    if stale_count:
+        log.warning("Requeued %s process jobs whose worker stopped", stale_count)
+
+    workers = _get_workers()
+    if workers.full():
+        return 0
+
+    jobs = (
+        ProcessJob.select(ProcessJob.id)
+        .where(
+            (ProcessJob.state == ProcessJob.State.PENDING)
+            & (ProcessJob.next_attempt <= now)
+        )
+        .order_by(ProcessJob.next_attempt)
+        .limit(workers.free_count())
+    )
+
+    dispatched = 0
+    for job in jobs:
+        # Jobs are claimed atomically, so that a job is never run by two workers
+        #  (e.g. when several schedulers share a database).
+        claim = ProcessJob.update(
+            state=ProcessJob.State.RUNNING,
+            started=now,
+            attempts=ProcessJob.attempts + 1,
+            owner=WORKER_ID,
+            heartbeat=now,
+        ).where(
+            (ProcessJob.id == job.id) & (ProcessJob.state == ProcessJob.State.PENDING)
+        )
+        if writer.write(claim.execute):
+            workers.spawn(_run_process_job, job.id)
+            dispatched += 1
+
+    return dispatched
+
+
+def _owned_job(job_id):
+    return (
+        (ProcessJob.id == job_id)
+        & (ProcessJob.state == ProcessJob.State.RUNNING)
+        & (ProcessJob.owner == WORKER_ID)
+    )
+
+
+def _heartbeat(job_id):
+    interval = HEARTBEAT_INTERVAL.total_seconds()
+    while True:
+        gevent.sleep(interval)
+        beat = ProcessJob.update(heartbeat=datetime.utcnow()).where(_owned_job(job_id))
+        writer.write(beat.execute)
+
+
+@with_connection
+def _run_process_job(job_id):
+    from bard.tasks.torrent import process_torrent
+
+    job = ProcessJob.with_id(job_id)
+    if job is None:
+        return
+
+    heartbeat = gevent.spawn(_heartbeat, job.id)
+    try:
+        process_torrent(job.torrent, job.files)
+    except OSError as e:
+        log.exception(
+            "Failed to process torrent %s (attempt %s of %s): ",
+            job.torrent_id,
+            job.attempts,
+            MAX_ATTEMPTS,
+        )
+        job.error = str(e)
+        if job.attempts < MAX_ATTEMPTS:
+            job.state = ProcessJob.State.PENDING
+            job.next_attempt = datetime.utcnow() + RETRY_BACKOFF * (
+                2 ** (job.attempts - 1)
+            )
+        else:
+            job.state = ProcessJob.State.FAILED
+    except Exception as e:
+        log.exception("Failed to process torrent %s: ", job.torrent_id)
+        job.error = str(e)
+        job.state = ProcessJob.State.FAILED
+    else:
+        job.error = None
+        job.state = ProcessJob.State.DONE
+    finally:
+        heartbeat.kill()
+
+    # Jobs which were reclaimed while running (e.g. after this process stalled)
+    #  belong to whoever claimed them now.
+    finish = ProcessJob.update(
+        state=job.state,
+        error=job.error,
+        next_attempt=job.next_attempt,
+        finished=datetime.utcnow(),
+    ).where(_owned_job(job.id))
+    if not writer.write(finish.execute):
+        log.warning("Process job %s was reclaimed while running", job.id)
@@ -1,32 +1,78 @@
 import logging
 
-from bard.providers import providers
 from bard.models.episode import Episode
+from bard.tasks.episode import request_episode_wakeups, _as_datetime
 
 log = logging.getLogger(__name__)
 
+# Columns of existing episodes which are updated from their metadata, all other
+#  columns (e.g. their state) are only set when an episode is created.
+EPISODE_METADATA_FIELDS = [Episode.name, Episode.desc, Episode.airdate, Episode.imdb_id]
 
-def update_season(season):
-    log.info(
-        "Performing an update on season %s, %s (%s)",
-        season.number,
-        season.series.name,
-        season.series.id,
+
+def _metadata_changed(episode, metadata):
+    return (
+        episode.name != metadata.name
+        or episode.desc != metadata.desc
+        or _as_datetime(episode.airdate) != _as_datetime(metadata.airdate)
+        or episode.imdb_id != metadata.imdb_id
     )
 
-    for episode_info in providers.info.get_episodes(season.series, season.number):
-        try:
-            episode = Episode.get(season=season, number=episode_info.number)
-            episode.update_from_metadata(episode_info)
-            episode.save()
-        except Episode.DoesNotExist:
-            episode = Episode.from_metadata(
-                season,
-                episode_info,
-                state=Episode.State.WANTED
-                if season.series.subscribed
-                else Episode.State.NONE,
-            )
+
+def diff_episodes(series, episodes, existing, counts):
+    """
+    Compares the metadata of a season's episodes against its `existing` episodes
+    (keyed by number), counting created, updated and unchanged episodes into
+    `counts`. Returns the rows (without their season) to upsert.
+    """
+    state = Episode.State.WANTED if series.subscribed else Episode.State.NONE
+
+    rows = []
+    for metadata in episodes:
+        episode = existing.get(metadata.number)
+        if episode is None:
+            counts["created"] += 1
+        elif _metadata_changed(episode, metadata):
+            counts["updated"] += 1
+        else:
+            counts["unchanged"] += 1
+            continue
+
+        rows.append(
+            {
+                "state": state,
+                "number": metadata.number,
+                "name": metadata.name,
+                "desc": metadata.desc,
+                "airdate": metadata.airdate,
+                "imdb_id": metadata.imdb_id,
+            }
+        )
+    return rows
+
+
+def upsert_episodes(season_id, rows):
+    Episode.upsert_many(
+        [dict(row, season=season_id) for row in rows],
+        [Episode.season, Episode.number],
+        EPISODE_METADATA_FIELDS,
+    )
+
+
+def schedule_season_wakeups(season, rows, existing):
+    """
+    Requests searches for the created and updated episodes of a season once their
+    rows were written.
+    """
+    if not rows:
+        return
+
+    numbers = [row["number"] for row in rows]
+    episode_ids = []
+    for episode in Episode.select().where(
+        (Episode.season == season) & (Episode.number << numbers)
+    ):
+        if episode.number not in existing:
             log.info(
                 "Added episode %s in state %s due to season %s being subscribed (%s)",
                 episode.id,
@@ -34,3 +80,7 @@ def update_season(season):
                 season.id,
                 season.series.subscribed,
             )
+        episode_ids.append(episode.id)
+
+    # Series are also updated from the webserver, which can't queue searches
+    request_episode_wakeups(episode_ids)
@@ -1,9 +1,12 @@
 import logging
+from collections import Counter, defaultdict
 
 from peewee import IntegrityError
 from bard.providers import providers
 from bard.models.series import Series
 from bard.models.season import Season
+from bard.models.episode import Episode
+from bard.models.writer import writer
 
 log = logging.getLogger(__name__)
 
@@ -13,11 +16,29 @@ def update_all_series():
         update_series(Series.get(id=series_id))
 
 
+def _apply_series_changes(series, season_rows, episode_rows):
+    from bard.tasks.season import upsert_episodes
+
+    Season.upsert_many(
+        season_rows, [Season.series, Season.number], [Season.episode_count]
+    )
+
+    season_ids = dict(
+        Season.select(Season.number, Season.id).where(Season.series == series).tuples()
+    )
+    for number, rows in episode_rows.items():
+        if rows:
+            upsert_episodes(season_ids[number], rows)
+
+
 def update_series(series):
     """
     Attempts to update all metadata about a series (seasons, episodes, media, etc).
+    Existing seasons and episodes are loaded up front and all changes are written
+    in a single transaction. Returns Counters of the created, updated and
+    unchanged seasons and episodes.
     """
-    from bard.tasks.season import update_season
+    from bard.tasks.season import diff_episodes, schedule_season_wakeups
     from bard.tasks.library import update_series_media
 
     log.info("Performing update on series %s (%s)", series.name, series.id)
@@ -26,21 +47,58 @@ def update_series(series):
     try:
         series_info = providers.info.get_series(series)
         series.update_from_metadata(series_info)
-        series.save()
+        writer.write(series.save)
     except IntegrityError:
         log.exception("Failed to update_series %s (%s)", series.name, series.id)
 
-    seasons = providers.info.get_seasons(series)
-    for season_info in seasons:
-        season = None
-        try:
-            # If we have an existing season, just update that
-            season = Season.get(series=series, number=season_info.number)
-            season.update_from_metadata(season_info)
-            season.save()
-        except Season.DoesNotExist:
-            season = Season.from_metadata(series, season_info)
+    seasons = {i.number: i for i in series.seasons}
+    existing = defaultdict(dict)
+    for episode in Episode.select().join(Season).where(Season.series == series):
+        existing[episode.season_id][episode.number] = episode
+
+    counts = {"seasons": Counter(), "episodes": Counter()}
+    season_rows = []
+    episode_rows = {}
+    for season_info in providers.info.get_seasons(series):
+        season = seasons.get(season_info.number)
+        if season is None:
+            counts["seasons"]["created"] += 1
+        elif season.episode_count != season_info.episode_count:
+            counts["seasons"]["updated"] += 1
+        else:
+            counts["seasons"]["unchanged"] += 1
+
+        if season is None or season.episode_count != season_info.episode_count:
+            season_rows.append(
+                {
+                    "series": series.id,
+                    "number": season_info.number,
+                    "episode_count": season_info.episode_count,
+                }
+            )
+
+        episode_rows[season_info.number] = diff_episodes(
+            series,
+            providers.info.get_episodes(series, season_info.number),
+            existing[season.id] if season else {},
+            counts["episodes"],
+        )
+
+    if season_rows or any(episode_rows.values()):
+        writer.write(_apply_series_changes, series, season_rows, episode_rows)
+
+    for season in series.seasons:
+        schedule_season_wakeups(
+            season, episode_rows.get(season.number), existing[season.id]
+        )
 
-        update_season(season)
+    log.info(
+        "Updated series %s (%s): seasons %s, episodes %s",
+        series.name,
+        series.id,
+        dict(counts["seasons"]),
+        dict(counts["episodes"]),
+    )
 
     update_series_media(series)
+    return counts
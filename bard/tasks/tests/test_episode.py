@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+
+import gevent
+import pytest
+
+from bard import providers as providers_module
+from bard.models.episode import Episode
+from bard.models.season import Season
+from bard.models.series import Series
+from bard.models.wakeup import EpisodeWakeup
+from bard.tasks import episode as episode_tasks
+from bard.providers import DownloadAggregator, providers
+from bard.tasks.episode import (
+    SEARCH_ERROR_DELAY,
+    apply_episode_wakeup_requests,
+    find_episodes,
+    request_episode_wakeups,
+    search_due_episodes,
+)
+from bard.util.timerqueue import TimerQueue
+
+
+@pytest.fixture
+def wakeups(monkeypatch):
+    wakeups = TimerQueue()
+    monkeypatch.setattr(episode_tasks, "episode_wakeups", wakeups)
+    monkeypatch.setattr(episode_tasks, "_wakeup_airdates", {})
+    monkeypatch.setattr(episode_tasks, "_last_wakeup_sync", None)
+    return wakeups
+
+
+def _aired(episode, number, days=1):
+    return Episode.create(
+        season=episode.season,
+        state=Episode.State.WANTED,
+        number=str(number),
+        airdate=datetime.utcnow() - timedelta(days=days),
+    )
+
+
+def test_failing_search_requeues_its_episode(episode, wakeups, monkeypatch):
+    broken = _aired(episode, 2)
+    working = _aired(episode, 3)
+
+    searched = []
+
+    def find_torrent_for_episode(episode):
+        searched.append(episode.id)
+        if episode.id == broken.id:
+            raise ValueError("Provider is down")
+        return None
+
+    monkeypatch.setattr(
+        episode_tasks, "find_torrent_for_episode", find_torrent_for_episode
+    )
+
+    before = datetime.utcnow()
+    assert search_due_episodes() == 0
+    assert sorted(searched) == [broken.id, working.id]
+
+    assert broken.id in wakeups
+    assert wakeups.deadline(broken.id) >= before + SEARCH_ERROR_DELAY
+    assert working.id in wakeups
+
+
+def test_due_searches_are_spread_over_runs(episode, wakeups, monkeypatch):
+    monkeypatch.setattr(episode_tasks, "MAX_DUE_SEARCHES", 2)
+    backlog = [_aired(episode, number, days=number) for number in range(2, 7)]
+
+    searched = []
+
+    def find_torrent_for_episode(episode):
+        searched.append(episode.id)
+        episode.record_search(found=False)
+
+    monkeypatch.setattr(
+        episode_tasks, "find_torrent_for_episode", find_torrent_for_episode
+    )
+
+    search_due_episodes()
+    assert len(searched) == 2
+
+    search_due_episodes()
+    search_due_episodes()
+    assert sorted(searched) == sorted(i.id for i in backlog)
+
+
+def test_requested_wakeups_are_applied(episode, wakeups):
+    wanted = _aired(episode, 2)
+    skipped = _aired(episode, 3)
+    wakeups.schedule(skipped.id, datetime.utcnow() + timedelta(days=1))
+
+    # Requests are made by the webserver, after changing the episodes
+    Episode.update(state=Episode.State.NONE).where(Episode.id == skipped.id).execute()
+    request_episode_wakeups([wanted.id, skipped.id])
+    request_episode_wakeups([wanted.id])
+
+    assert apply_episode_wakeup_requests() == 2
+    assert EpisodeWakeup.select().count() == 0
+    assert wanted.id in wakeups
+    assert skipped.id not in wakeups
+    assert apply_episode_wakeup_requests() == 0
+
+
+def test_find_episodes_limits_and_isolates_providers(episode, monkeypatch):
+    searches = {"working": [], "broken": []}
+    active = []
+    peak = []
+
+    class Provider(object):
+        def __init__(self, opts):
+            self.name = opts["name"]
+
+        def search(self, episode):
+            searches[self.name].append(episode.id)
+            if self.name == "broken":
+                raise ValueError("Provider is down")
+
+            active.append(episode.id)
+            peak.append(len(active))
+            gevent.sleep(0.01)
+            active.remove(episode.id)
+            return []
+
+    monkeypatch.setattr(
+        providers_module,
+        "get_provider_from_config",
+        lambda provider_type, config: Provider(config),
+    )
+    download = DownloadAggregator(
+        {
+            "default": "working",
+            "sources": [
+                {"name": "working", "concurrency": 1},
+                {"name": "broken", "concurrency": 2},
+            ],
+        }
+    )
+    monkeypatch.setattr(providers, "download", download, raising=False)
+
+    working = [_aired(episode, number) for number in range(2, 5)]
+
+    series = Series.create(name="Other", provider_ids={}, download_provider="broken")
+    season = Season.create(series=series, number="1", episode_count=2)
+    broken = [_aired(Episode(season=season), number) for number in range(1, 3)]
+
+    with gevent.Timeout(5):
+        assert find_episodes() == 0
+
+    # Every episode of the working provider was searched, one at a time
+    assert sorted(searches["working"]) == sorted(i.id for i in working)
+    assert max(peak) == 1
+    assert sorted(searches["broken"]) == sorted(i.id for i in broken)
+    for i in working:
+        assert Episode.get_by_id(i.id).search_failures == 1
@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta
+
+import gevent
+import pytest
+from gevent.event import Event
+from gevent.pool import Pool
+
+from bard.models.job import ProcessJob
+from bard.models.torrent import Torrent
+from bard.tasks import processing, torrent as torrent_tasks
+from bard.tasks.processing import (
+    HEARTBEAT_TIMEOUT,
+    MAX_ATTEMPTS,
+    RETRY_BACKOFF,
+    WORKER_ID,
+    dispatch_process_jobs,
+    enqueue_process_job,
+)
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    workers = Pool(1)
+    monkeypatch.setattr(processing, "_workers", workers)
+    return workers
+
+
+@pytest.fixture
+def processed(monkeypatch):
+    """
+    Replaces the processing of torrents, recording the processed torrent ids. The
+    outcome of each run is set through `processed.error` and `processed.release`.
+    """
+
+    class Processed(list):
+        error = None
+        release = None
+
+    processed = Processed()
+
+    def process_torrent(torrent, files):
+        if processed.release is not None:
+            processed.release.wait()
+        processed.append(torrent.id)
+        if processed.error is not None:
+            raise processed.error
+
+    monkeypatch.setattr(torrent_tasks, "process_torrent", process_torrent)
+    return processed
+
+
+@pytest.fixture
+def torrent(episode):
+    return Torrent.create(
+        episode=episode,
+        state=Torrent.State.SEEDING,
+        title="Show.S01E01.720p",
+        size="1",
+        seeders=1,
+        leechers=1,
+    )
+
+
+def _job(job):
+    return ProcessJob.get_by_id(job.id)
+
+
+def _dispatch(workers):
+    with gevent.Timeout(5):
+        dispatched = dispatch_process_jobs()
+        workers.join()
+    return dispatched
+
+
+def test_dispatch_claims_due_jobs(torrent, workers, processed):
+    processed.release = Event()
+    later = ProcessJob.create(
+        torrent=torrent, next_attempt=datetime.utcnow() + timedelta(hours=1)
+    )
+    first = enqueue_process_job(torrent, ["a.mkv"])
+    second = enqueue_process_job(torrent, ["b.mkv"])
+
+    # Enqueueing alone never starts a job
+    assert _job(first).state == ProcessJob.State.PENDING
+
+    with gevent.Timeout(5):
+        assert dispatch_process_jobs() == 1
+
+        job = _job(first)
+        assert job.state == ProcessJob.State.RUNNING
+        assert job.owner == WORKER_ID
+        assert job.attempts == 1
+        assert job.heartbeat is not None
+
+        # Jobs aren't dispatched while every worker is busy
+        assert dispatch_process_jobs() == 0
+
+        processed.release.set()
+        workers.join()
+
+    assert _job(first).state == ProcessJob.State.DONE
+    assert _dispatch(workers) == 1
+    assert _job(second).state == ProcessJob.State.DONE
+    assert _job(later).state == ProcessJob.State.PENDING
+    assert processed == [torrent.id, torrent.id]
+
+
+def test_failed_jobs_are_retried_with_backoff(torrent, workers, processed):
+    processed.error = OSError("No space left on device")
+    job = enqueue_process_job(torrent, [])
+
+    for attempt in range(1, MAX_ATTEMPTS):
+        before = datetime.utcnow()
+        assert _dispatch(workers) == 1
+
+        job = _job(job)
+        assert job.state == ProcessJob.State.PENDING
+        assert job.attempts == attempt
+        assert job.error == "No space left on device"
+        assert job.next_attempt >= before + RETRY_BACKOFF * 2 ** (attempt - 1)
+
+        # The backoff has to pass before the job is dispatched again
+        assert _dispatch(workers) == 0
+        ProcessJob.update(next_attempt=before).execute()
+
+    assert _dispatch(workers) == 1
+    job = _job(job)
+    assert job.state == ProcessJob.State.FAILED
+    assert job.attempts == MAX_ATTEMPTS
+    assert len(processed) == MAX_ATTEMPTS
+
+
+def test_unexpected_errors_fail_jobs_right_away(torrent, workers, processed):
+    processed.error = ValueError("Broken torrent")
+    job = enqueue_process_job(torrent, [])
+
+    assert _dispatch(workers) == 1
+    job = _job(job)
+    assert job.state == ProcessJob.State.FAILED
+    assert job.error == "Broken torrent"
+    assert job.attempts == 1
+
+
+def test_stale_jobs_are_reclaimed(torrent, processed, monkeypatch):
+    expired = datetime.utcnow() - HEARTBEAT_TIMEOUT - timedelta(seconds=1)
+    running = {"state": ProcessJob.State.RUNNING, "attempts": 1, "owner": "dead:1"}
+
+    # Long running jobs are kept while their worker is alive
+    alive = ProcessJob.create(
+        torrent=torrent,
+        started=datetime.utcnow() - timedelta(days=1),
+        heartbeat=datetime.utcnow(),
+        **running
+    )
+    dead = ProcessJob.create(
+        torrent=torrent, started=expired, heartbeat=expired, **running
+    )
+
+    # Jobs claimed before heartbeats were recorded expire by their start time
+    legacy = ProcessJob.create(torrent=torrent, started=expired, **running)
+
+    workers = Pool(2)
+    monkeypatch.setattr(processing, "_workers", workers)
+    assert _dispatch(workers) == 2
+
+    assert _job(alive).state == ProcessJob.State.RUNNING
+    for job in (dead, legacy):
+        job = _job(job)
+        assert job.state == ProcessJob.State.DONE
+        assert job.owner == WORKER_ID
+        assert job.attempts == 2
+
+
+def test_reclaimed_jobs_are_left_to_their_new_owner(torrent, workers, processed):
+    processed.release = Event()
+    job = enqueue_process_job(torrent, [])
+
+    with gevent.Timeout(5):
+        assert dispatch_process_jobs() == 1
+
+        # Another worker reclaimed the job while this one was stalled
+        ProcessJob.update(owner="other:1").execute()
+        processed.release.set()
+        workers.join()
+
+    job = _job(job)
+    assert job.state == ProcessJob.State.RUNNING
+    assert job.owner == "other:1"
+    assert job.finished is None
+
+
+def test_enqueue_dispatches_within_the_scheduler(
+    torrent, workers, processed, monkeypatch
+):
+    from bard import scheduler as scheduler_module
+
+    scheduler = scheduler_module.Scheduler()
+    task = scheduler.register(15, dispatch_process_jobs)
+    monkeypatch.setattr(scheduler_module, "scheduler", scheduler)
+
+    job = enqueue_process_job(torrent, [])
+    with gevent.Timeout(5):
+        task._pool.join()
+        workers.join()
+
+    assert _job(job).state == ProcessJob.State.DONE
+    assert processed == [torrent.id]
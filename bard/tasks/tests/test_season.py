@@ -0,0 +1,43 @@
+from collections import Counter
+from datetime import datetime
+
+from bard.models.episode import Episode, EpisodeMetadata
+from bard.tasks.season import diff_episodes
+
+
+def _metadata(number, name, airdate=datetime(2020, 1, 1)):
+    return EpisodeMetadata(number, name, None, airdate, None)
+
+
+def test_diff_episodes_counts(episode):
+    series = episode.season.series
+    Episode.update(name="Pilot", airdate=datetime(2020, 1, 1)).execute()
+    changed = Episode.create(season=episode.season, number="2", name="Second")
+    existing = {i.number: i for i in Episode.select()}
+
+    counts = Counter()
+    rows = diff_episodes(
+        series,
+        [
+            # Airdates from info providers may be dates or strings
+            _metadata("1", "Pilot", airdate="2020-01-01 00:00:00"),
+            _metadata("2", "Renamed"),
+            _metadata("3", "Third"),
+        ],
+        existing,
+        counts,
+    )
+
+    assert counts == {"created": 1, "updated": 1, "unchanged": 1}
+    assert [row["number"] for row in rows] == [changed.number, "3"]
+    assert {row["state"] for row in rows} == {Episode.State.NONE}
+
+
+def test_diff_episodes_wants_episodes_of_subscribed_series(episode):
+    series = episode.season.series
+    series.subscribed = True
+
+    counts = Counter()
+    rows = diff_episodes(series, [_metadata("2", "Second")], {}, counts)
+    assert counts == {"created": 1}
+    assert rows[0]["state"] == Episode.State.WANTED
@@ -0,0 +1,274 @@
+import calendar
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytest
+
+from bard.app import config
+from bard.models.episode import Episode
+from bard.models.job import ProcessJob
+from bard.models.torrent import Torrent
+from bard.providers import providers
+from bard.providers.fetch import TorrentFetchInfo
+from bard.tasks import episode as episode_tasks, torrent as torrent_tasks
+from bard.tasks.torrent import (
+    FULL_POLL_INTERVAL,
+    _apply_torrent_states,
+    prune_torrents,
+    update_torrents,
+)
+from bard.util.timerqueue import TimerQueue
+
+
+class FakeFetchProvider(object):
+    """
+    Reports the given TorrentFetchInfo for each fetch provider id, recording
+    every poll and removal.
+    """
+
+    def __init__(self):
+        self.infos = {}
+        self.recently_active = set()
+        self.polls = []
+        self.removed = []
+
+    def report(self, fetch_provider_id, state, **kwargs):
+        self.infos[fetch_provider_id] = TorrentFetchInfo(
+            id=fetch_provider_id,
+            state=state,
+            seconds_seeding=kwargs.get("seconds_seeding", 0),
+            done_timestamp=kwargs.get("done_timestamp", 0),
+            percent_done=1.0,
+        )
+
+    def get_torrent_info(self, torrents, recently_active=False):
+        self.polls.append(recently_active)
+        for torrent in torrents:
+            info = self.infos.get(torrent.fetch_provider_id)
+            if info is None:
+                continue
+            if recently_active and info.id not in self.recently_active:
+                continue
+            yield info
+
+    def get_torrent_files(self, torrents):
+        return {}
+
+    def remove_many(self, torrents):
+        self.removed.append(sorted(i.fetch_provider_id for i in torrents))
+
+
+@pytest.fixture
+def fetch(monkeypatch):
+    fetch = FakeFetchProvider()
+    monkeypatch.setattr(providers, "fetch", fetch, raising=False)
+    monkeypatch.setattr(torrent_tasks, "_last_full_poll", None)
+    return fetch
+
+
+def _torrent(episode, fetch_provider_id, state, **kwargs):
+    return Torrent.create(
+        episode=episode,
+        fetch_provider_id=fetch_provider_id,
+        state=state,
+        title="Show.S01E01.720p",
+        size="1",
+        seeders=1,
+        leechers=1,
+        files=["Show.S01E01.720p.mkv"],
+        **kwargs
+    )
+
+
+def _state(torrent):
+    return Torrent.get_by_id(torrent.id).state
+
+
+def test_full_poll_interval(episode, fetch):
+    active = _torrent(episode, "a", Torrent.State.DOWNLOADING)
+    idle = _torrent(episode, "b", Torrent.State.DOWNLOADING)
+    fetch.report("a", Torrent.State.DOWNLOADING)
+    fetch.report("b", Torrent.State.DOWNLOADING)
+
+    # The first poll after startup is a full poll
+    assert update_torrents() == 2
+    assert fetch.polls == [False]
+
+    # Only torrents with recent activity are reported in between full polls
+    fetch.recently_active = {"a"}
+    fetch.report("a", Torrent.State.SEEDING)
+    fetch.report("b", Torrent.State.SEEDING)
+    assert update_torrents() == 1
+    assert fetch.polls == [False, True]
+    assert _state(active) == Torrent.State.SEEDING
+    assert _state(idle) == Torrent.State.DOWNLOADING
+
+    torrent_tasks._last_full_poll = datetime.utcnow() - FULL_POLL_INTERVAL
+    assert update_torrents() == 2
+    assert fetch.polls == [False, True, False]
+    assert _state(idle) == Torrent.State.SEEDING
+
+    assert update_torrents() == 1
+    assert fetch.polls == [False, True, False, True]
+
+
+def test_recently_active_poll_queues_completed_torrents(episode, fetch):
+    torrent = _torrent(episode, "a", Torrent.State.DOWNLOADING)
+    fetch.report("a", Torrent.State.DOWNLOADING)
+    update_torrents()
+
+    fetch.recently_active = {"a"}
+    fetch.report("a", Torrent.State.SEEDING)
+    assert update_torrents() == 1
+    assert fetch.polls == [False, True]
+
+    torrent = Torrent.get_by_id(torrent.id)
+    assert torrent.processed
+    assert [job.files for job in torrent.process_jobs] == [torrent.files]
+
+
+def _updates(caplog):
+    # Peewee logs each query as its (sql, params)
+    queries = [record.msg for record in caplog.records if record.name == "peewee"]
+    return [sql for sql, _ in queries if sql.startswith("UPDATE")]
+
+
+def test_apply_torrent_states_updates_each_state_once(episode, caplog):
+    torrents = [_torrent(episode, str(i), Torrent.State.DOWNLOADING) for i in range(5)]
+    states = [
+        (torrents[0], Torrent.State.DOWNLOADING),
+        (torrents[1], Torrent.State.SEEDING),
+        (torrents[2], Torrent.State.SEEDING),
+        (torrents[3], Torrent.State.COMPLETED),
+        (torrents[4], Torrent.State.DOWNLOADING),
+    ]
+
+    with caplog.at_level(logging.DEBUG, logger="peewee"):
+        assert _apply_torrent_states(states) == 3
+    assert len(_updates(caplog)) == 2
+
+    assert [_state(i) for i in torrents] == [state for _, state in states]
+    assert [i.state for i in torrents] == [state for _, state in states]
+
+    # Nothing is written when no state changed
+    caplog.clear()
+    with caplog.at_level(logging.DEBUG, logger="peewee"):
+        assert _apply_torrent_states(states) == 0
+    assert _updates(caplog) == []
+
+
+def test_missing_torrents_after_full_poll(episode, fetch, monkeypatch):
+    wakeups = TimerQueue()
+    monkeypatch.setattr(episode_tasks, "episode_wakeups", wakeups)
+    monkeypatch.setattr(episode_tasks, "_wakeup_airdates", {})
+
+    aired = datetime(2020, 1, 1)
+    Episode.update(state=Episode.State.FETCHED, airdate=aired).execute()
+    other = Episode.create(
+        season=episode.season, state=Episode.State.FETCHED, number="2", airdate=aired
+    )
+
+    downloading = _torrent(episode, "a", Torrent.State.DOWNLOADING)
+    seeding = _torrent(other, "b", Torrent.State.SEEDING, processed=True)
+
+    # An episode with another torrent left in the fetch provider isn't requeued
+    replaced = _torrent(other, "c", Torrent.State.DOWNLOADING)
+    active = _torrent(other, "d", Torrent.State.DOWNLOADING)
+    fetch.report("d", Torrent.State.DOWNLOADING)
+
+    # Recently active polls never mark torrents as missing
+    torrent_tasks._last_full_poll = datetime.utcnow()
+    assert update_torrents() == 0
+    assert _state(downloading) == Torrent.State.DOWNLOADING
+
+    torrent_tasks._last_full_poll = None
+    assert update_torrents() == 1
+    assert _state(downloading) == Torrent.State.NONE
+    assert _state(seeding) == Torrent.State.COMPLETED
+    assert _state(replaced) == Torrent.State.NONE
+    assert _state(active) == Torrent.State.DOWNLOADING
+
+    assert Episode.get_by_id(episode.id).state == Episode.State.WANTED
+    assert Episode.get_by_id(other.id).state == Episode.State.FETCHED
+    assert episode.id in wakeups
+    assert other.id not in wakeups
+
+
+GB = 1024**3
+
+DiskUsage = namedtuple("DiskUsage", ("total", "used", "free"))
+
+
+@pytest.fixture
+def seeding(episode, fetch, monkeypatch):
+    """
+    Seeding torrents with 1GB of free space on the input directory, see `_seed`.
+    """
+    monkeypatch.setitem(config._data, "seed_days", 0)
+    monkeypatch.setattr(
+        torrent_tasks.shutil, "disk_usage", lambda path: DiskUsage(0, 0, 1 * GB)
+    )
+
+    now = calendar.timegm(datetime.utcnow().utctimetuple())
+
+    def _seed(fetch_provider_id, done, seeded, size, processed=True):
+        # `done` counts seconds from a day ago, so nothing expires by default
+        fetch.report(
+            fetch_provider_id,
+            Torrent.State.SEEDING,
+            done_timestamp=now - 24 * 60 * 60 + done,
+            seconds_seeding=seeded,
+        )
+        return _torrent(
+            episode,
+            fetch_provider_id,
+            Torrent.State.SEEDING,
+            processed=processed,
+            total_size=size,
+        )
+
+    # Torrents can't be pruned before their media was placed in the library
+    busy = _seed("busy", done=50, seeded=2000, size=5 * GB)
+    ProcessJob.create(torrent=busy)
+    _seed("unprocessed", done=60, seeded=2000, size=5 * GB, processed=False)
+
+    _seed("old", done=100, seeded=800, size=1 * GB)
+    _seed("magnet", done=200, seeded=700, size=None)
+    _seed("new", done=300, seeded=900, size=int(1.5 * GB))
+    _seed("newest", done=400, seeded=1000, size=1 * GB)
+    return _seed
+
+
+def _prune(fetch, monkeypatch, **prune):
+    monkeypatch.setitem(config._data, "prune", prune)
+    prune_torrents()
+
+    completed = Torrent.select().where(Torrent.state == Torrent.State.COMPLETED)
+    assert sorted(i.fetch_provider_id for i in completed) == sum(fetch.removed, [])
+    return fetch.removed
+
+
+def test_prune_without_disk_pressure(seeding, fetch, monkeypatch):
+    assert _prune(fetch, monkeypatch) == []
+    assert _prune(fetch, monkeypatch, min_free_gb=1) == []
+
+
+def test_prune_oldest_until_enough_space_is_free(seeding, fetch, monkeypatch):
+    # Torrents without a size don't count towards the space we free
+    removed = _prune(fetch, monkeypatch, min_free_gb=3)
+    assert removed == [["magnet", "new", "old"]]
+
+
+def test_prune_longest_seeded_first(seeding, fetch, monkeypatch):
+    removed = _prune(fetch, monkeypatch, min_free_gb=3, order="seeded")
+    assert removed == [["new", "newest"]]
+
+
+def test_prune_expired_and_disk_pressure_in_one_removal(seeding, fetch, monkeypatch):
+    monkeypatch.setitem(config._data, "seed_days", 10)
+    expired = -timedelta(days=20).total_seconds()
+    seeding("expired", done=expired, seeded=0, size=1 * GB)
+
+    removed = _prune(fetch, monkeypatch, min_free_gb=2)
+    assert removed == [["expired", "old"]]
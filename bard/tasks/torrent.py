@@ -1,17 +1,50 @@
 import os
+import re
 import shutil
 import rarfile
 import logging
 import mimetypes
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import defaultdict
+
+from peewee import chunked
 
 from bard.app import config
 from bard.providers import providers
+from bard.models import with_connection
+from bard.models.episode import Episode
 from bard.models.torrent import Torrent
+from bard.models.job import ProcessJob
+from bard.models.payload import TorrentPayload
+from bard.models.writer import writer
+from bard.tasks.episode import schedule_episode_wakeups
+from bard.tasks.processing import (
+    enqueue_process_job,
+    filesystem_limits,
+    run_blocking,
+)
+from bard.util.placement import place_file, stream_file
+from bard.util.release import parse_release
 
 log = logging.getLogger(__name__)
 
+# Torrents are normally polled with a "recently-active" request, which only
+#  returns torrents with activity in the last minute. A full poll is still made
+#  periodically to catch any changes we missed, e.g. while we weren't running.
+FULL_POLL_INTERVAL = timedelta(minutes=15)
+
+_last_full_poll = None
+
+# Volumes of a new style multi-volume rar set (e.g. name.part01.rar)
+RAR_PART_RE = re.compile(r"\.part(\d+)\.rar$", re.IGNORECASE)
+
+# Volumes of an old style multi-volume rar set (name.rar, name.r00, name.r01...)
+RAR_VOLUME_RE = re.compile(r"\.r(?:ar|(\d+))$", re.IGNORECASE)
+
+# Rar sets within these directories hold extras rather than the episode itself
+RAR_EXTRA_DIRECTORIES = frozenset(["sample", "samples", "sub", "subs", "subtitles"])
+
 
 def _is_video_file(filename):
     mime, _ = mimetypes.guess_type(filename)
@@ -21,33 +54,205 @@ def _is_video_file(filename):
     return False
 
 
+def _group_by_fetch_provider_id(torrents):
+    # Multiple episodes may share a single fetched torrent (e.g. season packs)
+    grouped = defaultdict(list)
+    for torrent in torrents:
+        grouped[torrent.fetch_provider_id].append(torrent)
+    return grouped
+
+
 def update_torrents():
-    torrents = {
-        i.fetch_provider_id: i
-        for i in Torrent.select().where(
+    global _last_full_poll
+
+    torrents = _group_by_fetch_provider_id(
+        Torrent.select().where(
             (Torrent.state == Torrent.State.DOWNLOADING)
             | (Torrent.state == Torrent.State.SEEDING)
         )
-    }
+    )
     if not torrents:
         return
 
-    log.debug("Updating %s torrents that are DOWNLOADING or SEEDING", len(torrents))
+    now = datetime.utcnow()
+    recently_active = (
+        _last_full_poll is not None and now - _last_full_poll < FULL_POLL_INTERVAL
+    )
+    if not recently_active:
+        _last_full_poll = now
 
-    torrent_infos = list(providers.fetch.get_torrent_info(torrents.values()))
-    for torrent_info in torrent_infos:
-        torrent = torrents.pop(torrent_info.id)
+    log.debug(
+        "Updating %s torrents that are DOWNLOADING or SEEDING (recently_active=%s)",
+        len(torrents),
+        recently_active,
+    )
 
-        torrent.state = torrent_info.state
-        torrent.save()
+    torrent_infos = list(
+        providers.fetch.get_torrent_info(
+            [i[0] for i in torrents.values()], recently_active=recently_active
+        )
+    )
+
+    states = []
+    reported = []
+    for torrent_info in torrent_infos:
+        group = torrents.pop(torrent_info.id, None)
+        if group is None:
+            continue
+
+        reported.append(group)
+        states.extend((torrent, torrent_info.state) for torrent in group)
+
+    # Anything left after a full poll was removed from the fetch provider outside
+    #  of bard. Finished torrents are considered completed, while episodes whose
+    #  torrent disappeared mid-download are searched for again.
+    missing = []
+    if not recently_active:
+        for group in torrents.values():
+            for torrent in group:
+                if torrent.state == Torrent.State.SEEDING:
+                    state = Torrent.State.COMPLETED
+                else:
+                    state = Torrent.State.NONE
+
+                missing.append(torrent)
+                states.append((torrent, state))
+
+    changed, requeued = writer.write(_update_torrent_states, states, missing, reported)
+    if requeued:
+        schedule_episode_wakeups(requeued)
+
+    log.debug(
+        "Updated %s torrents, %s changed state and %s were missing",
+        len(states),
+        changed,
+        len(missing),
+    )
 
-        if not torrent.processed and torrent.state in (Torrent.State.SEEDING, Torrent.State.COMPLETED):
-            process_torrent(torrent, torrent_info.files)
+    completed = [group for group in reported if _needs_processing(group)]
+    if completed:
+        _process_completed_torrents(completed)
 
-    # TODO: check if we have anything left in torrents
     return len(torrent_infos)
 
 
+def _update_torrent_states(states, missing, reported):
+    changed = _apply_torrent_states(states)
+    requeued = []
+    if missing:
+        requeued = _requeue_missing_torrents(missing, reported)
+    return changed, requeued
+
+
+def _apply_torrent_states(states):
+    """
+    Applies a list of (torrent, state) pairs, writing only the torrents whose
+    state changed with a single UPDATE per state. Returns the number of changed
+    torrents.
+    """
+    changed = defaultdict(list)
+    for torrent, state in states:
+        if torrent.state != state:
+            torrent.state = state
+            changed[state].append(torrent.id)
+
+    for state, ids in changed.items():
+        for batch in chunked(ids, 500):
+            Torrent.update(state=state).where(Torrent.id << batch).execute()
+
+    return sum(len(ids) for ids in changed.values())
+
+
+def _requeue_missing_torrents(torrents, reported):
+    # Episodes with another torrent still in the fetch provider are left alone
+    active_episode_ids = {torrent.episode_id for group in reported for torrent in group}
+
+    episode_ids = []
+    for torrent in torrents:
+        log.warning(
+            "Torrent %s (%s) is missing from the fetch provider, marking as %s",
+            torrent.id,
+            torrent.fetch_provider_id,
+            torrent.state_readable,
+        )
+        if (
+            torrent.state == Torrent.State.NONE
+            and torrent.episode_id not in active_episode_ids
+        ):
+            episode_ids.append(torrent.episode_id)
+
+    for batch in chunked(episode_ids, 500):
+        Episode.update(state=Episode.State.WANTED).where(
+            (Episode.id << batch) & (Episode.state == Episode.State.FETCHED)
+        ).execute()
+    return episode_ids
+
+
+def _needs_processing(group):
+    return any(
+        not torrent.processed
+        and torrent.state in (Torrent.State.SEEDING, Torrent.State.COMPLETED)
+        for torrent in group
+    )
+
+
+def _process_completed_torrents(groups):
+    queued = 0
+
+    # File lists parsed from the torrent payload are used where we have them,
+    #  otherwise they're fetched for the torrents which just finished downloading.
+    missing = [group[0] for group in groups if group[0].files is None]
+    files = providers.fetch.get_torrent_files(missing) if missing else {}
+    for group in groups:
+        for torrent in group:
+            # Completion may be reported by both the done-script hook and polling,
+            #  so torrents are claimed atomically to avoid processing them twice.
+            claim = Torrent.update(processed=True).where(
+                (Torrent.id == torrent.id) & (Torrent.processed == False)  # noqa: E712
+            )
+            if writer.write(claim.execute):
+                torrent_files = torrent.files
+                if torrent_files is None:
+                    torrent_files = files.get(torrent.fetch_provider_id, [])
+                enqueue_process_job(torrent, torrent_files)
+                queued += 1
+    return queued
+
+
+@with_connection
+def complete_torrent(fetch_provider_id):
+    """
+    Updates and queues processing for the torrents of a fetched torrent as soon as
+    the fetch provider reports that it completed, instead of waiting for the next
+    poll. Returns the number of torrents which were queued for processing.
+    """
+    group = list(
+        Torrent.select().where(
+            (Torrent.fetch_provider_id == fetch_provider_id)
+            & (
+                (Torrent.state == Torrent.State.DOWNLOADING)
+                | (Torrent.state == Torrent.State.SEEDING)
+            )
+        )
+    )
+    if not group:
+        log.info("Completed torrent %s is not tracked", fetch_provider_id)
+        return 0
+
+    torrent_info = next(providers.fetch.get_torrent_info(group[:1]), None)
+    if torrent_info is None:
+        log.error("Fetch provider has no info for torrent %s", fetch_provider_id)
+        return 0
+
+    writer.write(
+        _apply_torrent_states, [(torrent, torrent_info.state) for torrent in group]
+    )
+    if not _needs_processing(group):
+        return 0
+
+    return _process_completed_torrents([group])
+
+
 def _get_result_path(torrent, ext=".mkv"):
     """
     Returns the resulting path for a givent torrent file
@@ -63,12 +268,7 @@ def _get_result_path(torrent, ext=".mkv"):
     )
 
 
-def _store_torrent_media(torrent, source_path, keep=False):
-    _, ext = os.path.splitext(source_path)
-    if not ext:
-        log.error("Unknown source_path extension: %s", source_path)
-        return
-
+def _make_result_path(torrent, ext):
     final_destination_path = _get_result_path(torrent, ext)
     final_destination_dir = os.path.dirname(final_destination_path)
 
@@ -76,11 +276,42 @@ def _store_torrent_media(torrent, source_path, keep=False):
     if not os.path.exists(final_destination_dir):
         os.mkdir(final_destination_dir)
 
+    return final_destination_path
+
+
+def _log_placement(torrent, result):
+    log.info(
+        "Placed torrent media (%s) via %s, copied %s of %s bytes in %.2fs"
+        " (%.1f MB/s)",
+        torrent.id,
+        result.strategy,
+        result.copied,
+        result.size,
+        result.seconds,
+        result.copied / max(result.seconds, 0.001) / (1024 * 1024),
+    )
+
+
+def _store_torrent_media(torrent, source_path, keep=False):
+    _, ext = os.path.splitext(source_path)
+    if not ext:
+        log.error("Unknown source_path extension: %s", source_path)
+        return
+
+    final_destination_path = _make_result_path(torrent, ext)
+
+    result = None
     try:
-        if keep:
-            shutil.copy(source_path, final_destination_path)
-        else:
-            os.rename(source_path, final_destination_path)
+        with filesystem_limits(source_path, final_destination_path):
+            if keep:
+                result = run_blocking(
+                    place_file,
+                    source_path,
+                    final_destination_path,
+                    config.get("directories.placement", "copy"),
+                )
+            else:
+                run_blocking(os.rename, source_path, final_destination_path)
     except Exception:
         log.exception(
             "Failed to store torrent media (%s) %s -> %s (keep=%s): ",
@@ -91,7 +322,74 @@ def _store_torrent_media(torrent, source_path, keep=False):
         )
         raise
 
-    os.chmod(final_destination_path, 0o777)
+    if result is not None:
+        _log_placement(torrent, result)
+
+    # Hardlinks share their mode with the file that's still being seeded, which
+    #  shouldn't be made world-writable.
+    if result is None or result.strategy != "hardlink":
+        os.chmod(final_destination_path, 0o777)
+
+
+def _rar_volume_number(rar_file):
+    match = RAR_PART_RE.search(rar_file)
+    if match:
+        return int(match.group(1))
+
+    # Old style sets start with the .rar volume, followed by .r00, .r01 and so on
+    number = RAR_VOLUME_RE.search(rar_file).group(1)
+    return -1 if number is None else int(number)
+
+
+def _rar_set_size(volumes):
+    size = 0
+    for volume in volumes:
+        try:
+            size += os.path.getsize(
+                os.path.join(config["directories"]["input"], volume)
+            )
+        except OSError:
+            pass
+    return size
+
+
+def _first_rar_volume(files):
+    """
+    Returns the first volume of the largest rar set within a torrents files,
+    which is the volume rarfile must be opened with to read members spanning
+    multiple volumes. Sets within sample or subtitle directories are only used
+    when there are no others. Returns None if the torrent has no rar files.
+    """
+    sets = defaultdict(list)
+    for name in files:
+        if not RAR_VOLUME_RE.search(name):
+            continue
+
+        if RAR_PART_RE.search(name):
+            key = RAR_PART_RE.sub("", name)
+        else:
+            key = RAR_VOLUME_RE.sub("", name)
+        sets[key].append(name)
+
+    # Sets without a .rar volume can't be opened
+    sets = {
+        key: volumes
+        for key, volumes in sets.items()
+        if any(i.lower().endswith(".rar") for i in volumes)
+    }
+    if not sets:
+        return None
+
+    candidates = [
+        volumes
+        for key, volumes in sets.items()
+        if not RAR_EXTRA_DIRECTORIES.intersection(key.lower().split("/")[:-1])
+    ] or list(sets.values())
+
+    volumes = max(candidates, key=_rar_set_size)
+    return min(
+        (i for i in volumes if i.lower().endswith(".rar")), key=_rar_volume_number
+    )
 
 
 def process_torrent(torrent, files):
@@ -99,16 +397,30 @@ def process_torrent(torrent, files):
 
     # Mark the torrent as processed now so nobody else tries to process
     torrent.processed = True
-    torrent.save()
+    writer.write(torrent.save, only=[Torrent.processed])
 
     # If the torrent contains a rar file attempt to unpack that
-    rar_files = [i for i in files if i.endswith(".rar")]
-    if len(rar_files):
+    rar_file = _first_rar_volume(files)
+    if rar_file is not None:
         log.debug("Found rar file in torrent %s, unpacking...", torrent.id)
-        unpack_torrent(torrent, rar_files[0])
+        unpack_torrent(torrent, rar_file)
         return
 
     video_files = [i for i in files if _is_video_file(i)]
+
+    # Torrents which contain multiple episodes (e.g. season packs) are narrowed
+    #  down to the file for this torrents episode.
+    if len(video_files) > 1:
+        episode = torrent.episode
+        season_episode = (str(int(episode.season.number)), (str(int(episode.number)),))
+        episode_files = []
+        for video_file in video_files:
+            release = parse_release(os.path.basename(video_file))
+            if (release.season, release.episodes) == season_episode:
+                episode_files.append(video_file)
+        if len(episode_files) == 1:
+            video_files = episode_files
+
     if len(video_files) == 1:
         log.debug(
             "Found video file in torrent %s, moving and reverse symlinking",
@@ -132,7 +444,7 @@ def unpack_torrent(torrent, rar_file):
 
     rf = rarfile.RarFile(full_path)
 
-    video_files = [i for i in rf.namelist() if _is_video_file(i)]
+    video_files = [i for i in rf.infolist() if _is_video_file(i.filename)]
     if len(video_files) != 1:
         log.error(
             "Failed to find video file to unpack from rar %s (%s)",
@@ -141,32 +453,140 @@ def unpack_torrent(torrent, rar_file):
         )
         return
 
-    temporary_dir = config["directories"]["temporary"]
-    rf.extract(video_files[0], temporary_dir)
-    _store_torrent_media(torrent, os.path.join(temporary_dir, video_files[0]))
+    member = video_files[0]
+    _, ext = os.path.splitext(member.filename)
+    final_destination_path = _make_result_path(torrent, ext)
+
+    # The member is streamed straight into the output directory (reading across
+    #  volumes as needed), instead of being extracted into the temporary
+    #  directory and then moved, which is a second full copy across filesystems.
+    def _extract():
+        with rf.open(member) as fileobj:
+            return stream_file(
+                fileobj, final_destination_path, member.file_size, member.CRC
+            )
 
+    try:
+        with filesystem_limits(full_path, final_destination_path):
+            result = run_blocking(_extract)
+    except Exception:
+        log.exception(
+            "Failed to unpack torrent media (%s) %s:%s -> %s: ",
+            torrent.id,
+            full_path,
+            member.filename,
+            final_destination_path,
+        )
+        raise
+
+    _log_placement(torrent, result)
+    os.chmod(final_destination_path, 0o777)
 
-def prune_torrents():
-    if not config["seed_days"]:
-        return
 
-    seeding = {
-        i.fetch_provider_id: i
-        for i in Torrent.select().where((Torrent.state == Torrent.State.SEEDING))
+def _select_for_disk_pressure(seeding, torrent_infos, exclude):
+    """
+    Returns the fetch provider ids of the seeding torrents to prune so that the
+    input directory gets back above `prune.min_free_gb` of free space, ordered by
+    the `prune.order` policy (`oldest` first, or `seeded` for the torrents which
+    have seeded the longest first).
+    """
+    min_free_gb = config.get("prune.min_free_gb")
+    if not min_free_gb:
+        return []
+
+    usage = shutil.disk_usage(config["directories"]["input"])
+    needed = min_free_gb * 1024**3 - usage.free
+    if needed <= 0:
+        return []
+
+    # Torrents can't be pruned until their media has been placed in the library
+    processing = {
+        job.torrent_id
+        for job in ProcessJob.select(ProcessJob.torrent).where(
+            ProcessJob.state << (ProcessJob.State.PENDING, ProcessJob.State.RUNNING)
+        )
     }
 
-    torrent_infos = providers.fetch.get_torrent_info(seeding.values())
-    for info in torrent_infos:
-        approx_seeding_duration = (
-            datetime.utcnow() - info.done_date.replace(tzinfo=None)
-        ).days
-        if approx_seeding_duration > config["seed_days"]:
-            log.info(
-                "Pruning torrent %s which has seeded for %s days (%ss)",
-                info.id,
-                approx_seeding_duration,
-                info.seconds_seeding,
-            )
-            seeding[info.id].state = Torrent.State.COMPLETED
-            seeding[info.id].save()
-            providers.fetch.remove(seeding[info.id])
+    candidates = [
+        info
+        for info in torrent_infos
+        if info.id not in exclude
+        and all(
+            torrent.processed and torrent.id not in processing
+            for torrent in seeding[info.id]
+        )
+    ]
+
+    if config.get("prune.order", "oldest") == "seeded":
+        candidates.sort(key=lambda i: i.seconds_seeding, reverse=True)
+    else:
+        candidates.sort(key=lambda i: i.done_timestamp or float("inf"))
+
+    selected = []
+    for info in candidates:
+        if needed <= 0:
+            break
+
+        selected.append(info.id)
+        # Torrents without a known size (e.g. magnets) don't count towards the
+        #  space we expect to free.
+        needed -= max(torrent.total_size or 0 for torrent in seeding[info.id])
+
+    log.info(
+        "Free space on %s is %.1fGB (below %sGB), pruning %s torrents",
+        config["directories"]["input"],
+        usage.free / 1024**3,
+        min_free_gb,
+        len(selected),
+    )
+    return selected
+
+
+def prune_torrents():
+    seeding = _group_by_fetch_provider_id(
+        Torrent.select().where((Torrent.state == Torrent.State.SEEDING))
+    )
+
+    torrent_infos = []
+    if seeding:
+        torrent_infos = list(
+            providers.fetch.get_torrent_info([i[0] for i in seeding.values()])
+        )
+
+    expired = []
+    if config["seed_days"]:
+        for info in torrent_infos:
+            if info.done_date is None:
+                continue
+
+            approx_seeding_duration = (
+                datetime.utcnow() - info.done_date.replace(tzinfo=None)
+            ).days
+            if approx_seeding_duration > config["seed_days"]:
+                log.info(
+                    "Pruning torrent %s which has seeded for %s days (%ss)",
+                    info.id,
+                    approx_seeding_duration,
+                    info.seconds_seeding,
+                )
+                expired.append(info.id)
+
+    pruned = expired + _select_for_disk_pressure(
+        seeding, torrent_infos, exclude=set(expired)
+    )
+    if pruned:
+        writer.write(
+            _apply_torrent_states,
+            [
+                (torrent, Torrent.State.COMPLETED)
+                for fetch_provider_id in pruned
+                for torrent in seeding[fetch_provider_id]
+            ],
+        )
+
+        # Removals are batched into a single request to the fetch provider
+        providers.fetch.remove_many([seeding[i][0] for i in pruned])
+
+    pruned_payloads = writer.write(TorrentPayload.prune)
+    if pruned_payloads:
+        log.info("Pruned %s unreferenced torrent payloads", pruned_payloads)
@@ -9,9 +9,34 @@ True
 42
 """
 
-import re
-import string
-import itertools as it
+_DIGITS = frozenset(b"0123456789")
+
+
+def _encode(obj, buf):
+    if isinstance(obj, int):
+        buf += b"i%de" % obj
+    elif isinstance(obj, bytes):
+        buf += b"%d:" % len(obj)
+        buf += obj
+    elif isinstance(obj, str):
+        _encode(obj.encode("ascii"), buf)
+    elif isinstance(obj, list):
+        buf += b"l"
+        for item in obj:
+            _encode(item, buf)
+        buf += b"e"
+    elif isinstance(obj, dict):
+        if not all(isinstance(i, bytes) for i in obj.keys()):
+            raise ValueError("dict keys should be bytes")
+
+        buf += b"d"
+        for key in sorted(obj):
+            buf += b"%d:" % len(key)
+            buf += key
+            _encode(obj[key], buf)
+        buf += b"e"
+    else:
+        raise ValueError("Allowed types: int, bytes, list, dict; not %s", type(obj))
 
 
 def encode(obj):
@@ -28,23 +53,89 @@ def encode(obj):
             == b'd3:bar4:spam3:fooi42e4:messli1e1:cee'
     True
     """
+    buf = bytearray()
+    _encode(obj, buf)
+    return bytes(buf)
 
-    if isinstance(obj, int):
-        return b"i" + str(obj).encode() + b"e"
-    elif isinstance(obj, bytes):
-        return str(len(obj)).encode() + b":" + obj
-    elif isinstance(obj, str):
-        return encode(obj.encode("ascii"))
-    elif isinstance(obj, list):
-        return b"l" + b"".join(map(encode, obj)) + b"e"
-    elif isinstance(obj, dict):
-        if all(isinstance(i, bytes) for i in obj.keys()):
-            items = list(obj.items())
-            items.sort()
-            return b"d" + b"".join(map(encode, it.chain(*items))) + b"e"
-        else:
-            raise ValueError("dict keys should be bytes")
-    raise ValueError("Allowed types: int, bytes, list, dict; not %s", type(obj))
+
+class _Decoder(object):
+    """
+    Decodes a bencoded buffer by walking it with an index, so every token is read
+    in place rather than re-slicing the rest of the buffer.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.length = len(data)
+
+    def decode(self, idx):
+        try:
+            token = self.data[idx]
+        except IndexError:
+            raise ValueError("Malformed input.")
+
+        if token in _DIGITS:
+            return self.decode_bytes(idx)
+        elif token == 0x69:  # i
+            return self.decode_int(idx)
+        elif token == 0x6C:  # l
+            return self.decode_list(idx)
+        elif token == 0x64:  # d
+            return self.decode_dict(idx)
+        raise ValueError("Malformed input.")
+
+    def decode_int(self, idx):
+        end = self.data.find(b"e", idx)
+        value = self.data[idx + 1 : end]
+        if end == -1 or not value.lstrip(b"-").isdigit():
+            raise ValueError("Malformed input.")
+        return int(value), end + 1
+
+    def decode_bytes(self, idx):
+        colon = self.data.find(b":", idx)
+        length = self.data[idx:colon]
+        if colon == -1 or not length.isdigit():
+            raise ValueError("Malformed input.")
+
+        start = colon + 1
+        end = start + int(length)
+        if end > self.length:
+            raise ValueError("Malformed input.")
+        return self.data[start:end], end
+
+    def decode_list(self, idx):
+        items = []
+        idx += 1
+        while self.data[idx : idx + 1] != b"e":
+            item, idx = self.decode(idx)
+            items.append(item)
+        return items, idx + 1
+
+    def decode_dict(self, idx, spans=None):
+        """
+        Decodes a dict, recording the (start, end) offsets of each value whose key
+        is in `spans` (e.g. the info dict, whose raw bytes we hash).
+        """
+        result = {}
+        idx += 1
+        while self.data[idx : idx + 1] != b"e":
+            key, idx = self.decode(idx)
+            if not isinstance(key, bytes):
+                raise ValueError("Malformed input.")
+
+            start = idx
+            result[key], idx = self.decode(idx)
+            if spans is not None and key in spans:
+                spans[key] = (start, idx)
+        return result, idx + 1
+
+
+def _decoder_for(s):
+    # Values are sliced out of the buffer, so memoryviews are converted once
+    #  rather than returning views into the caller's buffer.
+    if isinstance(s, (memoryview, bytearray)):
+        s = bytes(s)
+    return _Decoder(s)
 
 
 def decode(s):
@@ -59,33 +150,33 @@ def decode(s):
     >>> decode(b'd3:bar4:spam3:fooi42ee') == {b'bar': b'spam', b'foo': 42}
     True
     """
+    decoder = _decoder_for(s)
+    ret, end = decoder.decode(0)
+    if end != decoder.length:
+        raise ValueError("Malformed input.")
+    return ret
 
-    def decode_first(s):
-        if s.startswith(b"i"):
-            match = re.match(b"i(-?\\d+)e", s)
-            return int(match.group(1)), s[match.span()[1] :]
-        elif s.startswith(b"l") or s.startswith(b"d"):
-            l = []
-            rest = s[1:]
-            while not rest.startswith(b"e"):
-                elem, rest = decode_first(rest)
-                l.append(elem)
-            rest = rest[1:]
-            if s.startswith(b"l"):
-                return l, rest
-            else:
-                return {i: j for i, j in zip(l[::2], l[1::2])}, rest
-        elif any(s.startswith(i.encode()) for i in string.digits):
-            m = re.match(b"(\\d+):", s)
-            length = int(m.group(1))
-            rest_i = m.span()[1]
-            start = rest_i
-            end = rest_i + length
-            return s[start:end], s[end:]
-        else:
-            raise ValueError("Malformed input.")
 
-    ret, rest = decode_first(s)
-    if rest:
+def decode_torrent(s):
+    """
+    Decodes a bencoded torrent (metainfo) dict, returning it along with the raw
+    bytes of its info dict exactly as they appear in the payload, which is what
+    the infohash is calculated from. The info bytes are None if it has no info.
+    >>> metainfo, info = decode_torrent(b'd4:infod4:name1:xee')
+    >>> metainfo == {b'info': {b'name': b'x'}}, bytes(info) == b'd4:name1:xe'
+    (True, True)
+    """
+    decoder = _decoder_for(s)
+    if decoder.data[:1] != b"d":
+        raise ValueError("Malformed input.")
+
+    spans = {b"info": None}
+    ret, end = decoder.decode_dict(0, spans)
+    if end != decoder.length:
         raise ValueError("Malformed input.")
-    return ret
+
+    info = None
+    if spans[b"info"] is not None:
+        start, end = spans[b"info"]
+        info = memoryview(decoder.data)[start:end]
+    return ret, info
@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """
+    A least-recently-used cache whose entries expire `ttl` seconds after being
+    set. The cache may be bounded by its number of entries, and by the total
+    size of its values as calculated by `sizeof` (e.g. `len` for bytes).
+    """
+
+    def __init__(self, ttl, max_entries=None, max_size=None, sizeof=len, clock=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self._sizeof = sizeof
+        self._clock = clock or time.time
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value, _ = entry
+        if expires_at <= self._clock():
+            self.invalidate(key)
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.invalidate(key)
+
+        size = self._sizeof(value) if self.max_size is not None else 0
+        if self.max_size is not None and size > self.max_size:
+            return
+
+        self._data[key] = (self._clock() + self.ttl, value, size)
+        self.size += size
+
+        while (self.max_entries is not None and len(self._data) > self.max_entries) or (
+            self.max_size is not None and self.size > self.max_size
+        ):
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self.size -= evicted_size
+
+    def invalidate(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
@@ -0,0 +1,212 @@
+import os
+import sys
+import time
+import zlib
+import errno
+import shutil
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Strategies for placing a file at its destination, from cheapest to most
+#  expensive. A strategy that can't be used falls back to the next one.
+STRATEGIES = ("hardlink", "reflink", "copy_file_range", "copy")
+
+# Strategies which only work within a single filesystem
+SAME_FILESYSTEM_STRATEGIES = frozenset(["hardlink", "reflink"])
+
+# Errors raised when a strategy isn't supported by the platform or filesystem
+FALLBACK_ERRNOS = frozenset(
+    [
+        errno.EXDEV,
+        errno.EPERM,
+        errno.EMLINK,
+        errno.EINVAL,
+        errno.ENOSYS,
+        errno.ENOTTY,
+        errno.EOPNOTSUPP,
+        getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+    ]
+)
+
+# From linux/fs.h
+FICLONE = 0x40049409
+
+COPY_CHUNK_SIZE = 1024 * 1024 * 8
+
+PlacementResult = namedtuple(
+    "PlacementResult", ("strategy", "size", "copied", "seconds")
+)
+
+
+class PlacementUnsupported(Exception):
+    pass
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def same_filesystem(source_path, destination_dir):
+    return os.stat(source_path).st_dev == os.stat(destination_dir).st_dev
+
+
+def _unsupported(e):
+    return isinstance(e, PlacementUnsupported) or (
+        isinstance(e, OSError) and e.errno in FALLBACK_ERRNOS
+    )
+
+
+def _preallocate(fd, size):
+    if not size or not hasattr(os, "posix_fallocate"):
+        return
+
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError as e:
+        if e.errno not in FALLBACK_ERRNOS:
+            raise
+
+
+def _hardlink(source, destination, size):
+    os.link(source, destination)
+    return 0
+
+
+def _reflink(source, destination, size):
+    if fcntl is None:
+        raise PlacementUnsupported("reflinks are not supported on this platform")
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    return 0
+
+
+def _sendfile_range(src, dst, count):
+    return os.sendfile(dst, src, None, count)
+
+
+def _copy_file_range(source, destination, size):
+    copy_range = getattr(os, "copy_file_range", None)
+    if copy_range is None:
+        # Before Python 3.8 we fall back to sendfile, which can copy between
+        #  regular files on Linux.
+        if not sys.platform.startswith("linux"):
+            raise PlacementUnsupported("copy_file_range is not supported")
+        copy_range = _sendfile_range
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        _preallocate(dst.fileno(), size)
+
+        copied = 0
+        while copied < size:
+            sent = copy_range(src.fileno(), dst.fileno(), size - copied)
+            if not sent:
+                raise PlacementUnsupported(
+                    "copy_file_range stopped after a partial copy"
+                )
+            copied += sent
+    return copied
+
+
+def _copy(source, destination, size):
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        _preallocate(dst.fileno(), size)
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+    return size
+
+
+STRATEGY_FUNCTIONS = {
+    "hardlink": _hardlink,
+    "reflink": _reflink,
+    "copy_file_range": _copy_file_range,
+    "copy": _copy,
+}
+
+
+def place_file(source, destination, strategy="copy"):
+    """
+    Places a copy of `source` at `destination` (replacing any existing file) using
+    the given strategy, falling back to the next cheapest strategy when it isn't
+    supported, e.g. when hardlinking across filesystems. The destination is only
+    replaced once the file was placed in full.
+
+    Returns a PlacementResult with the strategy that was used, the size of the
+    file and how many bytes had to be copied.
+    """
+    if strategy not in STRATEGY_FUNCTIONS:
+        raise ValueError("Unknown placement strategy `{}`".format(strategy))
+
+    start = time.time()
+    size = os.stat(source).st_size
+    partial = destination + ".partial"
+
+    shared = same_filesystem(source, os.path.dirname(os.path.abspath(destination)))
+
+    for name in STRATEGIES[STRATEGIES.index(strategy) :]:
+        if name in SAME_FILESYSTEM_STRATEGIES and not shared:
+            continue
+
+        if os.path.lexists(partial):
+            os.unlink(partial)
+
+        try:
+            copied = STRATEGY_FUNCTIONS[name](source, partial, size)
+        except Exception as e:
+            if os.path.lexists(partial):
+                os.unlink(partial)
+            if not _unsupported(e) or name == "copy":
+                raise
+            continue
+
+        os.replace(partial, destination)
+        return PlacementResult(name, size, copied, time.time() - start)
+
+
+def stream_file(fileobj, destination, size=None, crc=None):
+    """
+    Streams the contents of `fileobj` (e.g. an archive member) into a file at
+    `destination`, calculating its CRC32 on the way. The destination is only
+    replaced once the data was written in full and matched the expected `crc`.
+
+    Returns a PlacementResult, as with `place_file`.
+    """
+    start = time.time()
+    partial = destination + ".partial"
+
+    copied = 0
+    checksum = 0
+    try:
+        with open(partial, "wb") as dst:
+            _preallocate(dst.fileno(), size)
+
+            while True:
+                chunk = fileobj.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                checksum = zlib.crc32(chunk, checksum)
+                dst.write(chunk)
+                copied += len(chunk)
+
+            # Preallocated space past the end of a short stream is released here
+            dst.truncate(copied)
+
+        if size is not None and copied != size:
+            raise ChecksumMismatch(
+                "Expected {} bytes but streamed {}".format(size, copied)
+            )
+
+        if crc is not None and checksum != crc:
+            raise ChecksumMismatch(
+                "CRC mismatch, expected {:08x} got {:08x}".format(crc, checksum)
+            )
+    except Exception:
+        if os.path.lexists(partial):
+            os.unlink(partial)
+        raise
+
+    os.replace(partial, destination)
+    return PlacementResult("stream", copied, copied, time.time() - start)
@@ -0,0 +1,152 @@
+import re
+from functools import lru_cache
+from collections import namedtuple
+
+ReleaseInfo = namedtuple(
+    "ReleaseInfo",
+    (
+        "name",
+        "season",
+        "episodes",
+        "resolution",
+        "source",
+        "codec",
+        "group",
+        "proper",
+        "repack",
+    ),
+)
+
+# All patterns are matched against the lowercased release title
+SEASON_EPISODE_RE = re.compile(
+    r"(?<![a-z0-9])s(\d{1,2})(?:e(\d{1,3})(?:-?e?(\d{1,3}))?)?(?![a-z0-9])"
+)
+CROSS_EPISODE_RE = re.compile(r"(?<![a-z0-9])(\d{1,2})x(\d{2,3})(?![a-z0-9])")
+RESOLUTION_RE = re.compile(r"(?<![a-z0-9])(?:(\d{3,4})[pi]|(4k|uhd))(?![a-z0-9])")
+SOURCE_RE = re.compile(
+    r"(?<![a-z0-9])(web-?dl|web-?rip|web|hdtv|blu-?ray|bdrip|brrip|dvdrip)(?![a-z0-9])"
+)
+CODEC_RE = re.compile(r"(?<![a-z0-9])(x26[45]|h\.?26[45]|hevc|avc|xvid)(?![a-z0-9])")
+PROPER_RE = re.compile(r"(?<![a-z0-9])proper(?![a-z0-9])")
+REPACK_RE = re.compile(r"(?<![a-z0-9])(?:repack|rerip)(?![a-z0-9])")
+EXTENSION_RE = re.compile(r"\.(?:mkv|mp4|avi|m4v|ts|torrent)$")
+SUFFIX_GROUP_RE = re.compile(r"-([a-z0-9]+)(?:\[[^\]]*\])?$")
+PREFIX_GROUP_RE = re.compile(r"^\[([^\]]+)\]")
+NAME_SEPARATOR_RE = re.compile(r"[^a-z0-9]+")
+TRAILING_YEAR_RE = re.compile(r" (19|20)\d\d$")
+
+SOURCES = {
+    "webdl": "WEB-DL",
+    "web-dl": "WEB-DL",
+    "webrip": "WEBRip",
+    "web-rip": "WEBRip",
+    "web": "WEB",
+    "hdtv": "HDTV",
+    "bluray": "BluRay",
+    "blu-ray": "BluRay",
+    "bdrip": "BluRay",
+    "brrip": "BluRay",
+    "dvdrip": "DVD",
+}
+
+CODECS = {
+    "x264": "h264",
+    "h264": "h264",
+    "h.264": "h264",
+    "avc": "h264",
+    "x265": "h265",
+    "h265": "h265",
+    "h.265": "h265",
+    "hevc": "h265",
+    "xvid": "xvid",
+}
+
+
+def normalize_series_name(name):
+    """
+    Normalizes a series name so that names from release titles (which use dots,
+    dashes or spaces interchangeably) can be compared against our series names.
+    """
+    name = name.lower().replace("'", "").replace("&", "and")
+    return NAME_SEPARATOR_RE.sub(" ", name).strip()
+
+
+def series_name_variants(name):
+    """
+    Returns the normalized names a release of the given series could be listed
+    under, which includes the name without any trailing year.
+    """
+    name = normalize_series_name(name)
+    return {name, TRAILING_YEAR_RE.sub("", name)}
+
+
+def _parse_season_episodes(title):
+    match = SEASON_EPISODE_RE.search(title)
+    if match:
+        season, first, last = match.groups()
+        if first is None:
+            return match, str(int(season)), None
+    else:
+        match = CROSS_EPISODE_RE.search(title)
+        if not match:
+            return None, None, None
+        season, first = match.groups()
+        last = None
+
+    episodes = range(int(first), int(last or first) + 1)
+    return match, str(int(season)), tuple(str(i) for i in episodes)
+
+
+def parse_resolution(title):
+    """
+    Returns the normalized resolution (e.g. 1080p) within a lowercased release
+    title, or None if it doesn't contain one.
+    """
+    match = RESOLUTION_RE.search(title)
+    if not match:
+        return None
+    return "2160p" if match.group(2) else match.group(1) + "p"
+
+
+@lru_cache(maxsize=16384)
+def parse_release(title):
+    """
+    Parses a release title into a ReleaseInfo. The name is the normalized series
+    name (without any trailing year), and is None if the title does not contain
+    a season. Episodes are None for full season packs. Results are memoized as
+    the same titles are parsed by selection, matching and the dashboard.
+    """
+    title = EXTENSION_RE.sub("", title.strip().lower())
+
+    source = SOURCE_RE.search(title)
+
+    group = None
+    match = PREFIX_GROUP_RE.match(title)
+    if match:
+        group = match.group(1)
+        title = title[match.end() :]
+    else:
+        # Titles without a group may end in a dashed source (e.g. WEB-DL)
+        match = SUFFIX_GROUP_RE.search(title)
+        if match and not (source and source.end() == len(title)):
+            group = match.group(1)
+
+    name = None
+    match, season, episodes = _parse_season_episodes(title)
+    if match:
+        name = TRAILING_YEAR_RE.sub("", normalize_series_name(title[: match.start()]))
+
+    resolution = parse_resolution(title)
+    codec = CODEC_RE.search(title)
+
+    return ReleaseInfo(
+        name=name or None,
+        season=season,
+        episodes=episodes,
+        resolution=resolution,
+        source=SOURCES[source.group(1)] if source else None,
+        codec=CODECS[codec.group(1)] if codec else None,
+        group=group,
+        proper=PROPER_RE.search(title) is not None,
+        repack=REPACK_RE.search(title) is not None,
+    )
@@ -0,0 +1,174 @@
+import re
+from functools import lru_cache
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from bard.constants import QUALITIES
+from bard.util.release import parse_release
+
+# The release tags a title is scored by, matched on the same token boundaries as
+#  `parse_release` (titles are prefixed with a separator so that a tag may start
+#  the title). The separator is consumed while the tag's end is only looked
+#  ahead at, so that consecutive tags (e.g. .1080p.proper.) both match.
+SCORED_TAGS_RE = re.compile(
+    r"[^a-z0-9](\d{3,4}[pi]|4k|uhd|proper|repack|rerip)(?![a-z0-9])"
+)
+
+PROPER_TAGS = frozenset(["proper", "repack", "rerip"])
+
+
+class TorrentScorer(object):
+    """
+    Selects the optimal torrent out of a batch of search results based on the
+    `quality` configuration. The configuration is compiled once into a pattern
+    matching every scored release tag and a table of their weights, which rank
+    each torrent by its resolution, preferred keywords, PROPER/REPACK status and
+    finally seeders.
+    """
+
+    def __init__(self, quality_config):
+        self.desired_quality = quality_config.get("desired") or None
+
+        self.max_wait = None
+        if quality_config.get("max_wait_minutes"):
+            self.max_wait = timedelta(minutes=quality_config["max_wait_minutes"])
+
+        # Keywords are matched against lowercased titles with plain substring
+        #  checks, which are considerably faster than regex searches.
+        self._keywords = tuple(
+            i.lower() for i in (quality_config.get("preferred_keywords") or ())
+        )
+
+        # Qualities are ranked from highest to lowest, except for our desired
+        #  quality which always ranks first.
+        qualities = list(reversed(QUALITIES))
+        if self.desired_quality:
+            self.desired_quality = self.desired_quality.lower()
+            if self.desired_quality in qualities:
+                qualities.remove(self.desired_quality)
+            qualities.insert(0, self.desired_quality)
+
+        self._quality_ranks = {
+            quality: len(qualities) - idx for idx, quality in enumerate(qualities)
+        }
+        self._desired_rank = len(qualities)
+
+        # The rank of every resolution tag, as `parse_release` would normalize it
+        self._tag_ranks = {}
+        for quality, rank in self._quality_ranks.items():
+            if re.match(r"^\d{3,4}p$", quality):
+                self._tag_ranks[quality] = self._tag_ranks[quality[:-1] + "i"] = rank
+        uhd_rank = self._quality_ranks.get("2160p")
+        if uhd_rank:
+            self._tag_ranks["4k"] = self._tag_ranks["uhd"] = uhd_rank
+
+        # Titles can only be at a rank if they contain one of its tags, which is
+        #  much cheaper to check for than scoring the title (see `_best_ranked`).
+        #  Resolutions are checked for by their digits, which covers both their
+        #  progressive and interlaced tags.
+        rank_hints = defaultdict(set)
+        for tag, rank in self._tag_ranks.items():
+            rank_hints[rank].add(tag[:-1] if tag[-1] in "pi" else tag)
+        self._rank_hints = sorted(
+            ((rank, tuple(sorted(hints))) for rank, hints in rank_hints.items()),
+            reverse=True,
+        )
+
+        # Search results are largely the same between searches, so we memoize the
+        #  title scores.
+        self.score_title = lru_cache(maxsize=8192)(self._score_title)
+
+    def _score_title(self, title):
+        """
+        Returns the (quality rank, has preferred keyword, is proper/repack) score
+        for a torrent title.
+        """
+        lowered = title.strip().lower()
+
+        tagged = "." + lowered
+        if lowered.startswith("["):
+            # Prefixed release groups (e.g. [720p]) are stripped when parsing
+            end = lowered.find("]")
+            if end > 1:
+                tagged = "." + lowered[end + 1 :]
+
+        quality_rank = None
+        proper = 0
+        for tag in SCORED_TAGS_RE.findall(tagged):
+            if tag in PROPER_TAGS:
+                proper = 1
+            elif quality_rank is None:
+                # Only the first resolution within a title counts
+                quality_rank = self._tag_ranks.get(tag, 0)
+
+        keyword = 0
+        for keyword_value in self._keywords:
+            if keyword_value in lowered:
+                keyword = 1
+                break
+
+        return quality_rank or 0, keyword, proper
+
+    def _best_ranked(self, torrents):
+        """
+        Returns the highest quality rank among the given torrents, and the
+        torrents at that rank. Ranks are looked at from the highest down, only
+        scoring the titles which contain one of a rank's tags.
+        """
+        titles = [torrent.title.lower() for torrent in torrents]
+        for rank, hints in self._rank_hints:
+            candidates = set()
+            for hint in hints:
+                candidates.update(
+                    idx for idx, title in enumerate(titles) if hint in title
+                )
+
+            ranked = [
+                torrents[idx]
+                for idx in sorted(candidates)
+                if self.score_title(torrents[idx].title)[0] == rank
+            ]
+            if ranked:
+                return rank, ranked
+
+        # Any torrent with a rank would've been found above
+        return 0, torrents
+
+    def _in_quality_window(self, episode, now):
+        if self.max_wait is None or not episode.airdate:
+            return False
+        return now < episode.airdate + self.max_wait
+
+    def select(self, episode, torrents, exclude=None, now=None):
+        """
+        Returns the optimal torrent for the given episode, or None if no torrent
+        is acceptable yet.
+
+        :param exclude: a set of (provider, provider_id) tuples to ignore, e.g.
+            torrents we've already fetched for this episode.
+        """
+        if exclude:
+            torrents = [
+                i for i in torrents if (i.provider, i.provider_id) not in exclude
+            ]
+
+        if not torrents:
+            return None
+
+        score_title = self.score_title
+
+        if self.desired_quality is None:
+            return max(
+                torrents, key=lambda i: (score_title(i.title)[1], int(i.seeders))
+            )
+
+        rank, torrents = self._best_ranked(torrents)
+
+        # If we're still in the time window defined by max_wait_minutes, we won't
+        #  accept torrents that are not at our desired quality.
+        if rank != self._desired_rank and self._in_quality_window(
+            episode, now or datetime.utcnow()
+        ):
+            return None
+
+        return max(torrents, key=lambda i: score_title(i.title) + (int(i.seeders),))
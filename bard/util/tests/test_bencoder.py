@@ -0,0 +1,43 @@
+import hashlib
+
+import pytest
+
+from bard.util.bencoder import decode, decode_torrent, encode
+
+
+def test_roundtrip():
+    value = {
+        b"announce": b"http://tracker/announce",
+        b"info": {
+            b"files": [{b"length": 1024, b"path": [b"a", b"b.mkv"]}],
+            b"name": b"torrent",
+            b"piece length": 262144,
+            b"pieces": bytes(range(256)) * 4,
+        },
+        b"list": [-1, 0, b"", []],
+    }
+
+    assert decode(encode(value)) == value
+    assert decode(memoryview(encode(value))) == value
+
+
+def test_decode_torrent_info_span():
+    # Keys are out of order, so re-encoding the info dict would change its hash
+    info = b"d4:name1:x6:lengthi1ee"
+    raw = b"d8:announce1:a4:info" + info + b"e"
+
+    metainfo, info_bytes = decode_torrent(raw)
+    assert metainfo[b"info"] == {b"name": b"x", b"length": 1}
+    assert bytes(info_bytes) == info
+    assert hashlib.sha1(info_bytes).digest() == hashlib.sha1(info).digest()
+
+    assert decode_torrent(b"d8:announce1:ae") == ({b"announce": b"a"}, None)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [b"", b"i42", b"ie", b"i4x2e", b"5:abc", b"l1:a", b"di1ei2ee", b"i1ei2e", b"x"],
+)
+def test_decode_malformed(value):
+    with pytest.raises(ValueError):
+        decode(value)
@@ -0,0 +1,59 @@
+from bard.util.cache import TTLCache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    clock.now = 10
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_max_entries_evicts_least_recently_used():
+    cache = TTLCache(ttl=10, max_entries=2)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_max_size():
+    cache = TTLCache(ttl=10, max_size=8)
+
+    cache.set("a", b"1234")
+    cache.set("b", b"5678")
+    assert cache.size == 8
+
+    cache.set("c", b"90")
+    assert "a" not in cache
+    assert cache.size == 6
+
+    # Values larger than the cache itself are never stored
+    cache.set("d", b"123456789")
+    assert "d" not in cache
+
+
+def test_invalidate():
+    cache = TTLCache(ttl=10, max_size=8)
+    cache.set("a", b"1234")
+    cache.invalidate("a")
+
+    assert "a" not in cache
+    assert cache.size == 0
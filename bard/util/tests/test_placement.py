@@ -0,0 +1,88 @@
+import io
+import os
+import zlib
+import errno
+
+import pytest
+
+from bard.util import placement
+from bard.util.placement import ChecksumMismatch, place_file, stream_file
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.mkv"
+    path.write_bytes(os.urandom(1024 * 64))
+    return str(path)
+
+
+def test_place_file_hardlink(tmp_path, source):
+    destination = str(tmp_path / "destination.mkv")
+
+    result = place_file(source, destination, "hardlink")
+    assert result.strategy == "hardlink"
+    assert result.size == 1024 * 64
+    assert result.copied == 0
+    assert os.path.samefile(source, destination)
+
+
+@pytest.mark.parametrize("strategy", ["copy_file_range", "copy"])
+def test_place_file_copy(tmp_path, source, strategy):
+    destination = tmp_path / "destination.mkv"
+    destination.write_bytes(b"existing")
+
+    result = place_file(source, str(destination), strategy)
+    assert result.strategy == strategy
+    assert result.copied == 1024 * 64
+    assert not os.path.samefile(source, str(destination))
+    assert destination.read_bytes() == open(source, "rb").read()
+    assert not os.path.exists(str(destination) + ".partial")
+
+
+def test_place_file_fallback(tmp_path, source, monkeypatch):
+    def _cross_device(*args):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(
+        placement, "STRATEGY_FUNCTIONS", dict(placement.STRATEGY_FUNCTIONS)
+    )
+    placement.STRATEGY_FUNCTIONS["hardlink"] = _cross_device
+    placement.STRATEGY_FUNCTIONS["reflink"] = _cross_device
+
+    destination = str(tmp_path / "destination.mkv")
+    result = place_file(source, destination, "hardlink")
+    assert result.strategy in ("copy_file_range", "copy")
+    assert open(destination, "rb").read() == open(source, "rb").read()
+
+
+def test_place_file_skips_link_across_filesystems(tmp_path, source, monkeypatch):
+    monkeypatch.setattr(placement, "same_filesystem", lambda *args: False)
+
+    destination = str(tmp_path / "destination.mkv")
+    result = place_file(source, destination, "hardlink")
+    assert result.strategy in ("copy_file_range", "copy")
+    assert not os.path.samefile(source, destination)
+
+
+def test_stream_file(tmp_path):
+    data = os.urandom(1024 * 64)
+    destination = str(tmp_path / "destination.mkv")
+
+    result = stream_file(io.BytesIO(data), destination, len(data), zlib.crc32(data))
+    assert result.copied == len(data)
+    assert open(destination, "rb").read() == data
+
+
+def test_stream_file_checksum_mismatch(tmp_path):
+    data = os.urandom(1024)
+    destination = tmp_path / "destination.mkv"
+    destination.write_bytes(b"existing")
+
+    with pytest.raises(ChecksumMismatch):
+        stream_file(io.BytesIO(data), str(destination), len(data), zlib.crc32(data) ^ 1)
+
+    assert destination.read_bytes() == b"existing"
+    assert not os.path.exists(str(destination) + ".partial")
+
+    with pytest.raises(ChecksumMismatch):
+        stream_file(io.BytesIO(data), str(destination), len(data) + 1)
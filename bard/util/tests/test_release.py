@@ -0,0 +1,61 @@
+from bard.util.release import parse_release, series_name_variants
+
+
+def test_parse_release():
+    release = parse_release("The.Expanse.2015.S03E05.1080p.WEB-DL.DD5.1.H.264-NTb")
+
+    assert release.name == "the expanse"
+    assert release.season == "3"
+    assert release.episodes == ("5",)
+    assert release.resolution == "1080p"
+    assert release.source == "WEB-DL"
+    assert release.codec == "h264"
+    assert release.group == "ntb"
+    assert not release.proper
+    assert not release.repack
+
+
+def test_parse_release_season_pack():
+    release = parse_release("Bob's Burgers S09 720p HDTV x264-GRP")
+
+    assert release.name == "bobs burgers"
+    assert release.season == "9"
+    assert release.episodes is None
+
+
+def test_parse_release_multi_episode():
+    release = parse_release("Show.S01E01-E03.PROPER.2160p.WEBRip.x265-GRP")
+
+    assert release.episodes == ("1", "2", "3")
+    assert release.resolution == "2160p"
+    assert release.proper
+
+
+def test_parse_release_resolution_in_group():
+    release = parse_release("Show.S01E01.HDTV.x264-GRP720p")
+
+    assert release.resolution is None
+    assert release.group == "grp720p"
+
+
+def test_parse_release_without_group():
+    release = parse_release("Show.S02E03.REPACK.1080p.WEB-DL")
+
+    assert release.group is None
+    assert release.source == "WEB-DL"
+    assert release.repack
+
+
+def test_parse_release_prefix_group():
+    release = parse_release("[HorribleSubs] One Punch Man - 05 [1080p].mkv")
+
+    assert release.group == "horriblesubs"
+    assert release.resolution == "1080p"
+    assert release.name is None
+
+
+def test_series_name_variants():
+    assert series_name_variants("The Expanse (2015)") == {
+        "the expanse",
+        "the expanse 2015",
+    }
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+from bard.models.torrent import TorrentMetadata
+from bard.util.release import parse_release
+from bard.util.scoring import TorrentScorer
+
+
+class FakeEpisode(object):
+    def __init__(self, airdate):
+        self.airdate = airdate
+
+
+def _torrent(provider_id, title, seeders):
+    return TorrentMetadata("test", provider_id, title, "1 GB", seeders, 0)
+
+
+TORRENTS = [
+    _torrent("1", "Show.S01E01.720p.HDTV.x264-GRP", 100),
+    _torrent("2", "Show.S01E01.1080p.WEB.h264-GRP", 10),
+    _torrent("3", "Show.S01E01.1080p.WEB.h264-OTHER", 50),
+    _torrent("4", "Show.S01E01.2160p.WEB.h265-GRP", 500),
+    _torrent("5", "Show.S01E01.HDTV.x264-GRP", 1000),
+]
+
+
+def test_select_desired_quality():
+    scorer = TorrentScorer({"desired": "1080p"})
+    episode = FakeEpisode(datetime.utcnow() - timedelta(days=1))
+    assert scorer.select(episode, TORRENTS).provider_id == "3"
+
+
+def test_select_preferred_keywords():
+    scorer = TorrentScorer({"desired": "1080p", "preferred_keywords": ["grp"]})
+    episode = FakeEpisode(datetime.utcnow() - timedelta(days=1))
+    assert scorer.select(episode, TORRENTS).provider_id == "2"
+
+
+def test_select_without_desired_quality():
+    scorer = TorrentScorer({})
+    episode = FakeEpisode(datetime.utcnow() - timedelta(days=1))
+    assert scorer.select(episode, TORRENTS).provider_id == "5"
+
+
+def test_select_falls_back_to_highest_quality():
+    scorer = TorrentScorer({"desired": "1080p"})
+    episode = FakeEpisode(datetime.utcnow() - timedelta(days=1))
+    torrents = [TORRENTS[0], TORRENTS[3], TORRENTS[4]]
+    assert scorer.select(episode, torrents).provider_id == "4"
+
+
+def test_select_ranks_by_resolution_tag():
+    scorer = TorrentScorer({"desired": "1080p"})
+    episode = FakeEpisode(datetime.utcnow() - timedelta(days=1))
+
+    # Titles containing the desired resolution's digits outside of a resolution
+    #  tag are ranked by their actual resolution.
+    torrents = [
+        _torrent("1", "Show.1080.S01E01.576p.HDTV.x264-GRP", 1000),
+        _torrent("2", "Show.S01E01.720p.HDTV.x264-GRP", 10),
+        _torrent("3", "Show.S01E01.720p.PROPER.HDTV.x264-GRP", 5),
+    ]
+    assert scorer.select(episode, torrents).provider_id == "3"
+
+
+def test_select_within_quality_window():
+    scorer = TorrentScorer({"desired": "1080p", "max_wait_minutes": 120})
+    episode = FakeEpisode(datetime.utcnow() - timedelta(minutes=30))
+
+    assert scorer.select(episode, TORRENTS).provider_id == "3"
+    assert scorer.select(episode, [TORRENTS[0], TORRENTS[3]]) is None
+
+
+def test_select_exclude():
+    scorer = TorrentScorer({"desired": "1080p"})
+    episode = FakeEpisode(datetime.utcnow() - timedelta(days=1))
+
+    selected = scorer.select(episode, TORRENTS, exclude={("test", "3")})
+    assert selected.provider_id == "2"
+    assert scorer.select(episode, TORRENTS[:1], exclude={("test", "1")}) is None
+
+
+def test_score_title_matches_parse_release():
+    scorer = TorrentScorer({"desired": "1080p"})
+    for title in [
+        "Show.S01E01.1080p.WEB.h264-GRP",
+        "Show.S01E01.1080i.HDTV.x264-GRP",
+        "Show.S01E01.4K.WEB.h265-GRP",
+        "Show.S01E01.PROPER.720p.HDTV.x264-GRP",
+        "Show.S01E01.REPACK.HDTV.x264-GRP",
+        "Show.S01E01.RERIP.576p.HDTV.x264-GRP",
+        "Show.2160.S01E01.HDTV.x264-PROPERGRP",
+        "[720p] Show - 01 [1080p].mkv",
+        "Show.S01E01.HDTV.x264-GRP",
+    ]:
+        release = parse_release(title)
+        assert scorer.score_title(title) == (
+            scorer._quality_ranks.get(release.resolution, 0),
+            0,
+            int(release.proper or release.repack),
+        )
@@ -0,0 +1,66 @@
+from bard.util.timerqueue import TimerQueue
+
+
+def test_pop_due_in_deadline_order():
+    queue = TimerQueue()
+    queue.schedule("c", 30)
+    queue.schedule("a", 10)
+    queue.schedule("b", 20)
+
+    assert queue.next_deadline() == 10
+    assert queue.pop_due(5) == []
+    assert queue.pop_due(20) == ["a", "b"]
+    assert queue.keys() == ["c"]
+    assert queue.pop_due(100) == ["c"]
+    assert len(queue) == 0
+    assert queue.next_deadline() is None
+
+
+def test_equal_deadlines_pop_in_schedule_order():
+    queue = TimerQueue()
+    for key in "bca":
+        queue.schedule(key, 10)
+
+    assert queue.pop_due(10) == ["b", "c", "a"]
+
+
+def test_schedule_replaces_deadline():
+    queue = TimerQueue()
+    queue.schedule("a", 10)
+    queue.schedule("b", 20)
+    queue.schedule("a", 30)
+
+    assert len(queue) == 2
+    assert queue.deadline("a") == 30
+    assert queue.next_deadline() == 20
+    assert queue.pop_due(25) == ["b"]
+    assert queue.pop_due(30) == ["a"]
+
+    # Moving a deadline earlier takes effect too
+    queue.schedule("c", 50)
+    queue.schedule("c", 5)
+    assert queue.pop_due(5) == ["c"]
+
+
+def test_cancel():
+    queue = TimerQueue()
+    queue.schedule("a", 10)
+    queue.schedule("b", 20)
+    queue.cancel("a")
+    queue.cancel("missing")
+
+    assert "a" not in queue
+    assert queue.deadline("a") is None
+    assert queue.next_deadline() == 20
+    assert queue.pop_due(100) == ["b"]
+
+
+def test_pop_due_limit():
+    queue = TimerQueue()
+    for deadline, key in enumerate("abcde"):
+        queue.schedule(key, deadline)
+    queue.cancel("b")
+
+    assert queue.pop_due(10, limit=2) == ["a", "c"]
+    assert queue.pop_due(10, limit=2) == ["d", "e"]
+    assert queue.pop_due(10, limit=2) == []
@@ -0,0 +1,60 @@
+import hashlib
+
+from bard.util import bencoder
+from bard.util.torrentinfo import parse_torrent
+
+INFO = {
+    b"name": b"Show.S01.720p",
+    b"piece length": 262144,
+    b"pieces": b"\x00" * 20,
+    b"files": [
+        {b"length": 100, b"path": [b"Show.S01E01.720p.mkv"]},
+        {b"length": 50, b"path": [b"Subs", b"Show.S01E01.srt"]},
+    ],
+}
+
+
+def test_parse_torrent():
+    raw = bencoder.encode({b"announce": b"http://tracker", b"info": INFO})
+
+    info = parse_torrent(raw)
+    assert info.infohash == hashlib.sha1(bencoder.encode(INFO)).hexdigest()
+    assert info.name == "Show.S01.720p"
+    assert info.size == 150
+    assert info.files == [
+        "Show.S01.720p/Show.S01E01.720p.mkv",
+        "Show.S01.720p/Subs/Show.S01E01.srt",
+    ]
+
+
+def test_parse_torrent_single_file():
+    single = {b"name": b"Show.S01E01.mkv", b"length": 100, b"pieces": b""}
+    info = parse_torrent(bencoder.encode({b"info": single}))
+
+    assert info.size == 100
+    assert info.files == ["Show.S01E01.mkv"]
+
+
+def test_parse_magnet():
+    infohash = "c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+
+    info = parse_torrent(
+        "magnet:?xt=urn:btih:{}&dn=Show+S01E01&xl=1024".format(
+            infohash.upper()
+        ).encode()
+    )
+    assert info.infohash == infohash
+    assert info.name == "Show S01E01"
+    assert info.size == 1024
+    assert info.files is None
+
+    # Base32 encoded infohashes
+    info = parse_torrent(b"magnet:?xt=urn:btih:YEX6DQDLXISUVHOJ6UM3GNNKPQJWPKEK")
+    assert info.infohash == infohash
+
+
+def test_parse_torrent_invalid():
+    assert parse_torrent(b"") is None
+    assert parse_torrent(b"<html>") is None
+    assert parse_torrent(b"d4:infoi1ee") is None
+    assert parse_torrent(b"magnet:?dn=nothing") is None
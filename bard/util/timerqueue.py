@@ -0,0 +1,64 @@
+import heapq
+import itertools
+
+_REMOVED = object()
+
+
+class TimerQueue(object):
+    """
+    A min-heap of keyed deadlines. Each key may only have a single pending
+    deadline, scheduling an existing key replaces its previous deadline. Replaced
+    and cancelled entries are lazily discarded when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, when):
+        self.cancel(key)
+        entry = [when, next(self._counter), key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def cancel(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[-1] = _REMOVED
+
+    def deadline(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def keys(self):
+        return list(self._entries.keys())
+
+    def next_deadline(self):
+        while self._heap and self._heap[0][-1] is _REMOVED:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now, limit=None):
+        """
+        Removes and returns the keys with a deadline at or before `now` (at most
+        `limit` of them), ordered by their deadline.
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            if limit is not None and len(due) >= limit:
+                break
+
+            _, _, key = heapq.heappop(self._heap)
+            if key is _REMOVED:
+                continue
+
+            del self._entries[key]
+            due.append(key)
+        return due
@@ -0,0 +1,100 @@
+import base64
+import hashlib
+import binascii
+from collections import namedtuple
+
+try:
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from urllib.parse import urlparse, parse_qs
+
+from bard.util import bencoder
+
+TorrentInfo = namedtuple("TorrentInfo", ("infohash", "name", "size", "files"))
+
+MAGNET_HASH_PREFIX = "urn:btih:"
+
+
+def _decode_text(value):
+    return value.decode("utf-8", "replace")
+
+
+def _parse_files(info):
+    name = _decode_text(info.get(b"name.utf-8", info.get(b"name", b"")))
+
+    # Single file torrents
+    if b"files" not in info:
+        return name, info.get(b"length", 0), [name]
+
+    # Files within multi file torrents are relative to a directory with the
+    #  torrents name, which matches the names the fetch provider reports.
+    size = 0
+    files = []
+    for entry in info[b"files"]:
+        path = entry.get(b"path.utf-8", entry.get(b"path", []))
+        files.append("/".join([name] + [_decode_text(i) for i in path]))
+        size += entry.get(b"length", 0)
+    return name, size, files
+
+
+def parse_magnet(uri):
+    """
+    Parses a magnet URI into a TorrentInfo, returning None if it doesn't contain
+    a BitTorrent infohash. Magnets carry no file list, so `files` is always None.
+    """
+    if isinstance(uri, bytes):
+        uri = uri.decode("utf-8", "replace")
+
+    params = parse_qs(urlparse(uri).query)
+
+    infohash = None
+    for xt in params.get("xt", []):
+        if not xt.lower().startswith(MAGNET_HASH_PREFIX):
+            continue
+
+        value = xt[len(MAGNET_HASH_PREFIX) :]
+        if len(value) == 32:
+            try:
+                value = binascii.hexlify(base64.b32decode(value.upper()))
+            except ValueError:
+                return None
+            value = value.decode("ascii")
+        infohash = value.lower()
+        break
+
+    if not infohash or len(infohash) != 40:
+        return None
+
+    size = params.get("xl", [None])[0]
+    return TorrentInfo(
+        infohash=infohash,
+        name=params.get("dn", [None])[0],
+        size=int(size) if size and size.isdigit() else None,
+        files=None,
+    )
+
+
+def parse_torrent(raw):
+    """
+    Parses a torrent payload (either a .torrent file or a magnet URI) into a
+    TorrentInfo with its infohash, name, total size in bytes and file names.
+    Returns None if the payload can't be parsed.
+    """
+    if not raw:
+        return None
+
+    if raw.startswith(b"magnet:"):
+        return parse_magnet(raw)
+
+    try:
+        metainfo, info_bytes = bencoder.decode_torrent(raw)
+        name, size, files = _parse_files(metainfo[b"info"])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+    return TorrentInfo(
+        infohash=hashlib.sha1(info_bytes).hexdigest(),
+        name=name,
+        size=size,
+        files=files,
+    )
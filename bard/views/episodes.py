@@ -5,7 +5,6 @@ except ImportError:
 
 from flask import Blueprint, request, redirect, render_template, flash
 
-from bard.models import database
 from bard.providers import providers
 from bard.util.deco import model_getter, acl
 from bard.util.redirect import magic_redirect
@@ -13,6 +12,7 @@ from bard.models.episode import Episode
 from bard.models.torrent import Torrent
 from bard.tasks.episode import (
     find_torrent_for_episode,
+    request_episode_wakeups,
     select_optimal_torrent_for_episode,
 )
 
@@ -54,6 +54,8 @@ def episodes_request(episode):
             category="success",
         )
 
+    # The scheduler (which may run in another process) queues the next search
+    request_episode_wakeups([episode.id])
     return magic_redirect()
 
 
@@ -66,6 +68,7 @@ def episodes_skip(episode):
 
     episode.state = Episode.State.NONE
     episode.save()
+    request_episode_wakeups([episode.id])
     return magic_redirect()
 
 
@@ -79,7 +82,7 @@ def episodes_refetch(episode):
     episode.state = Episode.State.WANTED
     episode.save()
 
-    torrent = find_torrent_for_episode(episode)
+    torrent = find_torrent_for_episode(episode, refresh=True)
     if torrent:
         episode.fetch(torrent)
         flash(
@@ -94,6 +97,36 @@ def episodes_refetch(episode):
             category="error",
         )
 
+    request_episode_wakeups([episode.id])
+    return magic_redirect()
+
+
+@episodes.route("/episodes/<id>/retry")
+@episode_getter
+@acl("user")
+def episodes_retry(episode):
+    if episode.state != int(Episode.State.WANTED):
+        return redirect(request.referrer, NOT_MODIFIED)
+
+    # Clear any search backoff so both this and future searches happen right away
+    episode.reset_search_backoff()
+
+    torrent = find_torrent_for_episode(episode, refresh=True)
+    if torrent:
+        episode.fetch(torrent)
+        flash(
+            "Started download for {}".format(episode.to_string()),
+            category="success",
+        )
+    else:
+        flash(
+            "Failed to find torrent for {} (will retry later)".format(
+                episode.to_string()
+            ),
+            category="error",
+        )
+
+    request_episode_wakeups([episode.id])
     return magic_redirect()
 
 
@@ -108,7 +141,9 @@ def episodes_index(episode):
 @episode_getter
 @acl("user")
 def episodes_torrent_list(episode):
-    torrents = providers.download.search(episode)
+    torrents = providers.download.search(
+        episode, refresh=bool(request.values.get("refresh"))
+    )
 
     optimal_torrent = None
     if len(torrents):
@@ -128,16 +163,18 @@ def episodes_torrent_list(episode):
 def episode_fetch(episode):
     torrent_provider_id = request.values.get("provider_id")
 
+    # This reuses the cached results of the search which listed this torrent
     torrents = providers.download.search(episode)
     torrent = next((i for i in torrents if i.provider_id == torrent_provider_id), None)
-    if torrent:
-        episode.fetch(torrent)
+    if not torrent:
+        flash("Invalid or expired torrent", category="error")
+    elif episode.fetch(torrent):
         flash(
             "Ok, started a download of that torrent for this episode",
             category="success",
         )
     else:
-        flash("Invalid or expired torrent", category="error")
+        flash("That torrent was already fetched for this episode", category="error")
 
     return magic_redirect("/episodes/{}".format(episode.id))
 
@@ -154,18 +191,17 @@ def episode_fetch_direct(episode):
         flash("Invalid torrent file", category="error")
         return magic_redirect("/episodes/{}/torrents".format(episode.id))
 
-    with database.atomic():
-        torrent = Torrent.create(
-            episode=episode,
-            state=Torrent.State.DOWNLOADING,
-            title="User Uploaded Torrent",
-            size=0,
-            seeders=0,
-            leechers=0,
-            raw=request.files["torrent"].read(),
-        )
-
-        episode.fetch_torrent(torrent)
+    raw = request.files["torrent"].read()
+    torrent = Torrent.create_with_payload(
+        raw,
+        episode=episode,
+        state=Torrent.State.DOWNLOADING,
+        title="User Uploaded Torrent",
+        size=0,
+        seeders=0,
+        leechers=0,
+    )
+    episode.fetch_torrent(torrent)
 
     flash("Ok, started a download of that torrent for this episode", category="success")
     return magic_redirect("/episodes/{}".format(episode.id))
\ No newline at end of file
@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# `bard.app` loads its configuration from the working directory when it's first
+#  imported, so it's imported from a directory holding the example configuration.
+_config_dir = tempfile.mkdtemp()
+shutil.copy(
+    os.path.join(os.path.dirname(__file__), "..", "..", "..", "example.bard.yaml"),
+    os.path.join(_config_dir, "bard.yaml"),
+)
+
+_cwd = os.getcwd()
+os.chdir(_config_dir)
+try:
+    import bard.app  # noqa: F401
+finally:
+    os.chdir(_cwd)
+    shutil.rmtree(_config_dir)
+
+from bard.models import database, init_db  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # Database URLs are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    init_db({"database": "sqlite://bard.db"})
+    database.connect(reuse_if_open=True)
+    yield database
+    database.close()
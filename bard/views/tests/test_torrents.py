@@ -0,0 +1,105 @@
+import gevent
+import pytest
+from flask import Flask
+
+from bard.app import config
+from bard.models.episode import Episode
+from bard.models.season import Season
+from bard.models.series import Series
+from bard.models.torrent import Torrent
+from bard.providers import providers
+from bard.providers.fetch import TorrentFetchInfo
+from bard.views import torrents as torrents_views
+
+TOKEN = "done-script-token"
+
+
+class FakeFetchProvider(object):
+    def get_torrent_info(self, torrents):
+        for torrent in torrents:
+            yield TorrentFetchInfo(
+                torrent.fetch_provider_id, Torrent.State.SEEDING, 0, 0, 1
+            )
+
+
+@pytest.fixture
+def spawned(monkeypatch):
+    """
+    Records the greenlets spawned by the views, so tests can wait on them.
+    """
+    spawned = []
+
+    class Gevent(object):
+        @staticmethod
+        def spawn(func, *args):
+            spawned.append(gevent.spawn(func, *args))
+            return spawned[-1]
+
+    monkeypatch.setattr(torrents_views, "gevent", Gevent)
+    return spawned
+
+
+@pytest.fixture
+def client(db, spawned, monkeypatch):
+    monkeypatch.setitem(config["web"], "done_script_token", TOKEN)
+    monkeypatch.setattr(providers, "fetch", FakeFetchProvider(), raising=False)
+
+    app = Flask(__name__)
+    app.register_blueprint(torrents_views.torrents)
+    return app.test_client()
+
+
+def _completed(client, token=None, infohash="0" * 40):
+    headers = {} if token is None else {"X-Bard-Token": token}
+    return client.post("/torrents/completed", data={"hash": infohash}, headers=headers)
+
+
+def test_completed_is_disabled_without_a_token(client, spawned, monkeypatch):
+    monkeypatch.setitem(config["web"], "done_script_token", None)
+    assert _completed(client, TOKEN).status_code == 404
+    assert spawned == []
+
+
+def test_completed_requires_the_token(client, spawned):
+    assert _completed(client).status_code == 403
+    assert _completed(client, "wrong-token").status_code == 403
+    assert _completed(client, TOKEN[:-1]).status_code == 403
+    assert spawned == []
+
+
+def test_completed_requires_a_hash(client, spawned):
+    assert _completed(client, TOKEN, infohash="").status_code == 400
+    assert spawned == []
+
+
+def test_completed_unknown_hash(client, spawned):
+    assert _completed(client, TOKEN).status_code == 202
+
+    with gevent.Timeout(5):
+        assert [greenlet.get() for greenlet in spawned] == [0]
+
+
+def test_completed_queues_processing(client, spawned):
+    series = Series.create(name="Show", provider_ids={})
+    season = Season.create(series=series, number="1", episode_count=1)
+    episode = Episode.create(season=season, state=Episode.State.FETCHED, number="1")
+    torrent = Torrent.create(
+        episode=episode,
+        fetch_provider_id="a" * 40,
+        state=Torrent.State.DOWNLOADING,
+        title="Show.S01E01.720p",
+        size="1",
+        seeders=1,
+        leechers=1,
+        files=["Show.S01E01.720p.mkv"],
+    )
+
+    # Hashes are matched regardless of case
+    assert _completed(client, TOKEN, infohash="A" * 40).status_code == 202
+    with gevent.Timeout(5):
+        assert [greenlet.get() for greenlet in spawned] == [1]
+
+    torrent = Torrent.get_by_id(torrent.id)
+    assert torrent.state == Torrent.State.SEEDING
+    assert torrent.processed
+    assert torrent.process_jobs.count() == 1
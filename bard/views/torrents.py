@@ -1,4 +1,8 @@
+import hmac
+
+import gevent
 from flask import Blueprint, request, redirect, flash
+from bard.app import config
 from bard.providers import providers
 from bard.models.torrent import Torrent
 from bard.util.deco import model_getter, acl
@@ -21,9 +25,37 @@ def torrents_index(torrent):
 @torrent_getter
 @acl("admin")
 def torrents_process(torrent):
-    from bard.tasks.torrent import process_torrent
+    from bard.tasks.processing import enqueue_process_job
 
-    info = next(providers.fetch.get_torrent_info([torrent]), None)
-    process_torrent(torrent, files=info.files)
-    flash("Processed torrent", category="success")
+    files = torrent.files
+    if files is None:
+        files = providers.fetch.get_torrent_files([torrent]).get(
+            torrent.fetch_provider_id, []
+        )
+    enqueue_process_job(torrent, files)
+    flash("Queued torrent for processing", category="success")
     return redirect(request.referrer)
+
+
+@torrents.route("/torrents/completed", methods=["POST"])
+def torrents_completed():
+    """
+    Called by the fetch provider when a torrent finishes downloading (see
+    scripts/transmission-done.sh), which queues the torrent for processing right
+    away instead of waiting for the next `update_torrents` poll.
+    """
+    from bard.tasks.torrent import complete_torrent
+
+    token = config.get("web.done_script_token")
+    if not token:
+        return "Done script endpoint is disabled", 404
+
+    if not hmac.compare_digest(request.headers.get("X-Bard-Token", ""), token):
+        return "Invalid token", 403
+
+    fetch_provider_id = request.form.get("hash", "").strip().lower()
+    if not fetch_provider_id:
+        return "Missing torrent hash", 400
+
+    gevent.spawn(complete_torrent, fetch_provider_id)
+    return "", 202
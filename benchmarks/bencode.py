@@ -0,0 +1,119 @@
+"""
+Microbenchmark for the bencoder, comparing the index based decoder and bytearray
+encoder against the previous re-slicing implementation on a synthetic season
+pack torrent.
+
+    python benchmarks/bencode.py [files] [pieces]
+"""
+
+import os
+import re
+import sys
+import string
+import timeit
+import random
+import itertools as it
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bard.util import bencoder  # noqa: E402
+
+
+def generate_torrent(files, pieces):
+    rng = random.Random(1)
+    return {
+        b"announce": b"http://tracker.example.com/announce",
+        b"creation date": 1600000000,
+        b"info": {
+            b"name": b"Some.Show.S01.1080p.WEB-DL.DD5.1.H.264-GRP",
+            b"piece length": 4194304,
+            b"pieces": bytes(rng.getrandbits(8) for _ in range(pieces * 20)),
+            b"files": [
+                {
+                    b"length": rng.randint(1, 1 << 32),
+                    b"path": [
+                        b"Extras",
+                        "Some.Show.S01E{:04}.1080p.WEB-DL.mkv".format(i).encode(),
+                    ],
+                }
+                for i in range(files)
+            ],
+        },
+    }
+
+
+def legacy_encode(obj):
+    if isinstance(obj, int):
+        return b"i" + str(obj).encode() + b"e"
+    elif isinstance(obj, bytes):
+        return str(len(obj)).encode() + b":" + obj
+    elif isinstance(obj, list):
+        return b"l" + b"".join(map(legacy_encode, obj)) + b"e"
+    elif isinstance(obj, dict):
+        items = list(obj.items())
+        items.sort()
+        return b"d" + b"".join(map(legacy_encode, it.chain(*items))) + b"e"
+
+
+def legacy_decode(s):
+    def decode_first(s):
+        if s.startswith(b"i"):
+            match = re.match(b"i(-?\\d+)e", s)
+            return int(match.group(1)), s[match.span()[1] :]
+        elif s.startswith(b"l") or s.startswith(b"d"):
+            l = []  # noqa: E741
+            rest = s[1:]
+            while not rest.startswith(b"e"):
+                elem, rest = decode_first(rest)
+                l.append(elem)
+            rest = rest[1:]
+            if s.startswith(b"l"):
+                return l, rest
+            else:
+                return {i: j for i, j in zip(l[::2], l[1::2])}, rest
+        elif any(s.startswith(i.encode()) for i in string.digits):
+            m = re.match(b"(\\d+):", s)
+            length = int(m.group(1))
+            start = m.span()[1]
+            end = start + length
+            return s[start:end], s[end:]
+        else:
+            raise ValueError("Malformed input.")
+
+    ret, rest = decode_first(s)
+    if rest:
+        raise ValueError("Malformed input.")
+    return ret
+
+
+def main(files, pieces):
+    torrent = generate_torrent(files, pieces)
+    raw = bencoder.encode(torrent)
+
+    assert raw == legacy_encode(torrent)
+    assert bencoder.decode(raw) == legacy_decode(raw) == torrent
+
+    number = 5
+    results = [
+        ("legacy decode", lambda: legacy_decode(raw)),
+        ("decode", lambda: bencoder.decode(raw)),
+        ("decode_torrent", lambda: bencoder.decode_torrent(raw)),
+        ("legacy encode", lambda: legacy_encode(torrent)),
+        ("encode", lambda: bencoder.encode(torrent)),
+    ]
+
+    print(
+        "{:.2f}MB torrent ({} files, {} pieces), {} iterations".format(
+            len(raw) / (1024 * 1024), files, pieces, number
+        )
+    )
+    for name, func in results:
+        seconds = timeit.timeit(func, number=number)
+        print("  {:<16} {:.2f}ms".format(name + ":", seconds / number * 1000))
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100000,
+    )
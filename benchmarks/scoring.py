@@ -0,0 +1,119 @@
+"""
+Microbenchmark for torrent selection, comparing the compiled TorrentScorer
+against the previous sort-and-rescan selection over synthetic search results.
+The cold scorer is created for every selection, with the shared release parsing
+cache cleared, so none of the titles were seen before.
+
+    python benchmarks/scoring.py [count]
+"""
+
+import os
+import sys
+import random
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bard.constants import QUALITIES  # noqa: E402
+from bard.models.torrent import TorrentMetadata  # noqa: E402
+from bard.util.release import parse_release  # noqa: E402
+from bard.util.scoring import TorrentScorer  # noqa: E402
+
+QUALITY_CONFIG = {
+    "desired": "1080p",
+    "max_wait_minutes": 120,
+    "preferred_keywords": ["NTb", "AMZN", "REPACK"],
+}
+
+GROUPS = ["NTb", "KiNGS", "MiNX", "TBS", "SVA", "AMZN", "GRP"]
+SOURCES = ["HDTV", "WEB", "WEB-DL", "WEBRip", "BluRay"]
+CODECS = ["x264", "x265", "h264", "HEVC"]
+
+
+class FakeEpisode(object):
+    airdate = datetime.utcnow() - timedelta(days=2)
+
+
+def generate_torrents(count):
+    rng = random.Random(1)
+    return [
+        TorrentMetadata(
+            "bench",
+            str(i),
+            "Some.Show.S{:02}E{:02}.{}.{}.{}-{}".format(
+                rng.randint(1, 9),
+                rng.randint(1, 24),
+                rng.choice(QUALITIES + ("",)),
+                rng.choice(SOURCES),
+                rng.choice(CODECS),
+                rng.choice(GROUPS),
+            ),
+            "1 GB",
+            rng.randint(0, 5000),
+            rng.randint(0, 500),
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_select(episode, torrents, quality_config):
+    torrents = sorted(torrents, key=lambda i: i.seeders, reverse=True)
+
+    preferred_keywords = quality_config.get("preferred_keywords")
+    if preferred_keywords is not None:
+        torrents = sorted(
+            torrents,
+            key=lambda i: (
+                0
+                if any((k.lower() in i.title.lower()) for k in preferred_keywords)
+                else 1
+            ),
+        )
+
+    desired_quality = quality_config["desired"]
+    cutoff = episode.airdate + timedelta(minutes=quality_config["max_wait_minutes"])
+    if datetime.utcnow() < cutoff:
+        torrents = [i for i in torrents if desired_quality in i.title.lower()]
+        return torrents[0] if torrents else None
+
+    qualities_to_check = list(reversed(QUALITIES))
+    qualities_to_check.remove(desired_quality)
+    qualities_to_check = [desired_quality] + qualities_to_check
+
+    for quality in qualities_to_check:
+        for result in torrents:
+            if quality in result.title.lower():
+                return result
+    return torrents[0]
+
+
+def main(count):
+    torrents = generate_torrents(count)
+    episode = FakeEpisode()
+    scorer = TorrentScorer(QUALITY_CONFIG)
+
+    assert scorer.select(episode, torrents) == legacy_select(
+        episode, torrents, QUALITY_CONFIG
+    )
+
+    number = 20
+    legacy = timeit.timeit(
+        lambda: legacy_select(episode, torrents, QUALITY_CONFIG), number=number
+    )
+
+    def cold_select():
+        parse_release.cache_clear()
+        return TorrentScorer(QUALITY_CONFIG).select(episode, torrents)
+
+    cold = timeit.timeit(cold_select, number=number)
+    warm = timeit.timeit(lambda: scorer.select(episode, torrents), number=number)
+
+    print("{} titles, {} iterations".format(count, number))
+    print("  legacy:          {:.2f}ms per selection".format(legacy / number * 1000))
+    print("  scorer (cold):   {:.2f}ms per selection".format(cold / number * 1000))
+    print("  scorer (warm):   {:.2f}ms per selection".format(warm / number * 1000))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,163 @@
+"""
+Microbenchmark for decoding Transmission torrent-get responses, comparing the
+previous object_hook decoder (which converted every timestamp in the response to
+a datetime) against plain decoding with timestamps converted on access, on a
+synthetic response.
+
+    python benchmarks/transmission.py [torrents]
+"""
+
+import os
+import sys
+import json
+import timeit
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bard.providers.fetch import TorrentFetchInfo  # noqa: E402
+from bard.providers.fetch.transmission import (  # noqa: E402
+    TransmissionFetchProvider,
+    epoch_to_datetime,
+)
+
+LEGACY_TIMESTAMP_KEYS = frozenset(
+    [
+        "activityDate",
+        "addedDate",
+        "dateCreated",
+        "doneDate",
+        "startDate",
+        "lastAnnounceStartTime",
+        "lastAnnounceTime",
+        "lastScrapeStartTime",
+        "lastScrapeTime",
+        "nextAnnounceTime",
+        "nextScrapeTime",
+    ]
+)
+
+
+def legacy_convert_timestamps(obj):
+    for key, value in obj.items():
+        if key in LEGACY_TIMESTAMP_KEYS:
+            obj[key] = epoch_to_datetime(value)
+    return obj
+
+
+class LegacyJSONDecoder(json.JSONDecoder):
+    def __init__(self, **kwargs):
+        super(LegacyJSONDecoder, self).__init__(
+            object_hook=legacy_convert_timestamps, **kwargs
+        )
+
+
+def generate_torrent(rng, idx, files, peers):
+    done = rng.randint(1500000000, 1600000000)
+    return {
+        "hashString": "{:040x}".format(rng.getrandbits(160)),
+        "activityDate": done + rng.randint(0, 86400),
+        "addedDate": done - rng.randint(0, 86400),
+        "downloadDir": "/downloads/complete",
+        "doneDate": done,
+        "error": 0,
+        "errorString": "",
+        "eta": -1,
+        "files": [
+            {
+                "bytesCompleted": 1 << 30,
+                "length": 1 << 30,
+                "name": "Some.Show.S01/Some.Show.S01E{:02}.1080p.mkv".format(i),
+            }
+            for i in range(files)
+        ],
+        "fileStats": [
+            {"bytesCompleted": 1 << 30, "priority": 0, "wanted": True}
+            for _ in range(files)
+        ],
+        "isFinished": False,
+        "isStalled": False,
+        "peers": [
+            {
+                "address": "10.0.{}.{}".format(idx % 256, i),
+                "clientName": "Transmission 3.00",
+                "port": 51413,
+                "rateToClient": 0,
+                "rateToPeer": rng.randint(0, 1 << 20),
+            }
+            for i in range(peers)
+        ],
+        "percentDone": 1,
+        "pieces": "A" * 512,
+        "secondsDownloading": rng.randint(0, 3600),
+        "secondsSeeding": rng.randint(0, 86400 * 30),
+    }
+
+
+def generate_responses(count, files=10, peers=5):
+    rng = random.Random(1)
+    torrents = [generate_torrent(rng, i, files, peers) for i in range(count)]
+
+    # The response to the previous, wide, status request
+    legacy = {"result": "success", "tag": 1, "arguments": {"torrents": torrents}}
+
+    # The table formatted response to the current status request
+    fields = TransmissionFetchProvider.STATUS_FIELDS
+    table = [fields] + [[i[field] for field in fields] for i in torrents]
+    current = {"result": "success", "tag": 1, "arguments": {"torrents": table}}
+    return json.dumps(legacy).encode(), json.dumps(current).encode()
+
+
+def to_info(item):
+    return TorrentFetchInfo(
+        id=item["hashString"],
+        state=None,
+        seconds_seeding=item["secondsSeeding"],
+        done_timestamp=item["doneDate"],
+        percent_done=item["percentDone"],
+    )
+
+
+def legacy_decode(raw):
+    doc = json.loads(raw.decode(), cls=LegacyJSONDecoder)
+    return [to_info(i) for i in doc["arguments"]["torrents"]]
+
+
+def decode(raw):
+    doc = json.loads(raw)
+    rows = TransmissionFetchProvider._parse_torrents(doc["arguments"]["torrents"], True)
+    return [to_info(i) for i in rows]
+
+
+def decode_legacy_response(raw):
+    doc = json.loads(raw)
+    return [to_info(i) for i in doc["arguments"]["torrents"]]
+
+
+def main(count):
+    legacy, current = generate_responses(count)
+
+    # The legacy decoder already converted doneDate into a datetime
+    assert [i.done_timestamp.timestamp() for i in legacy_decode(legacy)] == [
+        i.done_date.timestamp() for i in decode(current)
+    ]
+
+    number = 10
+    results = [
+        ("legacy", lambda: legacy_decode(legacy)),
+        ("plain, wide fields", lambda: decode_legacy_response(legacy)),
+        ("plain, table", lambda: decode(current)),
+    ]
+
+    print(
+        "{} torrents, {:.2f}MB legacy / {:.2f}KB table response, {} iterations".format(
+            count, len(legacy) / (1024 * 1024), len(current) / 1024, number
+        )
+    )
+    for name, func in results:
+        seconds = timeit.timeit(func, number=number)
+        print("  {:<20} {:.2f}ms".format(name + ":", seconds / number * 1000))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -93,6 +93,7 @@ def shell():
 @cli.command()
 def resetdb():
     from bard.models import REGISTERED_MODELS, init_db
+    from bard.models.migrations import set_schema_version
 
     init_db(config)
 
@@ -100,6 +101,27 @@ def resetdb():
         model.drop_table(True, False)
         model.create_table(True)
 
+    set_schema_version()
+
+
+@cli.command()
+def migrate():
+    """
+    Applies any pending database migrations and prints the schema version.
+    """
+    from bard.models import connection_scope
+    from bard.models.migrations import MIGRATIONS, get_schema_version, run_migrations
+
+    with connection_scope():
+        for name in run_migrations():
+            print("Applied migration {}".format(name))
+
+        print(
+            "Database schema is at version {} of {}".format(
+                get_schema_version(), len(MIGRATIONS)
+            )
+        )
+
 
 @cli.command("scheduler")
 def run_scheduler():
@@ -155,6 +177,43 @@ def link_provider(provider_name):
         log.info("Series %r was unable to be linked (%s results)", series, len(results))
 
 
+@cli.command("retry-episodes")
+@click.argument("episode-ids", nargs=-1, type=int)
+@click.option("--all", "retry_all", is_flag=True, default=False)
+def retry_episodes(episode_ids, retry_all):
+    """
+    Clears the search backoff for the given WANTED episodes (or with --all, every
+    WANTED episode in backoff) and searches for them right away.
+    """
+    from bard.models.episode import Episode
+    from bard.tasks.episode import find_torrent_for_episode, request_episode_wakeups
+
+    if not episode_ids and not retry_all:
+        raise click.UsageError("Pass episode ids to retry, or --all")
+
+    episodes = Episode.select().where(Episode.state == Episode.State.WANTED)
+    if retry_all:
+        episodes = episodes.where(Episode.search_failures > 0)
+    else:
+        episodes = list(episodes.where(Episode.id << episode_ids))
+
+        missing = set(episode_ids) - {episode.id for episode in episodes}
+        for episode_id in sorted(missing):
+            log.warning("Episode %s does not exist or is not WANTED", episode_id)
+
+    for episode in episodes:
+        episode.reset_search_backoff()
+
+        torrent = find_torrent_for_episode(episode)
+        if torrent:
+            log.info("Found torrent for episode %s", episode.to_string())
+            episode.fetch(torrent)
+        else:
+            log.info("Failed to find torrent for episode %s", episode.to_string())
+
+        request_episode_wakeups([episode.id])
+
+
 @cli.command("prune-missing-media")
 def prune_missing_media():
     from bard.tasks.media import prune_missing_media
@@ -0,0 +1,16 @@
+#!/bin/sh
+# Notifies bard that a torrent finished downloading so it can be processed right
+# away. Set this as Transmission's `script-torrent-done-filename`, and configure
+# BARD_URL and BARD_TOKEN (`web.done_script_token`) below or in the environment.
+BARD_URL="${BARD_URL:-http://localhost:7675}"
+BARD_TOKEN="${BARD_TOKEN:-}"
+
+if [ -z "$TR_TORRENT_HASH" ]; then
+    echo "TR_TORRENT_HASH is not set, this should be run by Transmission" >&2
+    exit 1
+fi
+
+curl -fsS --max-time 10 \
+    -H "X-Bard-Token: $BARD_TOKEN" \
+    --data-urlencode "hash=$TR_TORRENT_HASH" \
+    "$BARD_URL/torrents/completed" >/dev/null